@@ -0,0 +1,224 @@
+"""
+Measure download throughput against a local RRDP server.
+"""
+import asyncio
+import logging
+import tempfile
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+import click
+
+from .local_server import (
+    DirectoryRepository,
+    Repository,
+    RrdpServer,
+    ServerConfig,
+    SyntheticRepository,
+    serve,
+)
+from .loop_over_deltas import attempt_delta_download
+from .reconstruct import http_get_delta_or_snapshot
+from .snapshot_rrdp import snapshot_rrdp
+
+LOG = logging.getLogger(__name__)
+
+BENCHMARK_COMMANDS = ("snapshot-rrdp", "loop-over-deltas", "reconstruct-repo")
+
+
+@dataclass
+class BenchmarkResult:
+    command: str
+    threads: int
+    files: int
+    bytes: int
+    seconds: float
+    error: Optional[str] = None
+
+    @property
+    def files_per_second(self) -> float:
+        return self.files / self.seconds if self.seconds > 0 else 0.0
+
+    @property
+    def mb_per_second(self) -> float:
+        return self.bytes / 1e6 / self.seconds if self.seconds > 0 else 0.0
+
+
+def _count_documents(path: Path) -> int:
+    return sum(1 for p in path.glob("*.xml") if p.name != "notification.xml")
+
+
+async def run_command(
+    command: str, server: RrdpServer, threads: int, output_path: Path
+) -> int:
+    """Run one download command, returns the number of documents retrieved."""
+    match command:
+        case "snapshot-rrdp":
+            await snapshot_rrdp(server.url, output_path, threads=threads)
+            return _count_documents(output_path)
+        case "loop-over-deltas":
+            notification = server.repository.notification
+            serials = [d.serial for d in notification.deltas]
+            await attempt_delta_download(
+                server.repository.delta_url_template(),
+                output_path,
+                min(serials, default=0),
+                max(serials, default=-1) + 1,
+                workers=threads,
+            )
+            return _count_documents(output_path)
+        case "reconstruct-repo":
+            # Downloads the notification file and snapshot sequentially
+            await http_get_delta_or_snapshot(server.url, output_path)
+            return 1
+        case _:
+            raise ValueError(f"Unknown command {command}")
+
+
+async def run_benchmark(
+    repository: Repository,
+    commands: List[str],
+    thread_counts: List[int],
+    config: Optional[ServerConfig] = None,
+) -> List[BenchmarkResult]:
+    results = []
+    async with serve(repository, config) as server:
+        for command in commands:
+            # reconstruct-repo does not download concurrently
+            counts = thread_counts if command != "reconstruct-repo" else [1]
+            for threads in counts:
+                with tempfile.TemporaryDirectory() as output_dir:
+                    bytes_before = server.bytes_sent
+                    error = None
+                    files = 0
+                    t0 = time.monotonic()
+                    try:
+                        files = await run_command(
+                            command, server, threads, Path(output_dir)
+                        )
+                    except Exception as e:
+                        LOG.error("%s with %d threads failed: %s", command, threads, e)
+                        error = str(e)
+                    results.append(
+                        BenchmarkResult(
+                            command,
+                            threads,
+                            files,
+                            server.bytes_sent - bytes_before,
+                            time.monotonic() - t0,
+                            error,
+                        )
+                    )
+    return results
+
+
+def format_results(results: List[BenchmarkResult]) -> str:
+    rows: List[Tuple[str, ...]] = [
+        ("command", "threads", "files", "MB", "seconds", "files/s", "MB/s", "error")
+    ]
+    for r in results:
+        rows.append(
+            (
+                r.command,
+                str(r.threads),
+                str(r.files),
+                f"{r.bytes / 1e6:.2f}",
+                f"{r.seconds:.2f}",
+                f"{r.files_per_second:.1f}",
+                f"{r.mb_per_second:.2f}",
+                r.error or "",
+            )
+        )
+    widths = [max(len(row[i]) for row in rows) for i in range(len(rows[0]))]
+    return "\n".join(
+        "  ".join(value.ljust(width) for value, width in zip(row, widths)).rstrip()
+        for row in rows
+    )
+
+
+@click.command("benchmark")
+@click.option(
+    "--repository",
+    help="Serve the documents in a snapshot-rrdp output directory",
+    type=click.Path(exists=True, file_okay=False, path_type=Path),
+    default=None,
+)
+@click.option("--deltas", help="Deltas in the synthetic repository", default=100)
+@click.option("--objects-per-delta", help="Objects published per delta", default=10)
+@click.option("--object-size", help="Size of the objects in bytes", default=2048)
+@click.option(
+    "--command",
+    "commands",
+    help="Command to benchmark",
+    type=click.Choice(BENCHMARK_COMMANDS),
+    multiple=True,
+    default=("snapshot-rrdp", "loop-over-deltas"),
+)
+@click.option(
+    "--threads",
+    "thread_counts",
+    help="Number of download threads (repeat for multiple runs)",
+    type=int,
+    multiple=True,
+    default=(1, 4, 16),
+)
+@click.option("--latency", help="Server latency in seconds", type=float, default=0.0)
+@click.option(
+    "--bandwidth",
+    help="Bandwidth per response in bytes/s",
+    type=int,
+    default=None,
+)
+@click.option(
+    "--error-rate", help="Fraction of failing requests", type=float, default=0.0
+)
+@click.option("-v", "--verbose", help="verbose", is_flag=True)
+def benchmark_command(
+    repository: Optional[Path],
+    deltas: int,
+    objects_per_delta: int,
+    object_size: int,
+    commands: Tuple[str, ...],
+    thread_counts: Tuple[int, ...],
+    latency: float,
+    bandwidth: Optional[int],
+    error_rate: float,
+    verbose: bool = False,
+):
+    """
+    Benchmark the download commands against a local RRDP server
+
+    Serves a synthetic repository (or the documents downloaded by snapshot-rrdp)
+    and reports files/s and MB/s per command and number of threads.
+    """
+    logging.basicConfig()
+    if not verbose:
+        # Per-run output of the commands
+        for name in ("rrdp_tools", "rrdp_tools.snapshot_rrdp", "loop_over_deltas.py"):
+            logging.getLogger(name).setLevel(logging.WARNING)
+        logging.getLogger("rrdp_tools.benchmark").setLevel(logging.INFO)
+
+    if repository:
+        repo: Repository = DirectoryRepository(repository)
+    else:
+        repo = SyntheticRepository(
+            objects_per_delta=objects_per_delta, object_size=object_size
+        )
+        for _ in range(deltas):
+            repo.add_delta()
+
+    results = asyncio.run(
+        run_benchmark(
+            repo,
+            list(commands),
+            list(thread_counts),
+            ServerConfig(latency=latency, bandwidth=bandwidth, error_rate=error_rate),
+        )
+    )
+    click.echo(format_results(results))
+
+
+if __name__ == "__main__":
+    benchmark_command()
@@ -1,20 +1,80 @@
+import importlib
+from typing import Dict, Tuple
+
 import click
 
-from rrdp_tools.loop_over_deltas import loop_over_deltas
-from rrdp_tools.reconstruct import reconstruct_repo_command
-from rrdp_tools.rrdp_content_filter import filter_rrdp_content_command
-from rrdp_tools.snapshot_rrdp import snapshot_rrdp_command
+# name -> (module:attribute, short help). Sub-commands are only imported when
+# they are invoked, their dependencies (aiohttp, asn1tools, ...) are slow to
+# import.
+COMMANDS: Dict[str, Tuple[str, str]] = {
+    "benchmark": (
+        "rrdp_tools.benchmark:benchmark_command",
+        "Benchmark the download commands against a local RRDP server",
+    ),
+    "filter-rrdp-content": (
+        "rrdp_tools.rrdp_content_filter:filter_rrdp_content_command",
+        "Scan a set of RRDP documents and print out matching files.",
+    ),
+    "mirror": (
+        "rrdp_tools.mirror:mirror_command",
+        "Mirror the RRDP repositories listed in a file",
+    ),
+    "loop-over-deltas": (
+        "rrdp_tools.loop_over_deltas:loop_over_deltas",
+        "Loop over all the static guesses for the delta URL",
+    ),
+    "reconstruct-repo": (
+        "rrdp_tools.reconstruct:reconstruct_repo_command",
+        "Reconstruct the files in a snapshot or delta",
+    ),
+    "restore-document": (
+        "rrdp_tools.object_store:restore_document_command",
+        "Restore a snapshot or delta from an object store",
+    ),
+    "snapshot-rrdp": (
+        "rrdp_tools.snapshot_rrdp:snapshot_rrdp_command",
+        "Snapshot RRDP content",
+    ),
+}
+
+
+class LazyGroup(click.Group):
+    """A group that imports the module of a sub-command when it is used."""
+
+    def __init__(
+        self, *args, lazy_commands: Dict[str, Tuple[str, str]], **kwargs
+    ) -> None:
+        super().__init__(*args, **kwargs)
+        self.lazy_commands = lazy_commands
+
+    def list_commands(self, ctx: click.Context):
+        return sorted([*super().list_commands(ctx), *self.lazy_commands])
 
+    def get_command(self, ctx: click.Context, cmd_name: str):
+        if cmd_name not in self.lazy_commands:
+            return super().get_command(ctx, cmd_name)
 
-@click.group()
+        module_name, attribute = self.lazy_commands[cmd_name][0].split(":")
+        return getattr(importlib.import_module(module_name), attribute)
+
+    def format_commands(self, ctx: click.Context, formatter) -> None:
+        # Use the static help text: do not import every command for --help
+        rows = [
+            (name, self.lazy_commands[name][1])
+            if name in self.lazy_commands
+            else (name, self.get_command(ctx, name).get_short_help_str())
+            for name in self.list_commands(ctx)
+        ]
+
+        if rows:
+            with formatter.section("Commands"):
+                formatter.write_dl(rows)
+
+
+@click.group(cls=LazyGroup, lazy_commands=COMMANDS)
 def cli():
     pass
 
 
-cli.add_command(loop_over_deltas)
-cli.add_command(reconstruct_repo_command)
-cli.add_command(filter_rrdp_content_command)
-cli.add_command(snapshot_rrdp_command)
-
 if __name__ == "__main__":
     cli()
@@ -0,0 +1,67 @@
+"""
+Open (possibly compressed) RRDP documents for reading.
+"""
+import bz2
+import contextlib
+import gzip
+import lzma
+import os
+from pathlib import Path
+from typing import BinaryIO, Generator, List, Union
+
+COMPRESSED_SUFFIXES = frozenset([".gz", ".zst", ".xz", ".bz2"])
+
+# Glob patterns for RRDP documents, compressed or not
+RRDP_FILE_PATTERNS = ["*.xml", *(f"*.xml{suffix}" for suffix in COMPRESSED_SUFFIXES)]
+
+
+def import_zstandard(purpose: str):
+    """Import the (optional) zstandard package."""
+    try:
+        import zstandard
+    except ImportError as e:
+        raise ImportError(
+            f"{purpose} requires the zstandard package, install the zstd extra "
+            "(`pip install rrdp-tools[zstd]` or `poetry install --extras zstd`)"
+        ) from e
+
+    return zstandard
+
+
+def _open_zstd(path: Path) -> BinaryIO:
+    zstandard = import_zstandard(f"Reading {path}")
+    return zstandard.ZstdDecompressor().stream_reader(path.open("rb"), closefd=True)
+
+
+@contextlib.contextmanager
+def open_rrdp_file(path: Union[str, os.PathLike]) -> Generator[BinaryIO, None, None]:
+    """
+    Open a (compressed) RRDP document as a binary stream.
+
+    Compressed files (.gz, .zst, .xz and .bz2) are decompressed while they are
+    read. Other files are opened as buffered binary files: they are read in
+    chunks, so memory usage does not depend on the size of the document.
+    """
+    path = Path(path)
+
+    match path.suffix:
+        case ".gz":
+            f = gzip.open(path, "rb")
+        case ".bz2":
+            f = bz2.open(path, "rb")
+        case ".xz":
+            f = lzma.open(path, "rb")
+        case ".zst":
+            f = _open_zstd(path)
+        case _:
+            f = path.open("rb")
+
+    with f:
+        yield f
+
+
+def find_rrdp_files(path: Path) -> List[Path]:
+    """Find all (compressed) RRDP documents below a directory."""
+    return sorted(
+        file for pattern in RRDP_FILE_PATTERNS for file in path.glob(f"**/{pattern}")
+    )
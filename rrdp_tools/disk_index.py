@@ -0,0 +1,62 @@
+"""
+Base class for the indexes that are kept (with diskcache) in a directory.
+"""
+from pathlib import Path
+from types import TracebackType
+from typing import Any, Optional, Type, TypeVar
+
+import diskcache
+
+IndexT = TypeVar("IndexT", bound="DiskIndex")
+
+
+class DiskIndex:
+    """
+    A diskcache in `root / INDEX_DIR_NAME`.
+
+    The cache is only created when it is used: there is no index directory for
+    an index that was never written. A `readonly` index is not modified.
+    """
+
+    INDEX_DIR_NAME: str
+
+    def __init__(self, root: Path, readonly: bool = False) -> None:
+        self.root = root
+        self.readonly = readonly
+        self._cache: Optional[diskcache.Cache] = None
+
+    @classmethod
+    def open_existing(cls: Type[IndexT], root: Path) -> Optional[IndexT]:
+        """Open the index read-only, if it exists."""
+        if not (root / cls.INDEX_DIR_NAME).is_dir():
+            return None
+        return cls(root, readonly=True)
+
+    @property
+    def cache(self) -> diskcache.Cache:
+        if self._cache is None:
+            self._cache = diskcache.Cache(str(self.root / self.INDEX_DIR_NAME))
+        return self._cache
+
+    def _key(self, key: Any) -> str:
+        return key
+
+    def discard(self, key: Any) -> None:
+        if not self.readonly:
+            self.cache.delete(self._key(key))
+
+    def close(self) -> None:
+        if self._cache is not None:
+            self._cache.close()
+            self._cache = None
+
+    def __enter__(self: IndexT) -> IndexT:
+        return self
+
+    def __exit__(
+        self,
+        exc_type: Optional[Type[BaseException]],
+        exc: Optional[BaseException],
+        tb: Optional[TracebackType],
+    ) -> None:
+        self.close()
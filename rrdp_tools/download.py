@@ -0,0 +1,231 @@
+"""
+Streaming downloads of RRDP documents.
+
+Resumable downloads are kept as `<name>.part` when they are interrupted, with
+the ETag (or Last-Modified) of the response in `<name>.part.etag`. The next
+request asks for the remainder with `Range`, conditional on `If-Range`: when the
+document changed the server sends all of it again.
+"""
+import hashlib
+import logging
+import os
+import re
+import tempfile
+import urllib.parse
+from pathlib import Path
+from typing import Dict, Optional
+
+import aiohttp
+
+from .metrics import DownloadMetrics, RequestMetrics
+from .scheduling import MISSING_STATUSES, HttpStatusError
+from .user_cache import user_cache_dir
+
+LOG = logging.getLogger(__name__)
+
+# Bytes read from the response (and kept in memory) at a time
+DOWNLOAD_CHUNK_SIZE = 256 * 1024
+
+PART_SUFFIX = ".part"
+VALIDATOR_SUFFIX = ".part.etag"
+
+# Returned by `probe` when a file exists but the server did not send its size
+UNKNOWN_SIZE = -1
+
+CONTENT_RANGE_RE = re.compile(r"bytes (\d+)-(\d+)/(\d+|\*)")
+
+
+async def probe(
+    session: aiohttp.ClientSession,
+    uri: str,
+    metrics: Optional[DownloadMetrics] = None,
+) -> Optional[int]:
+    """
+    Check whether `uri` exists with a HEAD request.
+
+    Returns the Content-Length (or `UNKNOWN_SIZE`), None when it does not exist
+    (404 or 410). Raises a `HttpStatusError` for other statuses.
+    Falls back to a GET (without reading the body) when HEAD is not allowed.
+    """
+    request = metrics.start(uri) if metrics else RequestMetrics(uri)
+    async with session.head(uri) as response:
+        request.response_received(response.status)
+        status, length = response.status, response.content_length
+
+    if status in (405, 501):
+        async with session.get(uri) as response:
+            request.response_received(response.status)
+            status, length = response.status, response.content_length
+
+    if status in MISSING_STATUSES:
+        return None
+    if status != 200:
+        raise HttpStatusError(status, uri)
+    return length if length is not None else UNKNOWN_SIZE
+
+
+def with_host(uri: str, host: Optional[str]) -> str:
+    """Replace the scheme and host of `uri` with those of `host` (when given)."""
+    if not host:
+        return uri
+    tokens = list(urllib.parse.urlparse(uri))
+    override_tokens = urllib.parse.urlparse(host)
+    # [scheme, host, ...]
+    tokens[0] = override_tokens[0]
+    tokens[1] = override_tokens[1]
+    return urllib.parse.urlunparse(tokens)
+
+
+def snapshot_cache_dir(uri: str) -> Path:
+    """The (created) cache directory for the snapshots of the server of `uri`."""
+    netloc = urllib.parse.urlparse(uri).netloc.replace(":", "_")
+    return user_cache_dir("snapshots", netloc)
+
+
+def part_file_for(target_file: Path) -> Path:
+    return target_file.with_name(target_file.name + PART_SUFFIX)
+
+
+def _validator_file_for(target_file: Path) -> Path:
+    return target_file.with_name(target_file.name + VALIDATOR_SUFFIX)
+
+
+def discard_partial(target_file: Path) -> None:
+    """Remove the partial download of `target_file`."""
+    part_file_for(target_file).unlink(missing_ok=True)
+    _validator_file_for(target_file).unlink(missing_ok=True)
+
+
+def resume_headers(target_file: Path) -> Dict[str, str]:
+    """The headers to request the rest of a partial download (if any)."""
+    part_file = part_file_for(target_file)
+    try:
+        size = part_file.stat().st_size
+        validator = _validator_file_for(target_file).read_text().strip()
+    except FileNotFoundError:
+        return {}
+
+    if not size or not validator:
+        return {}
+    return {"Range": f"bytes={size}-", "If-Range": validator}
+
+
+def resumed_from(res: aiohttp.ClientResponse) -> int:
+    """The offset of the body of a (206) response in the document."""
+    if res.status != 206:
+        return 0
+    match = CONTENT_RANGE_RE.fullmatch(res.headers.get("Content-Range", ""))
+    if not match:
+        raise ValueError(
+            f"Invalid Content-Range for {res.url}: {res.headers.get('Content-Range')}"
+        )
+    return int(match.group(1))
+
+
+def _validator(res: aiohttp.ClientResponse) -> Optional[str]:
+    """The value for If-Range: a strong ETag or the Last-Modified date."""
+    etag = res.headers.get("ETag")
+    if etag and not etag.startswith("W/"):
+        return etag
+    return res.headers.get("Last-Modified", None)
+
+
+async def download_to_file(
+    res: aiohttp.ClientResponse,
+    target_file: Path,
+    expected_hash: Optional[str] = None,
+    chunk_size: int = DOWNLOAD_CHUNK_SIZE,
+    resume: bool = False,
+) -> str:
+    """
+    Stream the body of a response to `target_file`.
+
+    The body is written to a temporary file in the target directory while the
+    SHA-256 is computed. The temporary file is renamed to `target_file` if the
+    hash matches `expected_hash` (when given), and removed otherwise.
+
+    With `resume` the body is written to the `.part` file instead, which is
+    kept when the transfer fails. A 206 response (to the request with
+    `resume_headers`) is appended to it.
+
+    Returns the SHA-256 of the (complete) document.
+    """
+    if resume:
+        return await _download_to_part_file(res, target_file, expected_hash, chunk_size)
+
+    sha256 = hashlib.sha256()
+    with tempfile.NamedTemporaryFile(
+        dir=target_file.parent,
+        prefix=f".{target_file.name}.",
+        suffix=".tmp",
+        delete=False,
+    ) as f:
+        tmp_file = Path(f.name)
+        try:
+            async for chunk in res.content.iter_chunked(chunk_size):
+                sha256.update(chunk)
+                f.write(chunk)
+        except BaseException:
+            tmp_file.unlink()
+            raise
+
+    digest = sha256.hexdigest()
+    if expected_hash is not None and digest != expected_hash.lower():
+        tmp_file.unlink()
+        raise ValueError(
+            f"Hash mismatch for {res.url}. Expected {expected_hash} actual {digest}"
+        )
+
+    os.replace(tmp_file, target_file)
+    return digest
+
+
+async def _download_to_part_file(
+    res: aiohttp.ClientResponse,
+    target_file: Path,
+    expected_hash: Optional[str],
+    chunk_size: int,
+) -> str:
+    part_file = part_file_for(target_file)
+    validator_file = _validator_file_for(target_file)
+
+    sha256 = hashlib.sha256()
+    offset = resumed_from(res)
+    if offset:
+        size = part_file.stat().st_size if part_file.exists() else 0
+        if offset != size:
+            discard_partial(target_file)
+            raise ValueError(
+                f"Got range starting at {offset} for {res.url}, have {size} bytes"
+            )
+        LOG.info("Resuming %s at %d bytes", res.url, offset)
+        with part_file.open("rb") as f:
+            while chunk := f.read(chunk_size):
+                sha256.update(chunk)
+    else:
+        validator = _validator(res)
+        if validator:
+            validator_file.write_text(validator)
+        else:
+            # Without a validator a partial download can not be resumed safely
+            validator_file.unlink(missing_ok=True)
+
+    with part_file.open("ab" if offset else "wb") as f:
+        try:
+            async for chunk in res.content.iter_chunked(chunk_size):
+                sha256.update(chunk)
+                f.write(chunk)
+        except BaseException:
+            LOG.info("Kept %d bytes of %s in %s", f.tell(), res.url, part_file)
+            raise
+
+    digest = sha256.hexdigest()
+    if expected_hash is not None and digest != expected_hash.lower():
+        discard_partial(target_file)
+        raise ValueError(
+            f"Hash mismatch for {res.url}. Expected {expected_hash} actual {digest}"
+        )
+
+    os.replace(part_file, target_file)
+    validator_file.unlink(missing_ok=True)
+    return digest
@@ -0,0 +1,27 @@
+import os
+import tempfile
+from pathlib import Path
+from typing import Union
+
+
+def write_atomic(path: Path, content: Union[str, bytes]) -> None:
+    """
+    Replace `path` with `content` atomically.
+
+    The content is written to a temporary file in the same directory, that is
+    renamed to `path`: readers see the old or the new file, never a partial one.
+    """
+    with tempfile.NamedTemporaryFile(
+        "w" if isinstance(content, str) else "wb",
+        dir=path.parent,
+        prefix=f".{path.name}.",
+        suffix=".tmp",
+        delete=False,
+    ) as f:
+        try:
+            f.write(content)
+        except BaseException:
+            f.close()
+            os.unlink(f.name)
+            raise
+    os.replace(f.name, path)
@@ -0,0 +1,80 @@
+"""
+Index of the SHA-256 of files in a directory, to avoid re-hashing them.
+
+Entries are keyed by the path relative to the directory and store the size and
+modification time of the file when it was hashed. A file is only hashed again
+when its size or modification time changed.
+"""
+import hashlib
+import logging
+import os
+import time
+from pathlib import Path
+from typing import Optional, Tuple
+
+from .disk_index import DiskIndex
+
+LOG = logging.getLogger(__name__)
+
+INDEX_DIR_NAME = ".rrdp-hash-index"
+HASH_CHUNK_SIZE = 1024 * 1024
+
+# A file modified this recently may be modified again without the mtime
+# changing (within the timestamp granularity of the filesystem); the hash of
+# such a file is not stored.
+RACY_WINDOW_NS = 2 * 10**9
+
+
+def hash_file(path: Path) -> str:
+    """The SHA-256 (hex) of a file, read in chunks."""
+    sha256 = hashlib.sha256()
+    with path.open("rb") as f:
+        while chunk := f.read(HASH_CHUNK_SIZE):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+class HashIndex(DiskIndex):
+    """path -> (size, mtime_ns, sha256) for the files below `root`."""
+
+    INDEX_DIR_NAME = INDEX_DIR_NAME
+
+    def __init__(self, root: Path, readonly: bool = False) -> None:
+        super().__init__(root, readonly)
+        self.hits = 0
+        self.misses = 0
+
+    def _key(self, path: Path) -> str:
+        return os.path.relpath(path, self.root)
+
+    def sha256(self, path: Path) -> Optional[str]:
+        """The SHA-256 of a file, from the index when it did not change."""
+        try:
+            stat = path.stat()
+        except FileNotFoundError:
+            return None
+
+        key = self._key(path)
+        entry: Optional[Tuple[int, int, str]] = self.cache.get(key)
+        if entry is not None and entry[:2] == (stat.st_size, stat.st_mtime_ns):
+            self.hits += 1
+            return entry[2]
+
+        self.misses += 1
+        digest = hash_file(path)
+        if not self.readonly and stat.st_mtime_ns < time.time_ns() - RACY_WINDOW_NS:
+            self.cache.set(key, (stat.st_size, stat.st_mtime_ns, digest))
+        return digest
+
+    def update(self, path: Path, sha256: str) -> None:
+        """Record the hash of a file that was just written (and had its mtime set)."""
+        if self.readonly:
+            return
+        stat = path.stat()
+        self.cache.set(self._key(path), (stat.st_size, stat.st_mtime_ns, sha256))
+
+    def close(self) -> None:
+        LOG.debug(
+            "hash index %s: %d hits, %d misses", self.root, self.hits, self.misses
+        )
+        super().close()
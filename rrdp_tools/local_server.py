@@ -0,0 +1,294 @@
+"""
+A local RRDP server for tests and benchmarks.
+
+Serves a synthetic repository or the documents in a directory (as written by
+snapshot-rrdp), with optional latency, bandwidth limit, error injection,
+truncated responses, ETag and Range support.
+"""
+import asyncio
+import collections
+import contextlib
+import hashlib
+import io
+import random
+import re
+import uuid
+from dataclasses import dataclass
+from pathlib import Path
+from typing import AsyncIterator, Counter, Dict, List, Optional, Union
+
+from aiohttp import web
+
+from .rrdp import (
+    DeltaDocument,
+    DeltaElement,
+    NotificationDocument,
+    PublishElement,
+    SnapshotDocument,
+    SnapshotElement,
+    parse_notification_file,
+)
+
+# Bytes written per chunk, the bandwidth limit is applied per chunk
+SERVE_CHUNK_SIZE = 64 * 1024
+
+
+class SyntheticRepository:
+    """An RRDP repository with `objects_per_delta` objects published per delta."""
+
+    def __init__(
+        self,
+        base_url: str = "http://rrdp.example.org",
+        objects_per_delta: int = 1,
+        object_size: Optional[int] = None,
+    ) -> None:
+        self.base_url = base_url
+        self.objects_per_delta = objects_per_delta
+        self.object_size = object_size
+        self.session_id = str(uuid.uuid4())
+        self.serial = 0
+        self.objects: Dict[str, bytes] = {}
+        # The URI of the deltas is relative to `base_url`, which is only known
+        # once the server started.
+        self.deltas: List[DeltaElement] = []
+        # path -> content
+        self.documents: Dict[str, bytes] = {}
+
+    def _object(self, name: str) -> bytes:
+        content = f"object {name}".encode("ascii")
+        if self.object_size is None:
+            return content
+        return (content * (self.object_size // len(content) + 1))[: self.object_size]
+
+    def add_delta(self) -> None:
+        self.serial += 1
+        published = []
+        for i in range(self.objects_per_delta):
+            name = str(self.serial) if i == 0 else f"{self.serial}-{i}"
+            uri = f"rsync://rpki.example.org/repo/{name}.roa"
+            self.objects[uri] = self._object(name)
+            published.append(PublishElement(uri, None, self.objects[uri]))
+
+        output = io.BytesIO()
+        sha256 = DeltaDocument(self.serial, self.session_id, published).write_to(output)
+
+        path = f"/{self.session_id}/{self.serial}/delta.xml"
+        self.documents[path] = output.getvalue()
+        self.deltas.append(DeltaElement(self.serial, sha256, path))
+
+    def reset_session(self) -> None:
+        self.session_id = str(uuid.uuid4())
+        self.serial = 0
+        self.deltas = []
+
+    @property
+    def notification(self) -> NotificationDocument:
+        path = f"/{self.session_id}/{self.serial}/snapshot.xml"
+        if path not in self.documents:
+            output = io.BytesIO()
+            SnapshotDocument(
+                self.serial,
+                self.session_id,
+                [
+                    PublishElement(uri, None, content)
+                    for uri, content in self.objects.items()
+                ],
+            ).write_to(output)
+            self.documents[path] = output.getvalue()
+
+        snapshot = SnapshotElement(
+            hash=hashlib.sha256(self.documents[path]).hexdigest(),
+            uri=self.base_url + path,
+        )
+        deltas = [
+            DeltaElement(d.serial, d.hash, self.base_url + d.uri) for d in self.deltas
+        ]
+        return NotificationDocument(snapshot, deltas, self.serial, self.session_id)
+
+    def get_document(self, path: str) -> Optional[bytes]:
+        return self.documents.get(path, None)
+
+    def delta_url_template(self) -> str:
+        """The template for the delta URLs (as used by loop-over-deltas)."""
+        return f"{self.base_url}/{self.session_id}/{{}}/delta.xml"
+
+
+class DirectoryRepository:
+    """
+    The documents in a directory written by snapshot-rrdp.
+
+    The notification file is rewritten to refer to the snapshot
+    (`snapshot-<serial>.xml`) and deltas (`<serial>.xml`) that are present.
+    """
+
+    def __init__(self, path: Path, base_url: str = "http://rrdp.example.org") -> None:
+        self.path = path
+        self.base_url = base_url
+        self._original = parse_notification_file(
+            (path / "notification.xml").read_bytes()
+        )
+
+    @property
+    def notification(self) -> NotificationDocument:
+        original = self._original
+        snapshot = SnapshotElement(
+            uri=f"{self.base_url}/snapshot-{original.serial}.xml",
+            hash=original.snapshot.hash,
+        )
+        deltas = [
+            DeltaElement(d.serial, d.hash, f"{self.base_url}/{d.serial}.xml")
+            for d in original.deltas
+            if (self.path / f"{d.serial}.xml").is_file()
+        ]
+        return NotificationDocument(
+            snapshot, deltas, original.serial, original.session_id
+        )
+
+    def get_document(self, path: str) -> Optional[Path]:
+        name = path.lstrip("/")
+        if "/" in name or not name.endswith(".xml"):
+            return None
+        file = self.path / name
+        return file if file.is_file() else None
+
+    def delta_url_template(self) -> str:
+        """The template for the delta URLs (as used by loop-over-deltas)."""
+        return f"{self.base_url}/{{}}.xml"
+
+
+Repository = Union[SyntheticRepository, DirectoryRepository]
+
+
+@dataclass
+class ServerConfig:
+    # seconds before the response headers are sent
+    latency: float = 0.0
+    # bytes per second per response (None: unlimited)
+    bandwidth: Optional[int] = None
+    # fraction of document requests that fail with `error_status`
+    error_rate: float = 0.0
+    error_status: int = 503
+    etag: bool = True
+    # answer `Range` requests (honouring If-Range)
+    ranges: bool = True
+    # close the connection after sending this many bytes of a body
+    truncate_after: Optional[int] = None
+    seed: Optional[int] = None
+
+
+class RrdpServer:
+    def __init__(
+        self, repository: Repository, config: Optional[ServerConfig] = None
+    ) -> None:
+        self.repository = repository
+        self.config = config or ServerConfig()
+        self.requests: Counter[str] = collections.Counter()
+        self.bytes_sent = 0
+        self.url: Optional[str] = None
+        self._random = random.Random(self.config.seed)
+
+        self.app = web.Application()
+        self.app.router.add_get("/notification.xml", self.get_notification)
+        self.app.router.add_get("/{path:.+}", self.get_document)
+
+    async def get_notification(self, request: web.Request) -> web.StreamResponse:
+        self.requests[request.path] += 1
+        body = str(self.repository.notification).encode("utf-8")
+        return await self._respond(request, body)
+
+    async def get_document(self, request: web.Request) -> web.StreamResponse:
+        self.requests[request.path] += 1
+        document = self.repository.get_document(request.path)
+        if document is None:
+            raise web.HTTPNotFound()
+
+        if self.config.error_rate and self._random.random() < self.config.error_rate:
+            await asyncio.sleep(self.config.latency)
+            return web.Response(status=self.config.error_status)
+
+        body = document if isinstance(document, bytes) else document.read_bytes()
+        return await self._respond(request, body)
+
+    async def _respond(self, request: web.Request, body: bytes) -> web.StreamResponse:
+        await asyncio.sleep(self.config.latency)
+
+        headers = {}
+        if self.config.etag:
+            headers["ETag"] = f'"{hashlib.sha256(body).hexdigest()}"'
+            if request.headers.get("If-None-Match") == headers["ETag"]:
+                return web.Response(status=304, headers=headers)
+
+        status = 200
+        start = self._range_start(request, headers.get("ETag"))
+        if start is not None:
+            if start >= len(body):
+                return web.Response(
+                    status=416, headers={"Content-Range": f"bytes */{len(body)}"}
+                )
+            status = 206
+            headers["Content-Range"] = f"bytes {start}-{len(body) - 1}/{len(body)}"
+            body = body[start:]
+
+        if request.method == "HEAD":
+            # aiohttp sends the headers (including Content-Length) only
+            return web.Response(status=status, body=body, headers=headers)
+
+        if self.config.bandwidth is None and self.config.truncate_after is None:
+            self.bytes_sent += len(body)
+            return web.Response(status=status, body=body, headers=headers)
+
+        response = web.StreamResponse(status=status, headers=headers)
+        response.content_length = len(body)
+        await response.prepare(request)
+        limit = self.config.truncate_after
+        for offset in range(0, len(body), SERVE_CHUNK_SIZE):
+            chunk = body[offset : offset + SERVE_CHUNK_SIZE]
+            if limit is not None and offset + len(chunk) > limit:
+                chunk = chunk[: max(0, limit - offset)]
+                await response.write(chunk)
+                self.bytes_sent += len(chunk)
+                # The client sees a connection reset before the end of the body
+                assert request.transport is not None
+                request.transport.close()
+                return response
+            await response.write(chunk)
+            self.bytes_sent += len(chunk)
+            if self.config.bandwidth is not None:
+                await asyncio.sleep(len(chunk) / self.config.bandwidth)
+        await response.write_eof()
+        return response
+
+    def _range_start(self, request: web.Request, etag: Optional[str]) -> Optional[int]:
+        """The start of a `bytes=N-` range that applies to the response."""
+        if not self.config.ranges or request.method not in ("GET", "HEAD"):
+            return None
+        match = re.fullmatch(r"bytes=(\d+)-", request.headers.get("Range", ""))
+        if not match:
+            return None
+        if_range = request.headers.get("If-Range")
+        if if_range is not None and if_range != etag:
+            # The document changed: send all of it
+            return None
+        return int(match.group(1))
+
+
+@contextlib.asynccontextmanager
+async def serve(
+    repository: Repository,
+    config: Optional[ServerConfig] = None,
+    host: str = "127.0.0.1",
+    port: int = 0,
+) -> AsyncIterator[RrdpServer]:
+    """Run an RRDP server for `repository` (on a free port by default)."""
+    server = RrdpServer(repository, config)
+    runner = web.AppRunner(server.app)
+    await runner.setup()
+    try:
+        site = web.TCPSite(runner, host, port)
+        await site.start()
+        bound_port = runner.addresses[0][1]
+        repository.base_url = f"http://{host}:{bound_port}"
+        server.url = f"{repository.base_url}/notification.xml"
+        yield server
+    finally:
+        await runner.cleanup()
@@ -1,85 +1,418 @@
 import asyncio
+import collections
 import logging
-import multiprocessing
+import re
 import sys
-import time
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Set, Tuple
 
 import aiohttp
 import click
 
+from rrdp_tools.download import download_to_file, probe
+from rrdp_tools.files import write_atomic
+from rrdp_tools.metrics import DownloadMetrics, RequestMetrics
+from rrdp_tools.object_store import ObjectStore
+from rrdp_tools.scheduling import (
+    MISSING_STATUSES,
+    HttpStatusError,
+    RetryPolicy,
+    TokenBucket,
+    retry,
+)
+
 logging.basicConfig()
 
 LOG = logging.getLogger(Path(__file__).name)
 LOG.setLevel(logging.INFO)
 
 
+DEFAULT_CONCURRENCY = 8
+# Seconds to connect or between reads of the response
+DEFAULT_TIMEOUT = 60.0
+RETRY_FILE_NAME = ".loop-over-deltas-retry"
+SESSION_ID_RE = re.compile(
+    r"[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}"
+)
+
+
 @dataclass
 class Download:
     target_file: Path
     uri: str
+    # Content-Length, when it is known from probing
+    size: Optional[int] = None
+    serial: Optional[int] = None
+
+
+class DeltaRangeProber:
+    """
+    Find the range of deltas that exist using HEAD requests.
+
+    Assumes that the deltas that exist are a contiguous range of serials. Once
+    a serial that exists is found, the bounds of the range are found with
+    O(log n) requests: galloping (exponential steps) away from it, followed by
+    a binary search. Finding the first serial that exists is cheap when the
+    range includes one of the bounds, and takes about 2 * (end - start) / size
+    requests otherwise.
+
+    Only 404 and 410 mean that a delta does not exist. Server errors and
+    timeouts are retried (following `retry_policy`), and raised when they
+    persist: a failed probe would otherwise narrow the range.
+    """
+
+    def __init__(
+        self,
+        session: aiohttp.ClientSession,
+        url_template: str,
+        metrics: Optional[DownloadMetrics] = None,
+        rate_limiter: Optional[TokenBucket] = None,
+        retry_policy: Optional[RetryPolicy] = None,
+    ) -> None:
+        self.session = session
+        self.url_template = url_template
+        self.metrics = metrics
+        self.rate_limiter = rate_limiter
+        self.retry_policy = retry_policy or RetryPolicy()
+        # serial -> size (or None when it does not exist)
+        self.sizes: Dict[int, Optional[int]] = {}
+
+    async def exists(self, serial: int) -> bool:
+        if serial not in self.sizes:
+            uri = self.url_template.format(serial)
+            self.sizes[serial] = await retry(
+                lambda attempt: probe(self.session, uri, self.metrics),
+                self.retry_policy,
+                self.rate_limiter,
+                f"HEAD {uri}",
+            )
+            LOG.debug("probe %d: %s", serial, self.sizes[serial])
+        return self.sizes[serial] is not None
+
+    async def find_any(self, start: int, end: int) -> Optional[int]:
+        """A serial in [start, end) that exists, checking the bounds first."""
+        if start >= end:
+            return None
+        for serial in (end - 1, start):
+            if await self.exists(serial):
+                return serial
+
+        # Breadth first over the midpoints: larger gaps are checked first
+        segments = collections.deque([(start + 1, end - 1)])
+        while segments:
+            lo, hi = segments.popleft()
+            if lo >= hi:
+                continue
+            mid = (lo + hi) // 2
+            if await self.exists(mid):
+                return mid
+            segments.append((lo, mid))
+            segments.append((mid + 1, hi))
+        return None
+
+    async def gallop(self, hit: int, bound: int) -> int:
+        """The last serial that exists going from `hit` towards `bound` (inclusive)."""
+        direction = 1 if bound >= hit else -1
+        step = 1
+        while True:
+            candidate = hit + direction * step
+            if (candidate - bound) * direction >= 0:
+                if hit == bound or await self.exists(bound):
+                    return bound
+                miss = bound
+                break
+            if await self.exists(candidate):
+                hit = candidate
+                step *= 2
+            else:
+                miss = candidate
+                break
+
+        while abs(miss - hit) > 1:
+            mid = (hit + miss) // 2
+            if await self.exists(mid):
+                hit = mid
+            else:
+                miss = mid
+        return hit
+
+    async def find_range(self, start: int, end: int) -> Optional[Tuple[int, int]]:
+        """The first and last serial (inclusive) in [start, end) that exist."""
+        hit = await self.find_any(start, end)
+        if hit is None:
+            return None
+        return (await self.gallop(hit, start), await self.gallop(hit, end - 1))
+
+
+def session_id_for(url_template: str) -> Optional[str]:
+    """The session ID in the URL of the deltas, if it has one."""
+    match = SESSION_ID_RE.search(url_template)
+    return match.group(0).lower() if match else None
+
+
+def stored_documents(object_store: ObjectStore, url_template: str) -> Set[str]:
+    """The names of the documents of the session of `url_template` in the store."""
+    session_id = session_id_for(url_template)
+    if session_id is None:
+        LOG.warning(
+            "No session ID in %s: documents in the object store are downloaded again",
+            url_template,
+        )
+        return set()
+    return object_store.document_names(session_id)
 
 
 async def get_and_check(
-    i: int, session: aiohttp.ClientSession, download: Download
-) -> None:
-    t0 = time.time()
+    i: int,
+    session: aiohttp.ClientSession,
+    download: Download,
+    object_store: Optional[ObjectStore] = None,
+    metrics: Optional[DownloadMetrics] = None,
+    attempt: int = 0,
+) -> bool:
+    if download.target_file.exists():
+        size = download.size
+        if size is None:
+            size = await probe(session, download.uri, metrics)
+        if size is not None and size == download.target_file.stat().st_size:
+            LOG.debug("[%d] Already have %s", i, download.target_file)
+            return False
+
+    request = metrics.start(download.uri) if metrics else RequestMetrics(download.uri)
+    request.retries = attempt
     async with session.get(download.uri) as response:
-        LOG.debug("[%d] HTTP %d %.3fs", i, response.status, time.time() - t0)
+        request.response_received(response.status)
+        LOG.debug("[%d] HTTP %d %.3fs", i, response.status, request.ttfb)
         if response.status == 200:
-            with open(download.target_file, "wb") as f:
-                f.write(await response.read())
+            sha256 = await download_to_file(response, download.target_file)
+            request.body_received(download.target_file.stat().st_size)
             LOG.info(
                 "[%d] Downloaded %s to %s in %.3fs",
                 i,
                 download.uri,
                 download.target_file,
-                time.time() - t0,
+                request.ttfb + request.transfer_time,
             )
+            if object_store:
+                await asyncio.to_thread(
+                    object_store.add_document,
+                    download.target_file.name,
+                    download.target_file,
+                    sha256,
+                )
+                download.target_file.unlink()
+            return True
         else:
-            raise ValueError(f"Got status {response.status} for {download.uri}")
+            raise HttpStatusError(response.status, download.uri)
+
+
+@dataclass
+class DownloadResults:
+    downloaded: int = 0
+    skipped: int = 0
+    missing: int = 0
+    failed: List[Download] = field(default_factory=list)
+
+
+async def download_with_retries(
+    i: int,
+    session: aiohttp.ClientSession,
+    download: Download,
+    retry_policy: RetryPolicy,
+    rate_limiter: Optional[TokenBucket] = None,
+    object_store: Optional[ObjectStore] = None,
+    metrics: Optional[DownloadMetrics] = None,
+) -> bool:
+    """`get_and_check`, retried for server errors and timeouts."""
+    return await retry(
+        lambda attempt: get_and_check(
+            i, session, download, object_store, metrics, attempt=attempt
+        ),
+        retry_policy,
+        rate_limiter,
+        f"[{i}] {download.uri}",
+    )
 
 
 async def worker(
-    i: int, session: aiohttp.ClientSession, queue: asyncio.Queue[Download]
-) -> int:
-    processed = 0
-    while not queue.empty():
+    i: int,
+    session: aiohttp.ClientSession,
+    queue: asyncio.Queue[Download],
+    results: DownloadResults,
+    retry_policy: RetryPolicy,
+    rate_limiter: Optional[TokenBucket] = None,
+    object_store: Optional[ObjectStore] = None,
+    metrics: Optional[DownloadMetrics] = None,
+) -> None:
+    """Process downloads until cancelled."""
+    while True:
         download = await queue.get()
-        processed += 1
         try:
-            await get_and_check(i, session, download)
+            if await download_with_retries(
+                i,
+                session,
+                download,
+                retry_policy,
+                rate_limiter,
+                object_store,
+                metrics,
+            ):
+                results.downloaded += 1
+            else:
+                results.skipped += 1
+        except HttpStatusError as e:
+            if e.status in MISSING_STATUSES:
+                LOG.debug("[%d] %s", i, e)
+                results.missing += 1
+            else:
+                LOG.error("[%d] %s", i, e)
+                results.failed.append(download)
         except Exception as e:
-            LOG.error(e)
+            LOG.error("[%d] %s failed: %s", i, download.uri, e or type(e).__name__)
+            results.failed.append(download)
         finally:
             queue.task_done()
 
-    return processed
+
+def read_retry_file(retry_file: Path) -> List[int]:
+    """The serials in a retry file (one per line)."""
+    try:
+        with retry_file.open("r") as f:
+            return sorted({int(line) for line in f if line.strip()})
+    except FileNotFoundError:
+        return []
+
+
+def write_retry_file(retry_file: Path, serials: List[int]) -> None:
+    """Write the serials to retry, removes the file when there are none."""
+    if not serials:
+        retry_file.unlink(missing_ok=True)
+        return
+
+    write_atomic(retry_file, "".join(f"{serial}\n" for serial in sorted(serials)))
 
 
 async def attempt_delta_download(
-    url_template: str, base_path: Path, min_delta: int, max_delta: int
-) -> None:
-    queue = asyncio.Queue()
+    url_template: str,
+    base_path: Path,
+    min_delta: int,
+    max_delta: int,
+    object_store: Optional[ObjectStore] = None,
+    write_metrics: bool = False,
+    workers: Optional[int] = None,
+    discover: bool = False,
+    rps: Optional[float] = None,
+    retry_policy: Optional[RetryPolicy] = None,
+    retry_file: Optional[Path] = None,
+    timeout: Optional[float] = DEFAULT_TIMEOUT,
+) -> DownloadMetrics:
+    """
+    Download the deltas with serials in [min_delta, max_delta).
 
-    for delta_number in range(min_delta, max_delta):
-        await queue.put(
-            Download(
-                base_path / f"{delta_number}.xml", url_template.format(delta_number)
-            )
+    With `discover` the range of deltas that exist is found with HEAD requests
+    first, and only that range is downloaded. Discovery fails (raises) when a
+    probe keeps failing with a server error or timeout. Files that are present with the
+    size of the remote file are skipped, as are documents that are in the
+    `object_store` for the session in the URL.
+
+    `workers` downloads run concurrently, starting at most `rps` requests per
+    second. Server errors and timeouts are retried following `retry_policy`.
+    Serials that still fail are written to `retry_file`: when it exists, the
+    serials in it are downloaded as well (and it is removed once they succeed).
+    """
+    queue: asyncio.Queue[Download] = asyncio.Queue()
+    retry_policy = retry_policy or RetryPolicy()
+    rate_limiter = TokenBucket(rps) if rps else None
+    results = DownloadResults()
+
+    metrics = DownloadMetrics({"url_template": url_template})
+    async with aiohttp.ClientSession(
+        timeout=aiohttp.ClientTimeout(
+            total=None, sock_connect=timeout, sock_read=timeout
         )
+    ) as session:
+        sizes: Dict[int, Optional[int]] = {}
+        serials: Iterable[int] = range(min_delta, max_delta)
+
+        if discover:
+            prober = DeltaRangeProber(
+                session, url_template, metrics, rate_limiter, retry_policy
+            )
+            # Raises when a probe keeps failing
+            found = await prober.find_range(min_delta, max_delta)
+            if found is None:
+                LOG.error("No deltas found in [%d, %d)", min_delta, max_delta)
+                serials = []
+            else:
+                LOG.info(
+                    "Found deltas %d-%d using %d requests",
+                    found[0],
+                    found[1],
+                    len(prober.sizes),
+                )
+                serials = range(found[0], found[1] + 1)
+            sizes = prober.sizes
+
+        retry_serials = read_retry_file(retry_file) if retry_file else []
+        if retry_serials:
+            LOG.info("Retrying %d serials from %s", len(retry_serials), retry_file)
+            serials = sorted(set(serials).union(retry_serials))
 
-    async with aiohttp.ClientSession() as session:
-        workers = [
-            worker(i, session, queue) for i in range(multiprocessing.cpu_count())
+        stored = stored_documents(object_store, url_template) if object_store else set()
+        for delta_number in serials:
+            if f"{delta_number}.xml" in stored:
+                LOG.debug("Already have %d.xml in the object store", delta_number)
+                results.skipped += 1
+                continue
+            queue.put_nowait(
+                Download(
+                    base_path / f"{delta_number}.xml",
+                    url_template.format(delta_number),
+                    sizes.get(delta_number, None),
+                    delta_number,
+                )
+            )
+
+        tasks = [
+            asyncio.create_task(
+                worker(
+                    i,
+                    session,
+                    queue,
+                    results,
+                    retry_policy,
+                    rate_limiter,
+                    object_store,
+                    metrics,
+                )
+            )
+            for i in range(workers or DEFAULT_CONCURRENCY)
         ]
+        try:
+            await queue.join()
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
 
-        statuses = await asyncio.gather(*workers)
-        await queue.join()
+    LOG.info(
+        "Downloaded %d, skipped %d (present), %d not found, %d failed",
+        results.downloaded,
+        results.skipped,
+        results.missing,
+        len(results.failed),
+    )
+    if retry_file:
+        write_retry_file(retry_file, [d.serial for d in results.failed])
+        if results.failed:
+            LOG.info("Wrote the failed serials to %s", retry_file)
 
-        for status in statuses:
-            LOG.info("Processed %d downloads", status)
+    metrics.finish()
+    metrics.log_summary()
+    if write_metrics:
+        metrics.write(base_path)
+    return metrics
 
 
 @click.command()
@@ -93,8 +426,64 @@ async def attempt_delta_download(
     ),
 )
 @click.option("--verbose", help="verbose", count=True)
+@click.option(
+    "--object-store",
+    help="Move downloaded documents into a deduplicated object store (requires the zstd extra)",
+    type=click.Path(file_okay=False, path_type=Path),
+    default=None,
+)
+@click.option(
+    "--metrics",
+    help="Write download metrics (metrics.json, metrics.prom) to the output directory",
+    is_flag=True,
+)
+@click.option(
+    "--discover",
+    help="Find the deltas that exist between START and END with HEAD requests first",
+    is_flag=True,
+)
+@click.option(
+    "--concurrency",
+    help="Number of concurrent downloads",
+    type=int,
+    default=DEFAULT_CONCURRENCY,
+)
+@click.option(
+    "--rps", help="Maximum number of requests per second", type=float, default=None
+)
+@click.option(
+    "--retries",
+    help="Number of retries for server errors and timeouts",
+    type=int,
+    default=RetryPolicy.attempts - 1,
+)
+@click.option(
+    "--timeout",
+    help="Seconds to connect or wait for data",
+    type=float,
+    default=DEFAULT_TIMEOUT,
+)
+@click.option(
+    "--retry-file",
+    help=f"File for the serials that failed (default: OUTPUT_DIR/{RETRY_FILE_NAME}), "
+    "these are downloaded as well when it exists",
+    type=click.Path(dir_okay=False, path_type=Path),
+    default=None,
+)
 def loop_over_deltas(
-    url_template: str, start: int, end: int, output_dir: Path, verbose: bool
+    url_template: str,
+    start: int,
+    end: int,
+    output_dir: Path,
+    verbose: bool,
+    object_store: Optional[Path] = None,
+    metrics: bool = False,
+    discover: bool = False,
+    concurrency: int = DEFAULT_CONCURRENCY,
+    rps: Optional[float] = None,
+    retries: int = RetryPolicy.attempts - 1,
+    timeout: float = DEFAULT_TIMEOUT,
+    retry_file: Optional[Path] = None,
 ):
     """Loop over all the static guesses for the delta URL
 
@@ -110,7 +499,26 @@ def loop_over_deltas(
         LOG.error("Output directory {} does not exist", output_dir)
         sys.exit(2)
 
-    asyncio.run(attempt_delta_download(url_template, output_dir, start, end))
+    try:
+        asyncio.run(
+            attempt_delta_download(
+                url_template,
+                output_dir,
+                start,
+                end,
+                ObjectStore(object_store) if object_store else None,
+                write_metrics=metrics,
+                workers=concurrency,
+                discover=discover,
+                rps=rps,
+                retry_policy=RetryPolicy(attempts=retries + 1),
+                retry_file=retry_file or output_dir / RETRY_FILE_NAME,
+                timeout=timeout,
+            )
+        )
+    except (HttpStatusError, aiohttp.ClientError, asyncio.TimeoutError) as e:
+        LOG.error("Failed: %s", e or type(e).__name__)
+        sys.exit(1)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,215 @@
+"""
+Timings of downloads, summarised per run.
+
+Per request the time to first byte (until the response headers are received,
+dominated by the server) and the transfer time (receiving the body, dominated
+by the network and the local disk) are recorded separately.
+"""
+import bisect
+import dataclasses
+import json
+import logging
+import math
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence
+
+from .files import write_atomic
+
+LOG = logging.getLogger(__name__)
+
+# Upper bounds (seconds) of the latency histogram buckets
+LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+METRICS_JSON_NAME = "metrics.json"
+METRICS_PROMETHEUS_NAME = "metrics.prom"
+
+
+@dataclass
+class RequestMetrics:
+    url: str
+    started: float = field(default_factory=time.time)
+    status: Optional[int] = None
+    # seconds until the response headers were received
+    ttfb: Optional[float] = None
+    # seconds from the response headers until the body was received
+    transfer_time: Optional[float] = None
+    bytes: int = 0
+    # previous attempts of this request: > 0 when the request is a retry
+    retries: int = 0
+    error: Optional[str] = None
+
+    def response_received(self, status: int) -> None:
+        self.status = status
+        self.ttfb = time.time() - self.started
+
+    def body_received(self, size: int) -> None:
+        self.bytes = size
+        self.transfer_time = time.time() - self.started - (self.ttfb or 0.0)
+
+
+def histogram(values: Sequence[float], buckets=LATENCY_BUCKETS) -> Dict[str, int]:
+    """Cumulative counts per upper bound, as used by Prometheus."""
+    ordered = sorted(values)
+    counts = {str(le): bisect.bisect_right(ordered, le) for le in buckets}
+    counts["+Inf"] = len(ordered)
+    return counts
+
+
+def quantile(values: Sequence[float], q: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, math.ceil(q * len(ordered)) - 1)]
+
+
+def _labels(labels: Dict[str, str]) -> str:
+    def escape(value) -> str:
+        return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{escape(v)}"' for k, v in labels.items()) + "}"
+
+
+class DownloadMetrics:
+    """The requests made during one run."""
+
+    def __init__(self, labels: Optional[Dict[str, str]] = None) -> None:
+        self.labels = labels or {}
+        self.started = time.time()
+        self.finished: Optional[float] = None
+        self.requests: List[RequestMetrics] = []
+
+    def start(self, url: str) -> RequestMetrics:
+        request = RequestMetrics(url)
+        self.requests.append(request)
+        return request
+
+    def finish(self) -> None:
+        self.finished = time.time()
+
+    @property
+    def duration(self) -> float:
+        return (self.finished or time.time()) - self.started
+
+    def summary(self) -> Dict:
+        ttfb = [r.ttfb for r in self.requests if r.ttfb is not None]
+        transfer = [
+            r.transfer_time for r in self.requests if r.transfer_time is not None
+        ]
+        total_bytes = sum(r.bytes for r in self.requests)
+        statuses: Dict[str, int] = {}
+        for r in self.requests:
+            key = str(r.status) if r.status is not None else "error"
+            statuses[key] = statuses.get(key, 0) + 1
+
+        return {
+            **self.labels,
+            "started": self.started,
+            "duration": self.duration,
+            "requests": len(self.requests),
+            "bytes": total_bytes,
+            "throughput": total_bytes / self.duration if self.duration > 0 else 0.0,
+            "retries": sum(1 for r in self.requests if r.retries),
+            "status": statuses,
+            "ttfb": {
+                "p50": quantile(ttfb, 0.5),
+                "p90": quantile(ttfb, 0.9),
+                "max": max(ttfb, default=None),
+                "histogram": histogram(ttfb),
+            },
+            "transfer_time": {
+                "p50": quantile(transfer, 0.5),
+                "p90": quantile(transfer, 0.9),
+                "max": max(transfer, default=None),
+                "histogram": histogram(transfer),
+            },
+            "per_url": [dataclasses.asdict(r) for r in self.requests],
+        }
+
+    def log_summary(self) -> None:
+        summary = self.summary()
+        LOG.info(
+            "%d requests, %.1fMB in %.1fs (%.2fMB/s), ttfb p50=%s p90=%s, %d retries",
+            summary["requests"],
+            summary["bytes"] / 1e6,
+            summary["duration"],
+            summary["throughput"] / 1e6,
+            _seconds(summary["ttfb"]["p50"]),
+            _seconds(summary["ttfb"]["p90"]),
+            summary["retries"],
+        )
+
+    def to_prometheus(self) -> str:
+        """The metrics in the Prometheus text format (for the textfile collector)."""
+        summary = self.summary()
+        lines = []
+
+        def metric(name: str, kind: str, help: str, samples) -> None:
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} {kind}")
+            for suffix, labels, value in samples:
+                lines.append(
+                    f"{name}{suffix}{_labels({**self.labels, **labels})} {value}"
+                )
+
+        metric(
+            "rrdp_download_requests",
+            "gauge",
+            "Requests in the last run by HTTP status.",
+            [("", {"status": status}, n) for status, n in summary["status"].items()],
+        )
+        for name, key, help in (
+            ("rrdp_download_bytes", "bytes", "Bytes downloaded in the last run."),
+            ("rrdp_download_duration_seconds", "duration", "Duration of the last run."),
+            (
+                "rrdp_download_throughput_bytes_per_second",
+                "throughput",
+                "Bytes per second in the last run.",
+            ),
+            ("rrdp_download_retries", "retries", "Retries in the last run."),
+            (
+                "rrdp_download_last_run_timestamp_seconds",
+                "started",
+                "Start of the last run.",
+            ),
+        ):
+            metric(name, "gauge", help, [("", {}, summary[key])])
+
+        for name, attribute, help in (
+            ("rrdp_download_ttfb_seconds", "ttfb", "Time to first byte."),
+            ("rrdp_download_transfer_seconds", "transfer_time", "Transfer time."),
+        ):
+            values = [
+                getattr(r, attribute)
+                for r in self.requests
+                if getattr(r, attribute) is not None
+            ]
+            metric(
+                name,
+                "histogram",
+                help,
+                [
+                    *(
+                        ("_bucket", {"le": le}, n)
+                        for le, n in histogram(values).items()
+                    ),
+                    ("_sum", {}, sum(values)),
+                    ("_count", {}, len(values)),
+                ],
+            )
+
+        return "\n".join(lines) + "\n"
+
+    def write(self, output_path: Path) -> None:
+        """Write the JSON summary and Prometheus textfile to a directory."""
+        write_atomic(
+            output_path / METRICS_JSON_NAME, json.dumps(self.summary(), indent=2)
+        )
+        write_atomic(output_path / METRICS_PROMETHEUS_NAME, self.to_prometheus())
+
+
+def _seconds(value: Optional[float]) -> str:
+    return f"{value:.3f}s" if value is not None else "N/A"
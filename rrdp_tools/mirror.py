@@ -0,0 +1,203 @@
+"""
+Mirror a set of RRDP repositories in one event loop.
+
+All repositories share one HTTP session (connection pool and DNS cache) and
+one download budget, with a connection limit per host.
+"""
+import asyncio
+import logging
+import os
+import urllib.parse
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import aiohttp
+import click
+
+from .metrics import DownloadMetrics
+from .scheduling import DownloadLimiter
+from .snapshot_rrdp import fetch_notification, sync_notification
+
+LOG = logging.getLogger(__name__)
+
+DNS_CACHE_TTL = 300
+
+
+def read_notification_urls(url_file: Path) -> List[str]:
+    """Read notification URLs, one per line. Empty lines and comments are skipped."""
+    urls = []
+    with url_file.open("r") as f:
+        for line in f:
+            line = line.split("#", 1)[0].strip()
+            if line and line not in urls:
+                urls.append(line)
+    return urls
+
+
+def output_path_for(output_path: Path, notification_url: str) -> Path:
+    """The directory for a repository: <host>[_<port>]/<path without file name>."""
+    tokens = urllib.parse.urlparse(notification_url)
+    host = tokens.netloc.replace(":", "_")
+    parts = [p for p in tokens.path.split("/")[:-1] if p and p not in (".", "..")]
+    return output_path.joinpath(host, *parts)
+
+
+async def mirror_repository(
+    limiter: DownloadLimiter,
+    session: aiohttp.ClientSession,
+    notification_url: str,
+    output_path: Path,
+    skip_snapshot: bool = False,
+    include_session: bool = False,
+    include_hash: bool = False,
+    incremental: bool = True,
+    write_metrics: bool = False,
+) -> None:
+    metrics = DownloadMetrics({"notification_url": notification_url})
+    fetch = await fetch_notification(session, notification_url, metrics=metrics)
+    output_path.mkdir(parents=True, exist_ok=True)
+
+    await sync_notification(
+        limiter,
+        session,
+        notification_url,
+        fetch,
+        output_path,
+        skip_snapshot=skip_snapshot,
+        include_session=include_session,
+        include_hash=include_hash,
+        incremental=incremental,
+        metrics=metrics,
+        write_metrics=write_metrics,
+    )
+
+
+async def mirror(
+    notification_urls: List[str],
+    output_path: Path,
+    threads: int = 16,
+    limit_per_host: int = 4,
+    skip_snapshot: bool = False,
+    include_session: bool = False,
+    include_hash: bool = False,
+    incremental: bool = True,
+    write_metrics: bool = False,
+) -> Dict[str, Optional[BaseException]]:
+    """
+    Mirror all repositories concurrently.
+
+    At most `threads` downloads run at the same time, at most `limit_per_host`
+    for one host. Deltas are scheduled before snapshots. A failing repository
+    does not stop the others; returns the error (or None) per notification URL.
+    """
+    limiter = DownloadLimiter(threads, limit_per_host)
+    connector = aiohttp.TCPConnector(
+        limit=threads, limit_per_host=limit_per_host, ttl_dns_cache=DNS_CACHE_TTL
+    )
+
+    async with aiohttp.ClientSession(connector=connector) as session:
+        results = await asyncio.gather(
+            *(
+                mirror_repository(
+                    limiter,
+                    session,
+                    url,
+                    output_path_for(output_path, url),
+                    skip_snapshot=skip_snapshot,
+                    include_session=include_session,
+                    include_hash=include_hash,
+                    incremental=incremental,
+                    write_metrics=write_metrics,
+                )
+                for url in notification_urls
+            ),
+            return_exceptions=True,
+        )
+
+    errors: Dict[str, Optional[BaseException]] = {}
+    for url, result in zip(notification_urls, results):
+        if isinstance(result, BaseException):
+            LOG.error("Failed to mirror %s: %s", url, result)
+            errors[url] = result
+        else:
+            errors[url] = None
+    return errors
+
+
+@click.command("mirror")
+@click.argument("url_file", type=click.Path(exists=True, path_type=Path))
+@click.argument("output_dir", type=click.Path(path_type=Path))
+@click.option(
+    "--threads",
+    help="Number of concurrent downloads (all repositories)",
+    type=int,
+    default=4 * (os.cpu_count() or 1),
+)
+@click.option(
+    "--limit-per-host", help="Number of connections per host", type=int, default=4
+)
+@click.option("--skip_snapshot", help="Skip download of the RRDP snaphot", is_flag=True)
+@click.option("--include-session", help="Include session ID in path", is_flag=True)
+@click.option(
+    "--include-hash/--no-include-hash", help="Include hash in filenames", is_flag=True
+)
+@click.option(
+    "--incremental/--no-incremental",
+    help="Only download deltas since the previous run (uses the state file)",
+    default=True,
+)
+@click.option(
+    "--metrics",
+    help="Write download metrics (metrics.json, metrics.prom) per repository",
+    is_flag=True,
+)
+@click.option("-v", "--verbose", help="verbose", is_flag=True)
+def mirror_command(
+    url_file: Path,
+    output_dir: Path,
+    threads: int,
+    limit_per_host: int,
+    skip_snapshot: bool = False,
+    include_session: bool = False,
+    include_hash: bool = False,
+    incremental: bool = True,
+    metrics: bool = False,
+    verbose: bool = False,
+):
+    """
+    Mirror the RRDP repositories listed in a file
+
+    URL_FILE    File with one notification URL per line.
+    OUTPUT_DIR  Directory to save content in, one sub-directory per repository.
+    """
+    logging.basicConfig()
+    logging.getLogger("rrdp_tools").setLevel(logging.DEBUG if verbose else logging.INFO)
+
+    notification_urls = read_notification_urls(url_file)
+    if not notification_urls:
+        raise click.UsageError(f"No notification URLs in {url_file}")
+
+    errors = asyncio.run(
+        mirror(
+            notification_urls,
+            output_dir.resolve(),
+            threads=threads,
+            limit_per_host=limit_per_host,
+            skip_snapshot=skip_snapshot,
+            include_session=include_session,
+            include_hash=include_hash,
+            incremental=incremental,
+            write_metrics=metrics,
+        )
+    )
+
+    failed = [url for url, error in errors.items() if error is not None]
+    click.echo(
+        f"Mirrored {len(notification_urls) - len(failed)}/{len(notification_urls)} repositories."
+    )
+    if failed:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    mirror_command()
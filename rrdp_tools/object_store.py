@@ -0,0 +1,275 @@
+"""
+Content-addressed store for the objects in snapshot and delta documents.
+
+Each object is stored once, zstd compressed, under its SHA-256. A document is
+stored as a manifest that references the objects:
+
+    <root>/objects/ab/abcdef...                         object content
+    <root>/documents/<session_id>/<name>.<sha256>.json.zst  manifest
+
+Documents are restored in canonical form (`write_document`). The manifest
+records the hash of the original and of the canonical document: when they are
+equal the restored document is identical to the original.
+"""
+import dataclasses
+import hashlib
+import json
+import logging
+import threading
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import BinaryIO, Generator, List, Optional, Set, Tuple, Union
+
+import click
+
+from .compression import import_zstandard, open_rrdp_file
+from .files import write_atomic
+from .rrdp import (
+    PublishElement,
+    RrdpElement,
+    WithdrawElement,
+    iter_snapshot_or_delta,
+    write_document,
+)
+
+LOG = logging.getLogger(__name__)
+
+MANIFEST_VERSION = 1
+HASH_CHUNK_SIZE = 1024 * 1024
+
+# [uri, previous_hash, sha256] for publish, [uri, hash] for withdraw elements
+ElementReference = Union[Tuple[str, Optional[str], str], Tuple[str, str]]
+
+
+@dataclass
+class DocumentManifest:
+    name: str
+    document_type: str
+    serial: int
+    session_id: str
+    # hash of the original document
+    sha256: str
+    # hash of the document as written by `write_document`
+    canonical_sha256: str
+    elements: List[ElementReference] = field(default_factory=list)
+
+    @property
+    def canonical(self) -> bool:
+        """Whether the restored document is identical to the original."""
+        return self.sha256 == self.canonical_sha256
+
+
+@dataclass
+class StoreStatistics:
+    objects_written: int = 0
+    objects_deduplicated: int = 0
+    bytes_in: int = 0
+    bytes_written: int = 0
+
+
+class _Discard:
+    """A stream that discards writes."""
+
+    def write(self, data: bytes) -> int:
+        return len(data)
+
+
+def _document_sha256(source: Path) -> str:
+    sha256 = hashlib.sha256()
+    with open_rrdp_file(source) as f:
+        while chunk := f.read(HASH_CHUNK_SIZE):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+class ObjectStore:
+    def __init__(self, root: Path, level: int = 3) -> None:
+        zstandard = import_zstandard("The object store")
+        self.root = root
+        self.level = level
+        self.statistics = StoreStatistics()
+
+        self._compressor = zstandard.ZstdCompressor(level=level)
+        self._decompressor = zstandard.ZstdDecompressor()
+        # zstandard (de)compressors can not be used from multiple threads
+        self._lock = threading.Lock()
+
+        (root / "objects").mkdir(parents=True, exist_ok=True)
+        (root / "documents").mkdir(parents=True, exist_ok=True)
+
+    def object_path(self, sha256: str) -> Path:
+        sha256 = sha256.lower()
+        return self.root / "objects" / sha256[:2] / sha256
+
+    def manifest_path(self, session_id: str, name: str, sha256: str) -> Path:
+        return (
+            self.root / "documents" / session_id / f"{name}.{sha256.lower()}.json.zst"
+        )
+
+    def _write_atomic(self, path: Path, data: bytes) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        write_atomic(path, data)
+
+    def has_object(self, sha256: str) -> bool:
+        return self.object_path(sha256).exists()
+
+    def put_object(self, content: bytes, sha256: str) -> None:
+        """Store an object, unless an object with the same hash is present."""
+        self.statistics.bytes_in += len(content)
+        path = self.object_path(sha256)
+        if path.exists():
+            self.statistics.objects_deduplicated += 1
+            return
+
+        data = self._compressor.compress(content)
+        self._write_atomic(path, data)
+        self.statistics.objects_written += 1
+        self.statistics.bytes_written += len(data)
+
+    def get_object(self, sha256: str) -> bytes:
+        data = self.object_path(sha256).read_bytes()
+        with self._lock:
+            return self._decompressor.decompress(data)
+
+    def has_document(self, session_id: str, name: str, sha256: str) -> bool:
+        return self.manifest_path(session_id, name, sha256).exists()
+
+    def document_names(self, session_id: str) -> Set[str]:
+        """The names of the documents (of any hash) stored for a session."""
+        directory = self.root / "documents" / session_id
+        if not directory.is_dir():
+            return set()
+        # <name>.<sha256>.json.zst
+        return {path.name.rsplit(".", 3)[0] for path in directory.glob("*.*.json.zst")}
+
+    def add_document(
+        self,
+        name: str,
+        source: Path,
+        sha256: Optional[str] = None,
+    ) -> DocumentManifest:
+        """
+        Store the objects in a snapshot or delta document and its manifest.
+
+        `source` can be compressed. `sha256` is the hash of the uncompressed
+        document, it is computed when not given.
+        """
+        if sha256 is None:
+            sha256 = _document_sha256(source)
+
+        with self._lock:
+            return self._add_document(name, source, sha256)
+
+    def _add_document(self, name: str, source: Path, sha256: str) -> DocumentManifest:
+        elements = iter_snapshot_or_delta(source)
+        header = next(elements)
+        references: List[ElementReference] = []
+
+        def store_elements() -> Generator[RrdpElement, None, None]:
+            for elem in elements:
+                match elem:
+                    case PublishElement():
+                        self.put_object(elem.content, elem.h_content)
+                        references.append(
+                            (elem.uri, elem.previous_hash, elem.h_content)
+                        )
+                    case WithdrawElement():
+                        references.append((elem.uri, elem.hash))
+                yield elem
+
+        # The canonical form is written (and discarded) while storing objects
+        canonical_sha256 = write_document(
+            _Discard(),
+            header.document_type,
+            header.serial,
+            header.session_id,
+            store_elements(),
+        )
+
+        manifest = DocumentManifest(
+            name=name,
+            document_type=header.document_type,
+            serial=header.serial,
+            session_id=header.session_id,
+            sha256=sha256.lower(),
+            canonical_sha256=canonical_sha256,
+            elements=references,
+        )
+        self._write_atomic(
+            self.manifest_path(header.session_id, name, manifest.sha256),
+            self._compressor.compress(
+                json.dumps(
+                    {"version": MANIFEST_VERSION, **dataclasses.asdict(manifest)}
+                ).encode("utf-8")
+            ),
+        )
+        if not manifest.canonical:
+            LOG.debug("%s is not in canonical form, it is restored canonically", name)
+        return manifest
+
+    def get_manifest(self, session_id: str, name: str, sha256: str) -> DocumentManifest:
+        compressed = self.manifest_path(session_id, name, sha256).read_bytes()
+        with self._lock:
+            data = json.loads(self._decompressor.decompress(compressed))
+        version = data.pop("version")
+        if version != MANIFEST_VERSION:
+            raise ValueError(f"Unsupported manifest version {version}")
+        return DocumentManifest(**data)
+
+    def iter_elements(
+        self, manifest: DocumentManifest
+    ) -> Generator[RrdpElement, None, None]:
+        """The elements of a document, the content of objects is read lazily."""
+        for reference in manifest.elements:
+            if len(reference) == 3:
+                uri, previous_hash, sha256 = reference
+                yield PublishElement(uri, previous_hash, self.get_object(sha256))
+            else:
+                uri, withdraw_hash = reference
+                yield WithdrawElement(uri, withdraw_hash)
+
+    def write_document(self, manifest: DocumentManifest, stream: BinaryIO) -> str:
+        """Write a document to `stream`, returns its SHA-256."""
+        return write_document(
+            stream,
+            manifest.document_type,
+            manifest.serial,
+            manifest.session_id,
+            self.iter_elements(manifest),
+        )
+
+
+@click.command("restore-document")
+@click.argument("store_dir", type=click.Path(exists=True, path_type=Path))
+@click.argument("session_id", type=str)
+@click.argument("name", type=str)
+@click.argument("sha256", type=str)
+@click.argument("output_file", type=click.Path(path_type=Path))
+def restore_document_command(
+    store_dir: Path, session_id: str, name: str, sha256: str, output_file: Path
+):
+    """
+    Restore a snapshot or delta from an object store
+
+    STORE_DIR   Object store directory.
+    SESSION_ID  Session of the document.
+    NAME        Name of the document (e.g. snapshot-1234.xml).
+    SHA256      Hash of the original document.
+    OUTPUT_FILE File to write the document to.
+    """
+    store = ObjectStore(store_dir)
+    manifest = store.get_manifest(session_id, name, sha256)
+
+    with output_file.open("wb") as f:
+        written = store.write_document(manifest, f)
+
+    if manifest.canonical:
+        click.echo(f"Restored {name} (sha256={written})")
+    else:
+        click.echo(
+            f"Restored {name} in canonical form (sha256={written}, original {manifest.sha256})"
+        )
+
+
+if __name__ == "__main__":
+    restore_document_command()
@@ -0,0 +1,237 @@
+"""
+Choose between downloading the snapshot or the chain of deltas.
+
+A local copy that is a few serials behind can be updated with the deltas since
+its serial, or by downloading the current snapshot. The plan with the lowest
+cost (bytes plus a fixed cost per request) is chosen. Sizes are taken from the
+state file. Sizes that are not known are estimated (the size of the previous
+snapshot, the mean size of the known deltas), or requested with HEAD requests
+when there is nothing to estimate them from.
+"""
+import asyncio
+import logging
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+import aiohttp
+
+from .download import UNKNOWN_SIZE, probe, with_host
+from .metrics import DownloadMetrics
+from .rrdp import DeltaElement, NotificationDocument
+from .scheduling import (
+    DELTA_PRIORITY,
+    SNAPSHOT_PRIORITY,
+    DownloadLimiter,
+    HttpStatusError,
+)
+from .sync_state import SyncState
+
+LOG = logging.getLogger(__name__)
+
+# Cost (in bytes) of a request, in addition to the size of the document: many
+# small deltas take longer than their total size suggests.
+REQUEST_COST = 16 * 1024
+
+FULL = "snapshot+deltas"
+SNAPSHOT = "snapshot"
+DELTAS = "deltas"
+
+
+@dataclass
+class PlannedDownload:
+    file_name: str
+    uri: str
+    sha256: str
+    priority: int
+    # bytes, when known
+    size: Optional[int] = None
+    # whether `size` is an estimate
+    estimated: bool = False
+
+
+@dataclass
+class DownloadPlan:
+    strategy: str
+    downloads: List[PlannedDownload]
+    reason: str
+
+    @property
+    def size(self) -> Optional[int]:
+        """Total size of the downloads, None if any size is unknown."""
+        sizes = [d.size for d in self.downloads]
+        if any(size is None for size in sizes):
+            return None
+        return sum(sizes)
+
+    @property
+    def cost(self) -> Optional[int]:
+        size = self.size
+        if size is None:
+            return None
+        return size + REQUEST_COST * len(self.downloads)
+
+    @property
+    def estimated(self) -> bool:
+        return any(d.estimated for d in self.downloads)
+
+    def format(self) -> str:
+        size = self.size
+        if size is None:
+            total = "size unknown"
+        else:
+            total = f"{'~' if self.estimated else ''}{size} bytes"
+        lines = [
+            f"Plan: {self.strategy} ({self.reason}), {len(self.downloads)} files, {total}"
+        ]
+        for d in self.downloads:
+            size = "?" if d.size is None else f"{'~' if d.estimated else ''}{d.size}"
+            lines.append(f"  {d.file_name} {size} {d.uri}")
+        return "\n".join(lines)
+
+
+def _snapshot(notification: NotificationDocument) -> PlannedDownload:
+    return PlannedDownload(
+        f"snapshot-{notification.serial}.xml",
+        notification.snapshot.uri,
+        notification.snapshot.hash.lower(),
+        SNAPSHOT_PRIORITY,
+    )
+
+
+def _delta(delta: DeltaElement) -> PlannedDownload:
+    return PlannedDownload(
+        f"{delta.serial}.xml", delta.uri, delta.hash.lower(), DELTA_PRIORITY
+    )
+
+
+def full_plan(
+    notification: NotificationDocument,
+    reason: str,
+    skip_snapshot: bool = False,
+    limit_deltas: Optional[int] = None,
+) -> DownloadPlan:
+    """The snapshot (unless skipped) and the deltas (up to `limit_deltas`)."""
+    downloads = [] if skip_snapshot else [_snapshot(notification)]
+    for idx, delta in enumerate(notification.deltas):
+        if limit_deltas is not None and idx >= limit_deltas:
+            break
+        downloads.append(_delta(delta))
+    return DownloadPlan(FULL, downloads, reason)
+
+
+def estimate_sizes(
+    notification: NotificationDocument,
+    state: SyncState,
+    snapshot: PlannedDownload,
+    deltas: List[PlannedDownload],
+) -> None:
+    """Set the known sizes (from `state`), or an estimate when there is one."""
+    for download in [snapshot, *deltas]:
+        download.size = state.sizes.get(download.sha256, None)
+
+    if snapshot.size is None and state.snapshot_size is not None:
+        snapshot.size, snapshot.estimated = state.snapshot_size, True
+
+    known = [
+        state.sizes[delta.hash.lower()]
+        for delta in notification.deltas
+        if delta.hash.lower() in state.sizes
+    ]
+    if known:
+        mean = sum(known) // len(known)
+        for download in deltas:
+            if download.size is None:
+                download.size, download.estimated = mean, True
+
+
+async def fill_sizes(
+    limiter: DownloadLimiter,
+    session: aiohttp.ClientSession,
+    downloads: List[PlannedDownload],
+    sizes: Dict[str, int],
+    override_host: Optional[str] = None,
+    metrics: Optional[DownloadMetrics] = None,
+) -> None:
+    """Set the unknown sizes with HEAD requests, and record them in `sizes`."""
+
+    async def head(download: PlannedDownload) -> None:
+        uri = with_host(download.uri, override_host)
+        async with limiter.slot(uri, DELTA_PRIORITY):
+            try:
+                size = await probe(session, uri, metrics)
+            except (asyncio.TimeoutError, aiohttp.ClientError, HttpStatusError) as e:
+                LOG.info("HEAD %s failed: %s", uri, e)
+                return
+        if size is not None and size != UNKNOWN_SIZE:
+            download.size = sizes[download.sha256] = size
+
+    await asyncio.gather(*(head(d) for d in downloads if d.size is None))
+
+
+async def plan_downloads(
+    limiter: DownloadLimiter,
+    session: aiohttp.ClientSession,
+    notification: NotificationDocument,
+    state: Optional[SyncState],
+    skip_snapshot: bool = False,
+    limit_deltas: Optional[int] = None,
+    override_host: Optional[str] = None,
+    metrics: Optional[DownloadMetrics] = None,
+) -> DownloadPlan:
+    """
+    Plan the downloads to go from `state` to the serial of `notification`.
+
+    Without a state (or after a session reset, or when the deltas since the
+    local serial are no longer listed) the snapshot and deltas are downloaded.
+    Otherwise the cheapest of the deltas since the local serial and the
+    snapshot is chosen. The sizes that are requested are recorded in `state`.
+    """
+    if state is None:
+        return full_plan(notification, "no local state", skip_snapshot, limit_deltas)
+    if state.session_id != notification.session_id:
+        return full_plan(notification, "session reset", skip_snapshot, limit_deltas)
+    if not notification.has_delta(state.serial + 1):
+        return full_plan(
+            notification,
+            f"serial {state.serial} is no longer listed",
+            skip_snapshot,
+            limit_deltas,
+        )
+
+    deltas = DownloadPlan(
+        DELTAS,
+        [_delta(delta) for delta in notification.deltas_since(state.serial)],
+        f"from serial {state.serial}",
+    )
+    if skip_snapshot:
+        return deltas
+
+    snapshot = DownloadPlan(SNAPSHOT, [_snapshot(notification)], deltas.reason)
+    estimate_sizes(notification, state, snapshot.downloads[0], deltas.downloads)
+    await fill_sizes(
+        limiter,
+        session,
+        snapshot.downloads + deltas.downloads,
+        state.sizes,
+        override_host,
+        metrics,
+    )
+    if snapshot.size is not None and not snapshot.estimated:
+        state.snapshot_size = snapshot.size
+
+    delta_cost, snapshot_cost = deltas.cost, snapshot.cost
+    if delta_cost is None or snapshot_cost is None:
+        deltas.reason += ", sizes unknown"
+        return deltas
+
+    LOG.info(
+        "Cost of %d deltas: %d, snapshot: %d",
+        len(deltas.downloads),
+        delta_cost,
+        snapshot_cost,
+    )
+    if snapshot_cost < delta_cost:
+        snapshot.reason += f", {snapshot_cost} < {delta_cost} for the deltas"
+        return snapshot
+    deltas.reason += f", {delta_cost} <= {snapshot_cost} for the snapshot"
+    return deltas
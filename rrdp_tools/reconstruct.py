@@ -1,40 +1,74 @@
 import asyncio
-import hashlib
-import io
 import logging
 import os
 import re
-import urllib.parse
+import sys
 from collections import defaultdict
-from datetime import datetime
+from dataclasses import dataclass
 from pathlib import Path
-from typing import Dict, List, TextIO
+from typing import (
+    BinaryIO,
+    Callable,
+    Collection,
+    Dict,
+    Iterator,
+    List,
+    Optional,
+    Set,
+    TextIO,
+    Tuple,
+    Union,
+)
 
-import aiohttp
 import click
 
-from rrdp_tools.rpki import parse_file_time
-
+from .download import (
+    PART_SUFFIX,
+    VALIDATOR_SUFFIX,
+    discard_partial,
+    download_to_file,
+    resume_headers,
+    snapshot_cache_dir,
+)
+from .hash_index import hash_file
+from .repository_index import RepositoryIndex, path_for_uri, verify_index
 from .rrdp import (
     PublishElement,
-    RrdpElement,
     WithdrawElement,
+    iter_snapshot_or_delta,
     parse_notification_file,
-    parse_snapshot_or_delta,
 )
+from .timestamps import DEFAULT_PROCESSES
+from .uri_filter import UriFilter
+from .writer import DEFAULT_WRITERS, FileWriter
 
 logging.basicConfig()
 LOG = logging.getLogger(__name__)
 
 
-async def http_get_delta_or_snapshot(uri: str) -> TextIO:
+async def http_get_delta_or_snapshot(
+    uri: str, cache_path: Optional[Path] = None
+) -> Path:
+    """
+    Download the snapshot referenced by the notification file at `uri`.
+
+    The snapshot is stored in `cache_path` (default: the user cache directory)
+    and checked against the hash in the notification file. An interrupted
+    download is resumed by the next run, other snapshots in the directory are
+    removed once the download completes.
+    """
+    # Only import aiohttp when downloading
+    import aiohttp
+
     LOG.info("Downloading from %s", uri)
     async with aiohttp.ClientSession() as session:
-        response = await session.get(uri)
-        assert response.status == 200
+        async with session.get(uri) as response:
+            if response.status != 200:
+                raise ValueError(f"HTTP {response.status} for {uri}")
+            notification = parse_notification_file(await response.text())
 
-        notification = parse_notification_file(await response.text())
         uri = notification.snapshot.uri
+        expected_hash = notification.snapshot.hash.lower()
 
         LOG.info(
             "found notification.xml for serial %d with snapshot at %s",
@@ -42,69 +76,193 @@ async def http_get_delta_or_snapshot(uri: str) -> TextIO:
             uri,
         )
 
-        response = await session.get(uri)
-        assert response.status == 200
-
-        text = await response.text()
-
-        LOG.info("%s has a size of %ib", uri, len(text))
-        return io.StringIO(text)
+        cache_path = cache_path or snapshot_cache_dir(uri)
+        cache_path.mkdir(parents=True, exist_ok=True)
+        target_file = cache_path / f"{expected_hash}.xml"
+
+        if target_file.exists() and hash_file(target_file) == expected_hash:
+            LOG.info("Using cached snapshot %s", target_file)
+            return target_file
+
+        async with session.get(uri, headers=resume_headers(target_file)) as response:
+            if response.status == 416:
+                discard_partial(target_file)
+            if response.status not in (200, 206):
+                raise ValueError(f"HTTP {response.status} for {uri}")
+            await download_to_file(response, target_file, expected_hash, resume=True)
+
+    for stale in cache_path.iterdir():
+        if stale.name.startswith(expected_hash):
+            continue
+        if stale.name.endswith((".xml", PART_SUFFIX, VALIDATOR_SUFFIX)):
+            stale.unlink()
+
+    LOG.info("%s has a size of %ib", uri, target_file.stat().st_size)
+    return target_file
+
+
+def uri_matcher(filter_match: Union[List[str], UriFilter]) -> Optional[UriFilter]:
+    """
+    The filter for the regular expressions in `filter_match` (searched in the
+    URI), None when every URI is accepted.
+    """
+    uri_filter = (
+        filter_match if isinstance(filter_match, UriFilter) else UriFilter(filter_match)
+    )
+    return None if uri_filter.accepts_all else uri_filter
 
 
 def reconstruct_repo(
-    rrdp_file: TextIO,
+    rrdp_file: Union[Path, TextIO, BinaryIO],
     output_path: Path,
-    filter_match: List[str],
+    filter_match: Union[List[str], UriFilter],
     verify_only: bool = False,
     parse_for_time: bool = False,
+    strict_full_validation: bool = False,
+    writers: int = DEFAULT_WRITERS,
+    time_processes: int = DEFAULT_PROCESSES,
 ):
-    """Actually reconstruct the repository."""
-    compiled_patterns = [re.compile(pattern) for pattern in filter_match]
+    """
+    Actually reconstruct the repository.
+
+    Files are written by `writers` threads while the document is parsed, with
+    `parse_for_time` the objects are parsed by `time_processes` processes.
+
+    A snapshot replaces the tree: indexed objects that are not in the snapshot
+    are removed (reported in verify mode). A delta from another session than
+    the index is applied, but the index no longer records a serial.
+    """
+    # Verify mode does not write files, it only uses an existing index.
+    index = (
+        RepositoryIndex.open_existing(output_path)
+        if verify_only
+        else RepositoryIndex(output_path)
+    )
+
+    # Objects that do not match are skipped by the parser
+    elements = iter_snapshot_or_delta(
+        rrdp_file,
+        strict_full_validation=strict_full_validation,
+        uri_filter=uri_matcher(filter_match),
+    )
+    header = next(elements)
+    LOG.info("processing serial %d for session %s", header.serial, header.session_id)
+    session_changed = False
+    if index and header.document_type == "delta" and index.serial is not None:
+        session_changed = index.session_id != header.session_id
+        if (index.session_id, index.serial + 1) != (header.session_id, header.serial):
+            LOG.warning(
+                "Applying delta %d (session %s) to serial %d (session %s)",
+                header.serial,
+                header.session_id,
+                index.serial,
+                index.session_id,
+            )
+    writer = FileWriter(
+        0 if verify_only else writers,
+        time_processes=time_processes if parse_for_time else 0,
+    )
+    try:
+        published = apply_elements(
+            elements, output_path, verify_only, parse_for_time, index, writer
+        )
+        if index and header.document_type == "snapshot":
+            remove_stale_objects(output_path, published, index, writer, verify_only)
+    finally:
+        writer.close()
 
-    def match(uri) -> bool:
-        """Match against the regex in `filter_match` (default: accept)."""
-        if not compiled_patterns:
-            return True
+    if index:
+        if session_changed:
+            LOG.error(
+                "Delta %d is in session %s, the tree in %s: the serial is unknown",
+                header.serial,
+                header.session_id,
+                index.session_id,
+            )
+            index.clear_position()
+        else:
+            index.set_position(header.session_id, header.serial)
+        index.close()
 
-        for pattern in compiled_patterns:
-            if pattern.search(uri):
-                return True
 
-        return False
+def remove_stale_objects(
+    output_path: Path,
+    present: Collection[str],
+    index: RepositoryIndex,
+    writer: FileWriter,
+    verify_only: bool = False,
+) -> int:
+    """
+    Remove the indexed objects that are not `present`, e.g. not in a snapshot.
+
+    In verify mode they are only reported. Returns their number.
+    """
+    stale = [uri for uri, _ in index.items() if uri not in present]
+    for uri in stale:
+        if verify_only:
+            LOG.error("%s is in the index, but not present.", uri)
+            continue
+        writer.unlink(path_for_uri(output_path, uri))
+        index.discard(uri)
+    if stale:
+        LOG.info(
+            "%s %d indexed objects that are not present",
+            "Found" if verify_only else "Removed",
+            len(stale),
+        )
+    return len(stale)
+
 
-    seen_objects: Dict[str, RrdpElement] = defaultdict(set)
+def apply_elements(
+    elements: Iterator[Union[PublishElement, WithdrawElement]],
+    output_path: Path,
+    verify_only: bool,
+    parse_for_time: bool,
+    index: Optional[RepositoryIndex],
+    writer: FileWriter,
+) -> Set[str]:
+    """
+    Apply the publish and withdraw elements of a document.
+
+    Returns the (effective) URIs of the published objects.
+    """
+    # Only count the elements per URI: content is not retained.
+    seen_objects: Dict[str, int] = defaultdict(int)
+    published: Set[str] = set()
     publishes, withdraws = 0, 0
 
-    doc = parse_snapshot_or_delta(rrdp_file)
-    LOG.info("processing serial %d for session %s", doc.serial, doc.session_id)
-    for elem in doc.content:
+    for elem in elements:
         effective_uri = elem.uri
 
         if elem.uri in seen_objects:
-            h = hashlib.sha256(elem.content).hexdigest()
+            h = elem.h_content if isinstance(elem, PublishElement) else elem.hash
             LOG.error(
-                "Repeated entry: %s (appending hash to filename). previous entries: %s",
+                "Repeated entry: %s (appending hash to filename). %d previous entries",
                 elem,
                 seen_objects[elem.uri],
             )
             effective_uri = f"{elem.uri}-{h}"
 
-        seen_objects[elem.uri].add(elem)
-
-        if match(elem.uri):
-            match elem:
-                case PublishElement():
-                    handle_publish_element(
-                        output_path, verify_only, parse_for_time, elem, effective_uri
-                    )
-                    publishes += 1
-                case WithdrawElement():
-                    handle_withdraw_element(
-                        output_path, verify_only, elem, effective_uri
-                    )
-                    withdraws += 1
-        else:
-            LOG.debug("skipped '%s': did not match filter.", elem.uri)
+        seen_objects[elem.uri] += 1
+
+        match elem:
+            case PublishElement():
+                handle_publish_element(
+                    output_path,
+                    verify_only,
+                    parse_for_time,
+                    elem,
+                    effective_uri,
+                    index,
+                    writer,
+                )
+                published.add(effective_uri)
+                publishes += 1
+            case WithdrawElement():
+                handle_withdraw_element(
+                    output_path, verify_only, elem, effective_uri, index, writer
+                )
+                withdraws += 1
 
     LOG.info(
         "Processed %i (%i published, %i withdrawn) files to %s",
@@ -113,14 +271,240 @@ def reconstruct_repo(
         withdraws,
         output_path,
     )
+    return published
+
+
+@dataclass
+class ArchivedDocument:
+    path: Path
+    document_type: str
+    session_id: str
+    serial: int
+
+
+def scan_documents(directory: Path) -> List[ArchivedDocument]:
+    """The snapshots and deltas in a directory (and its subdirectories)."""
+    documents = []
+    for path in sorted(directory.rglob("*.xml*")):
+        if (
+            not path.is_file()
+            or path.name.startswith(".")
+            or path.name.endswith((PART_SUFFIX, VALIDATOR_SUFFIX))
+        ):
+            continue
+        elements = iter_snapshot_or_delta(path)
+        try:
+            header = next(elements)
+        except Exception as e:
+            LOG.debug("Skipping %s: %s", path, e)
+            continue
+        finally:
+            elements.close()
+        documents.append(
+            ArchivedDocument(
+                path, header.document_type, header.session_id, header.serial
+            )
+        )
+    return documents
+
+
+def plan_chain(
+    documents: List[ArchivedDocument], target_serial: int
+) -> List[ArchivedDocument]:
+    """
+    The snapshot and deltas to apply (in order) to reach `target_serial`.
+
+    The most recent snapshot at or before `target_serial` for which all the
+    deltas up to `target_serial` are present (in the same session) is used.
+    Raises a ValueError describing the gap or session change otherwise.
+    """
+    snapshots = sorted(
+        (
+            d
+            for d in documents
+            if d.document_type == "snapshot" and d.serial <= target_serial
+        ),
+        key=lambda d: d.serial,
+        reverse=True,
+    )
+    if not snapshots:
+        raise ValueError(f"No snapshot with a serial of at most {target_serial}")
+
+    deltas: Dict[Tuple[str, int], ArchivedDocument] = {}
+    for d in documents:
+        if d.document_type == "delta":
+            deltas.setdefault((d.session_id, d.serial), d)
+
+    problems = []
+    for snapshot in snapshots:
+        chain = [snapshot]
+        for serial in range(snapshot.serial + 1, target_serial + 1):
+            delta = deltas.get((snapshot.session_id, serial), None)
+            if delta is None:
+                sessions = sorted(s for s, n in deltas if n == serial)
+                if sessions:
+                    problems.append(
+                        f"delta {serial} after {snapshot.path.name} is in session "
+                        f"{', '.join(sessions)}, not {snapshot.session_id}"
+                    )
+                else:
+                    problems.append(
+                        f"delta {serial} after {snapshot.path.name} is missing"
+                    )
+                break
+            chain.append(delta)
+        else:
+            return chain
+
+    raise ValueError(f"Can not reach serial {target_serial}: {'; '.join(problems)}")
+
+
+def fold_chain(
+    chain: List[ArchivedDocument],
+    uri_filter: Optional[Callable[[str], bool]] = None,
+    strict_full_validation: bool = False,
+) -> Dict[str, PublishElement]:
+    """
+    Apply the deltas in `chain` to the snapshot, in memory.
+
+    Returns the objects (by URI) that are present after the last document.
+    Hashes in publish and withdraw elements are checked against the state.
+    """
+    state: Dict[str, PublishElement] = {}
+    dropped = 0
+    for document in chain:
+        elements = iter_snapshot_or_delta(
+            document.path,
+            strict_full_validation=strict_full_validation,
+            uri_filter=uri_filter,
+        )
+        header = next(elements)
+        LOG.info(
+            "applying %s %d (%s)", header.document_type, header.serial, document.path
+        )
+        for elem in elements:
+            current = state.get(elem.uri, None)
+            match elem:
+                case PublishElement():
+                    if header.document_type == "snapshot":
+                        if current is not None:
+                            LOG.error("Repeated entry in snapshot: %s", elem.uri)
+                    elif current is None:
+                        if elem.previous_hash:
+                            LOG.error(
+                                "publish %s %s: object not present.",
+                                elem.uri,
+                                elem.previous_hash,
+                            )
+                    elif not elem.previous_hash:
+                        LOG.error(
+                            "publish %s without hash: object is present.", elem.uri
+                        )
+                    elif elem.previous_hash.lower() != current.h_content:
+                        LOG.error(
+                            "Hash mismatch for %s: %s (state) %s (publish)",
+                            elem.uri,
+                            current.h_content,
+                            elem.previous_hash,
+                        )
+                    state[elem.uri] = elem
+                case WithdrawElement():
+                    if current is None:
+                        LOG.error(
+                            "withdraw %s %s: object not present.", elem.uri, elem.hash
+                        )
+                        continue
+                    if current.h_content != elem.hash.lower():
+                        LOG.error(
+                            "Hash mismatch for %s: %s (state) %s (withdraw)",
+                            elem.uri,
+                            current.h_content,
+                            elem.hash,
+                        )
+                    del state[elem.uri]
+                    dropped += 1
+
+    LOG.info(
+        "%d objects at serial %d, %d withdrawn while applying %d deltas",
+        len(state),
+        chain[-1].serial,
+        dropped,
+        len(chain) - 1,
+    )
+    return state
+
+
+def reconstruct_serial(
+    directory: Path,
+    target_serial: int,
+    output_path: Path,
+    filter_match: Union[List[str], UriFilter],
+    verify_only: bool = False,
+    parse_for_time: bool = False,
+    strict_full_validation: bool = False,
+    writers: int = DEFAULT_WRITERS,
+    time_processes: int = DEFAULT_PROCESSES,
+) -> Dict[str, PublishElement]:
+    """
+    Reconstruct the repository at `target_serial` from the snapshot and deltas
+    in `directory`.
+
+    The deltas are applied in memory: only the objects that are present at
+    `target_serial` are written, objects that are published and withdrawn
+    within the chain never touch the filesystem. Indexed objects in
+    `output_path` that are not present at `target_serial` are removed.
+    """
+    chain = plan_chain(scan_documents(directory), target_serial)
+    LOG.info(
+        "serial %d of session %s: %s",
+        target_serial,
+        chain[0].session_id,
+        ", ".join(d.path.name for d in chain),
+    )
+    state = fold_chain(chain, uri_matcher(filter_match), strict_full_validation)
+
+    if not verify_only:
+        with RepositoryIndex(output_path) as index:
+            with FileWriter(
+                writers, time_processes=time_processes if parse_for_time else 0
+            ) as writer:
+                for uri, elem in state.items():
+                    file_path = path_for_uri(output_path, uri)
+                    assert output_path in file_path.parents
+                    write_object(file_path, parse_for_time, elem, index, uri, writer)
+                remove_stale_objects(output_path, state, index, writer)
+            index.set_position(chain[-1].session_id, chain[-1].serial)
+        LOG.info("Wrote %d files to %s", len(state), output_path)
+    return state
+
+
+def sha256_on_disk(
+    file_path: Path, uri: str, index: Optional[RepositoryIndex]
+) -> Optional[str]:
+    """
+    The hash of the object at `uri`, None if it does not exist.
+
+    Taken from the index when the object is in it, the file is only read for
+    objects that were not written by reconstruct-repo.
+    """
+    if index:
+        sha256 = index.sha256(uri)
+        if sha256 is not None:
+            return sha256
+    return hash_file(file_path) if file_path.exists() else None
 
 
 def handle_withdraw_element(
-    output_path, verify_only, elem: WithdrawElement, effective_uri
+    output_path,
+    verify_only,
+    elem: WithdrawElement,
+    effective_uri,
+    index: Optional[RepositoryIndex] = None,
+    writer: Optional[FileWriter] = None,
 ):
-    file_path = output_path / f"./{urllib.parse.urlparse(effective_uri).path}"
-    if file_path.exists():
-        h_disk = hashlib.sha256(file_path.read_bytes()).hexdigest()
+    file_path = path_for_uri(output_path, effective_uri)
+    h_disk = sha256_on_disk(file_path, effective_uri, index)
+    if h_disk is not None:
 
         if h_disk != elem.hash:
             LOG.error(
@@ -131,24 +515,34 @@ def handle_withdraw_element(
             )
 
         if not verify_only:
-            file_path.unlink()
+            if writer:
+                writer.unlink(file_path)
+            else:
+                file_path.unlink(missing_ok=True)
+            if index:
+                index.discard(effective_uri)
             LOG.debug("Removed '%s'", file_path)
     else:
         LOG.error("withdraw %s %s: file not found.", elem.uri, elem.hash)
 
 
 def handle_publish_element(
-    output_path, verify_only, parse_for_time, elem: PublishElement, effective_uri
+    output_path,
+    verify_only,
+    parse_for_time,
+    elem: PublishElement,
+    effective_uri,
+    index: Optional[RepositoryIndex] = None,
+    writer: Optional[FileWriter] = None,
 ):
-    tokens = urllib.parse.urlparse(effective_uri)
-    file_path = output_path / f"./{tokens.path}"
+    file_path = path_for_uri(output_path, effective_uri)
     # Ensure that output dir is a subdirectory and create if necessary
     assert output_path in file_path.parents
 
     # publish with hash -> overwrite, check old hash
     if elem.previous_hash:
-        if file_path.exists():
-            h_disk = hashlib.sha256(file_path.read_bytes()).hexdigest()
+        h_disk = sha256_on_disk(file_path, effective_uri, index)
+        if h_disk is not None:
             if h_disk != elem.previous_hash:
                 LOG.error(
                     "Hash mismatch for %s: %s (disk) %s (publish)",
@@ -164,24 +558,28 @@ def handle_publish_element(
             )
 
     if not verify_only:
-        file_path.parent.mkdir(parents=True, exist_ok=True)
-
-        with open(file_path, "wb") as f:
-            # Accept empty publish tags/empty files
-            f.write(elem.content)
-
-        LOG.debug("Wrote '%s' to '%s'", elem.uri, file_path)
-
-        # Update modification time
-        if parse_for_time:
-            file_date = parse_file_time(file_path.name, elem.content)
-            os.utime(
-                file_path,
-                (
-                    datetime.timestamp(file_date),
-                    datetime.timestamp(file_date),
-                ),
-            )
+        write_object(file_path, parse_for_time, elem, index, effective_uri, writer)
+
+
+def write_object(
+    file_path: Path,
+    parse_for_time: bool,
+    elem: PublishElement,
+    index: Optional[RepositoryIndex] = None,
+    uri: Optional[str] = None,
+    writer: Optional[FileWriter] = None,
+) -> None:
+    """
+    Write the content of a publish element to `file_path`.
+
+    The file is written by `writer` (when given) and may not be present yet
+    when this returns. The index is updated immediately.
+    """
+    (writer or FileWriter(workers=0)).write(file_path, elem.content, parse_for_time)
+    LOG.debug("Wrote '%s' to '%s'", elem.uri, file_path)
+
+    if index:
+        index.update(uri or elem.uri, elem.h_content, len(elem.content))
 
 
 def do_exit():
@@ -191,9 +589,30 @@ def do_exit():
     ctx.exit(2)
 
 
+def report_index(index_dir: Path, check_hashes: bool) -> bool:
+    """Print the differences between the index and the files, if any."""
+    try:
+        report = verify_index(index_dir, check_hashes=check_hashes)
+    except ValueError as e:
+        click.echo(click.style(str(e), fg="red", bold=True))
+        return False
+
+    click.echo(
+        f"{report.objects} objects at serial {report.serial} "
+        f"(session {report.session_id})"
+    )
+    for uri in report.missing:
+        click.echo(f"missing: {uri}")
+    for uri in report.changed:
+        click.echo(f"changed: {uri}")
+    for path in report.untracked:
+        click.echo(f"untracked: {path}")
+    return report.consistent
+
+
 @click.command("reconstruct-repo")
-@click.argument("infile", type=str)
-@click.argument("output_dir", type=click.Path(path_type=Path))
+@click.argument("infile", type=str, required=False)
+@click.argument("output_dir", type=click.Path(path_type=Path), required=False)
 @click.option("--create-target", help="Create target directory", is_flag=True)
 @click.option(
     "--filename-pattern",
@@ -201,6 +620,18 @@ def do_exit():
     type=str,
     multiple=True,
 )
+@click.option(
+    "--uri-prefix",
+    help="optional: only objects with a URI that starts with this prefix",
+    type=str,
+    multiple=True,
+)
+@click.option(
+    "--extension",
+    help="optional: only objects with this extension (e.g. mft)",
+    type=str,
+    multiple=True,
+)
 @click.option("--verify-only", help="verify mode: do not write any files", is_flag=True)
 @click.option("-v", "--verbose", help="verbose", is_flag=True)
 @click.option(
@@ -209,21 +640,84 @@ def do_exit():
     is_flag=True,
     default=True,
 )
+@click.option(
+    "--strict-full-validation",
+    help="Validate the complete document against the RelaxNG schema before processing",
+    is_flag=True,
+)
+@click.option(
+    "--target-serial",
+    help="Apply the snapshot and deltas in the INFILE directory up to this serial",
+    type=int,
+    default=None,
+)
+@click.option(
+    "--verify-index",
+    "index_dir",
+    help="Compare the index of a reconstructed repository with its files",
+    type=click.Path(exists=True, file_okay=False, path_type=Path),
+    default=None,
+)
+@click.option(
+    "--check-hashes",
+    help="With --verify-index: also compare the hashes of the files",
+    is_flag=True,
+)
+@click.option(
+    "--writers",
+    help="Number of threads writing files (0: write from the parser thread)",
+    type=click.IntRange(min=0),
+    default=DEFAULT_WRITERS,
+    show_default=True,
+)
+@click.option(
+    "--time-processes",
+    help="Number of processes parsing objects for --parse-for-time (0: parse in the writer threads)",
+    type=click.IntRange(min=0),
+    default=DEFAULT_PROCESSES,
+    show_default=True,
+)
 def reconstruct_repo_command(
-    infile: str,
-    output_dir: Path,
+    infile: Optional[str],
+    output_dir: Optional[Path],
     create_target: bool,
     filename_pattern: List[str],
+    uri_prefix: List[str],
+    extension: List[str],
     verify_only: bool = False,
     verbose: bool = False,
     parse_for_time: bool = False,
+    strict_full_validation: bool = False,
+    target_serial: Optional[int] = None,
+    index_dir: Optional[Path] = None,
+    check_hashes: bool = False,
+    writers: int = DEFAULT_WRITERS,
+    time_processes: int = DEFAULT_PROCESSES,
 ):
-    """Call the main reconstruct function with the correct arguments."""
+    """
+    Reconstruct the files in a snapshot or delta
+
+    INFILE is a (compressed) snapshot or delta file, or the URL of a
+    notification file. With --target-serial, INFILE is a directory with
+    snapshots and deltas (e.g. written by snapshot-rrdp) that are applied in
+    memory to write the state at that serial.
+
+    The hashes and sizes of the files that are written are kept in an index
+    in OUTPUT_DIR, --verify-index compares it with the files.
+    """
     if verbose:
         logging.getLogger().setLevel(logging.DEBUG)
     else:
         logging.getLogger().setLevel(logging.INFO)
 
+    if index_dir is not None:
+        sys.exit(0 if report_index(index_dir.resolve(), check_hashes) else 1)
+
+    if infile is None or output_dir is None:
+        raise click.UsageError("INFILE and OUTPUT_DIR are required")
+
+    uri_filter = UriFilter(filename_pattern, uri_prefix, extension)
+
     output_dir = output_dir.resolve()
 
     if not output_dir.is_dir():
@@ -258,6 +752,31 @@ def reconstruct_repo_command(
             )
             do_exit()
 
+    if target_serial is not None:
+        if not Path(infile).is_dir():
+            click.echo(
+                click.style(
+                    f"Input directory {infile} does not exist", fg="red", bold=True
+                )
+            )
+            do_exit()
+        try:
+            reconstruct_serial(
+                Path(infile),
+                target_serial,
+                output_dir,
+                uri_filter,
+                verify_only=verify_only,
+                parse_for_time=parse_for_time,
+                strict_full_validation=strict_full_validation,
+                writers=writers,
+                time_processes=time_processes,
+            )
+        except ValueError as e:
+            click.echo(click.style(str(e), fg="red", bold=True))
+            sys.exit(1)
+        return
+
     if re.match("^http(s)?://", infile):
         infile_io = asyncio.run(http_get_delta_or_snapshot(infile))
     else:
@@ -268,14 +787,18 @@ def reconstruct_repo_command(
             )
             do_exit()
 
-        infile_io = p.open("r", encoding="utf-8")
+        # (compressed) files are opened by the parser
+        infile_io = p
 
     reconstruct_repo(
         infile_io,
         output_dir,
-        filename_pattern,
+        uri_filter,
         verify_only=verify_only,
         parse_for_time=parse_for_time,
+        strict_full_validation=strict_full_validation,
+        writers=writers,
+        time_processes=time_processes,
     )
 
 
@@ -0,0 +1,139 @@
+"""
+Index of the objects in a reconstructed repository.
+
+`reconstruct-repo` records the session and serial it applied last, and the
+SHA-256 and size of every object it wrote (by URI). The hashes in publish and
+withdraw elements are checked against the index, so the files on disk are not
+read again. `verify_index` reconciles the index with the files in the tree.
+"""
+import logging
+import os
+import urllib.parse
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Iterator, List, Optional, Tuple
+
+from .disk_index import DiskIndex
+from .hash_index import INDEX_DIR_NAME as HASH_INDEX_DIR_NAME
+from .hash_index import hash_file
+
+LOG = logging.getLogger(__name__)
+
+INDEX_DIR_NAME = ".rrdp-repository-index"
+
+# Not valid as (rsync) URIs, so they do not collide with objects
+SESSION_ID_KEY = "session_id"
+SERIAL_KEY = "serial"
+
+
+def path_for_uri(root: Path, uri: str) -> Path:
+    """The file for an object below `root`."""
+    return root / f"./{urllib.parse.urlparse(uri).path}"
+
+
+class RepositoryIndex(DiskIndex):
+    """uri -> (sha256, size) for the objects below `root`, and its serial."""
+
+    INDEX_DIR_NAME = INDEX_DIR_NAME
+
+    @property
+    def session_id(self) -> Optional[str]:
+        return self.cache.get(SESSION_ID_KEY)
+
+    @property
+    def serial(self) -> Optional[int]:
+        return self.cache.get(SERIAL_KEY)
+
+    def set_position(self, session_id: str, serial: int) -> None:
+        """Record the session and serial of the document that was applied."""
+        if not self.readonly:
+            self.cache.set(SESSION_ID_KEY, session_id)
+            self.cache.set(SERIAL_KEY, serial)
+
+    def clear_position(self) -> None:
+        """Forget the session and serial, e.g. when the tree matches neither."""
+        if not self.readonly:
+            self.cache.delete(SESSION_ID_KEY)
+            self.cache.delete(SERIAL_KEY)
+
+    def get(self, uri: str) -> Optional[Tuple[str, int]]:
+        """The (sha256, size) of an object."""
+        return self.cache.get(uri)
+
+    def sha256(self, uri: str) -> Optional[str]:
+        entry = self.get(uri)
+        return entry[0] if entry is not None else None
+
+    def update(self, uri: str, sha256: str, size: int) -> None:
+        if not self.readonly:
+            self.cache.set(uri, (sha256, size))
+
+    def items(self) -> Iterator[Tuple[str, Tuple[str, int]]]:
+        for key in self.cache.iterkeys():
+            if key not in (SESSION_ID_KEY, SERIAL_KEY):
+                yield key, self.cache[key]
+
+
+@dataclass
+class IndexReport:
+    session_id: Optional[str] = None
+    serial: Optional[int] = None
+    objects: int = 0
+    # URIs in the index without a file
+    missing: List[str] = field(default_factory=list)
+    # URIs with a file of another size (or hash, when checked)
+    changed: List[str] = field(default_factory=list)
+    # files that are not in the index
+    untracked: List[Path] = field(default_factory=list)
+
+    @property
+    def consistent(self) -> bool:
+        return not (self.missing or self.changed or self.untracked)
+
+
+def verify_index(root: Path, check_hashes: bool = False) -> IndexReport:
+    """
+    Compare the index with the files below `root`.
+
+    Only the sizes of the files are compared, unless `check_hashes` is set.
+    Raises a ValueError when there is no index.
+    """
+    index = RepositoryIndex.open_existing(root)
+    if index is None:
+        raise ValueError(f"No index in {root}")
+
+    report = IndexReport()
+    expected = set()
+    with index:
+        report.session_id, report.serial = index.session_id, index.serial
+        for uri, (sha256, size) in index.items():
+            report.objects += 1
+            path = path_for_uri(root, uri)
+            expected.add(path)
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                report.missing.append(uri)
+                continue
+            if stat.st_size != size or (check_hashes and hash_file(path) != sha256):
+                report.changed.append(uri)
+
+    for dirpath, dirnames, filenames in os.walk(root):
+        if Path(dirpath) == root:
+            dirnames[:] = [
+                d for d in dirnames if d not in (INDEX_DIR_NAME, HASH_INDEX_DIR_NAME)
+            ]
+        for name in filenames:
+            path = Path(dirpath) / name
+            if path not in expected:
+                report.untracked.append(path)
+
+    LOG.info(
+        "%d objects at serial %s: %d missing, %d changed, %d untracked",
+        report.objects,
+        report.serial,
+        len(report.missing),
+        len(report.changed),
+        len(report.untracked),
+    )
+    return report
@@ -1,25 +1,43 @@
+import functools
 import logging
 from dataclasses import dataclass
 from datetime import datetime
 from pathlib import Path
 from typing import FrozenSet, Optional
 
-import asn1tools
 from asn1crypto import cms, crl, x509
 
+from rrdp_tools.user_cache import user_cache_dir
+
 LOG = logging.getLogger(__name__)
 
 THIS_DIR = Path(__file__).parent
 
 asn1_src = THIS_DIR / "rfc9286.asn"
 assert asn1_src.exists()
-# Try to cache the ASN1 if possible
-try:
-    RFC_9286_ASN1 = asn1tools.compile_files(
-        str(asn1_src), cache_dir=str(THIS_DIR / "asn1")
-    )
-except:  # noqa
-    RFC_9286_ASN1 = asn1tools.compile_files(str(asn1_src), cache_dir=None)
+
+
+@functools.cache
+def get_rfc_9286_asn1():
+    """Compile the manifest ASN.1 module on first use."""
+    # asn1tools is slow to import: only do so when manifests are parsed
+    import asn1tools
+
+    # Try to cache the ASN1 if possible
+    try:
+        return asn1tools.compile_files(
+            str(asn1_src), cache_dir=str(user_cache_dir("asn1"))
+        )
+    except:  # noqa
+        return asn1tools.compile_files(str(asn1_src), cache_dir=None)
+
+
+def __getattr__(name: str):
+    # `RFC_9286_ASN1` is compiled on first use
+    if name == "RFC_9286_ASN1":
+        return get_rfc_9286_asn1()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 
 ID_AD_SIGNED_OBJECT = "1.3.6.1.5.5.7.48.11"
 
@@ -87,7 +105,7 @@ class ManifestInfo:
 def parse_manifest(content: bytes) -> ManifestInfo:
     so = parse_rpki_signed_object(content)
 
-    mft = RFC_9286_ASN1.decode(
+    mft = get_rfc_9286_asn1().decode(
         "Manifest",
         so.content,
     )
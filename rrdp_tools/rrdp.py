@@ -2,22 +2,56 @@
 https://tools.ietf.org/html/rfc8182
 """
 import base64
+import bisect
+import collections
+import functools
 import hashlib
+import itertools
 import logging
-from dataclasses import dataclass
-from typing import Generator, List, Optional, TextIO, Union
+import os
+import re
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import (
+    Any,
+    BinaryIO,
+    Callable,
+    Dict,
+    Generator,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    TextIO,
+    Union,
+)
 from xml.etree import ElementTree as ET
 
 from lxml import etree
 from lxml.etree import RelaxNG
 
+from rrdp_tools.compression import open_rrdp_file
+
 LOG = logging.getLogger(__name__)
 
 NS_RRDP = "http://www.ripe.net/rpki/rrdp"
 NS_ET = f"{{{NS_RRDP}}}"
 
-SCHEMA = RelaxNG.from_rnc_string(
-    """
+# Size of the chunks fed to the incremental parser
+READ_CHUNK_SIZE = 64 * 1024
+# Number of elements that are decoded by a worker thread at a time
+DECODE_BATCH_SIZE = 256
+# Number of content bytes that are base64 encoded at a time (multiple of 3)
+ENCODE_CHUNK_SIZE = 3 * 16 * 1024
+
+THIS_DIR = Path(__file__).parent
+
+# Compiled from SCHEMA_RNC, tests check that it is up to date.
+SCHEMA_RNG = THIS_DIR / "rrdp.rng"
+
+SCHEMA_RNC = """
 #
 # RELAX NG schema for the RPKI Repository Delta Protocol (RRDP).
 #
@@ -86,7 +120,19 @@ delta_element |= element withdraw {
 # comment-start-skip: "#[ \\t]*"
 # End:
 """
-)
+
+
+@functools.cache
+def get_schema() -> RelaxNG:
+    """Load the (precompiled) RelaxNG schema on first use."""
+    return RelaxNG(etree.parse(str(SCHEMA_RNG)))
+
+
+def __getattr__(name: str):
+    # `SCHEMA` is loaded on first use
+    if name == "SCHEMA":
+        return get_schema()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 class UnexpectedDocumentException(Exception):
@@ -94,25 +140,90 @@ class UnexpectedDocumentException(Exception):
 
 
 class ValidationException(Exception):
-    pass
+    def __init__(
+        self,
+        message,
+        bytes_read: Optional[int] = None,
+        line: Optional[int] = None,
+    ) -> None:
+        super().__init__(message)
+        # Bytes fed to the parser when the violation was detected: the
+        # offending element is on `line`, before this position.
+        self.bytes_read = bytes_read
+        self.line = line
 
 
 def validate(doc) -> None:
     try:
-        SCHEMA.assert_(doc)
+        get_schema().assert_(doc)
     except AssertionError as e:
         raise ValidationException(e)
 
 
-@dataclass(unsafe_hash=True)
 class PublishElement:
-    uri: str
-    previous_hash: Optional[str]
-    content: bytes
-    h_content: Union[str, None] = None
+    """
+    A publish element.
 
-    def __post_init__(self) -> None:
-        self.h_content = hashlib.sha256(self.content).hexdigest()
+    The content is kept as the (base64) text of the element until it is
+    accessed, the SHA-256 digest of the content is computed on first use.
+    """
+
+    __slots__ = ("uri", "previous_hash", "_content_b64", "_content", "_digest")
+    __match_args__ = ("uri", "previous_hash", "content")
+
+    def __init__(
+        self,
+        uri: str,
+        previous_hash: Optional[str],
+        content: Optional[bytes] = None,
+        content_b64: Optional[str | bytes] = None,
+    ) -> None:
+        self.uri = uri
+        self.previous_hash = previous_hash
+        self._content = content
+        self._content_b64 = content_b64 if content is None else None
+        self._digest: Optional[bytes] = None
+
+    @property
+    def content(self) -> bytes:
+        if self._content is None:
+            self._content = (
+                base64.b64decode(self._content_b64) if self._content_b64 else b""
+            )
+            self._content_b64 = None
+        return self._content
+
+    @property
+    def digest(self) -> bytes:
+        """The raw SHA-256 digest of the content."""
+        if self._digest is None:
+            self._digest = hashlib.sha256(self.content).digest()
+        return self._digest
+
+    @property
+    def h_content(self) -> str:
+        return self.digest.hex()
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, PublishElement):
+            return NotImplemented
+        return (self.uri, self.previous_hash, self.digest) == (
+            other.uri,
+            other.previous_hash,
+            other.digest,
+        )
+
+    def __hash__(self) -> int:
+        return hash((self.uri, self.previous_hash, self.digest))
+
+    def as_dict(self) -> Dict[str, Any]:
+        """The fields of the element, e.g. for a row of a dataframe."""
+        return {
+            "uri": self.uri,
+            "previous_hash": self.previous_hash,
+            "content": self.content,
+            "h_content": self.h_content,
+        }
 
     def __repr__(self) -> str:
         return f"PublishElement[uri={self.uri}, previous_hash={self.previous_hash if self.previous_hash else 'N/A'}, sha256(content)={self.h_content}b"
@@ -125,12 +236,27 @@ class PublishElement:
         node = ET.SubElement(parent, "{http://www.ripe.net/rpki/rrdp}publish", attribs)
         node.text = base64.b64encode(self.content).decode("utf-8")
 
+    def write_xml(self, xf: etree.xmlfile) -> None:
+        attribs = {"uri": self.uri}
+        if self.previous_hash:
+            attribs["hash"] = self.previous_hash
+
+        with xf.element("{http://www.ripe.net/rpki/rrdp}publish", attribs):
+            content = memoryview(self.content)
+            for idx in range(0, len(content), ENCODE_CHUNK_SIZE):
+                chunk = content[idx : idx + ENCODE_CHUNK_SIZE]
+                xf.write(base64.b64encode(chunk).decode("ascii"))
 
-@dataclass(unsafe_hash=True)
+
+@dataclass(unsafe_hash=True, slots=True)
 class WithdrawElement:
     uri: str
     hash: str
 
+    def as_dict(self) -> Dict[str, Any]:
+        """The fields of the element, e.g. for a row of a dataframe."""
+        return {"uri": self.uri, "hash": self.hash}
+
     def __repr__(self) -> str:
         return f"WithdrawElement[uri={self.uri}, hash={self.hash}"
 
@@ -138,10 +264,24 @@ class WithdrawElement:
         attribs = {NS_ET + "uri": self.uri, NS_ET + "hash": self.hash}
         ET.SubElement(parent, "{http://www.ripe.net/rpki/rrdp}withdraw", attribs)
 
+    def write_xml(self, xf: etree.xmlfile) -> None:
+        attribs = {"uri": self.uri, "hash": self.hash}
+        with xf.element("{http://www.ripe.net/rpki/rrdp}withdraw", attribs):
+            pass
+
 
 RrdpElement = Union[PublishElement, WithdrawElement]
 
 
+@dataclass
+class DocumentHeader:
+    """The attributes of the root element of a snapshot or delta document."""
+
+    document_type: str
+    serial: int
+    session_id: str
+
+
 @dataclass
 class SnapshotElement:
     hash: str
@@ -172,6 +312,12 @@ class DeltaDocument:
     def __str__(self) -> str:
         return ET.tostring(self.to_xml(), default_namespace=NS_RRDP).decode("utf-8")
 
+    def write_to(self, stream: BinaryIO) -> str:
+        """Incrementally write the document, returns the SHA-256 of the output."""
+        return write_document(
+            stream, "delta", self.serial, self.session_id, self.content
+        )
+
 
 @dataclass
 class SnapshotDocument:
@@ -193,6 +339,12 @@ class SnapshotDocument:
     def __str__(self) -> str:
         return ET.tostring(self.to_xml(), default_namespace=NS_RRDP).decode("utf-8")
 
+    def write_to(self, stream: BinaryIO) -> str:
+        """Incrementally write the document, returns the SHA-256 of the output."""
+        return write_document(
+            stream, "snapshot", self.serial, self.session_id, self.content
+        )
+
 
 @dataclass
 class DeltaElement:
@@ -202,7 +354,7 @@ class DeltaElement:
 
     def to_xml(self, parent: ET.Element) -> None:
         attribs = {
-            NS_ET + "serial": self.serial,
+            NS_ET + "serial": str(self.serial),
             NS_ET + "hash": self.hash,
             NS_ET + "uri": self.uri,
         }
@@ -210,13 +362,89 @@ class DeltaElement:
         ET.SubElement(parent, "{http://www.ripe.net/rpki/rrdp}delta", attribs)
 
 
+@dataclass
+class NotificationDiff:
+    """The changes between two successive notification files."""
+
+    new_deltas: list[DeltaElement]
+    dropped_deltas: list[DeltaElement]
+    session_reset: bool
+    # (previous, current) for deltas with the same serial and a different hash
+    hash_changes: list[tuple[DeltaElement, DeltaElement]]
+
+
 @dataclass
 class NotificationDocument:
+    """
+    A notification file.
+
+    `deltas` is kept in document order. The deltas are also indexed by serial
+    when the document is created, `deltas` should not be modified afterwards.
+    """
+
     snapshot: SnapshotElement
     deltas: list[DeltaElement]
     serial: int
     session_id: str
 
+    serials: array = field(init=False, repr=False, compare=False)
+    _sorted_deltas: list[DeltaElement] = field(init=False, repr=False, compare=False)
+    _by_serial: dict[int, DeltaElement] = field(init=False, repr=False, compare=False)
+
+    def __post_init__(self) -> None:
+        self._sorted_deltas = sorted(self.deltas, key=lambda delta: delta.serial)
+        self.serials = array("Q", (delta.serial for delta in self._sorted_deltas))
+        self._by_serial = {delta.serial: delta for delta in self._sorted_deltas}
+
+    def get_delta(self, serial: int) -> Optional[DeltaElement]:
+        return self._by_serial.get(serial, None)
+
+    def has_delta(self, serial: int) -> bool:
+        return serial in self._by_serial
+
+    def deltas_since(self, serial: int) -> list[DeltaElement]:
+        """The deltas with a serial larger than `serial` in ascending order."""
+        return self._sorted_deltas[bisect.bisect_right(self.serials, serial) :]
+
+    def diff(
+        self, previous: "NotificationDocument", check_all_hashes: bool = False
+    ) -> NotificationDiff:
+        """
+        Compare to the previous version of this notification file.
+
+        New and dropped deltas are found by bisecting the serials, the cost is
+        proportional to the number of new and dropped deltas. Only the hash of
+        the most recent delta listed in both files is compared, unless
+        `check_all_hashes` is set (proportional to the number of deltas).
+        """
+        if previous.session_id != self.session_id:
+            return NotificationDiff(
+                new_deltas=list(self._sorted_deltas),
+                dropped_deltas=list(previous._sorted_deltas),
+                session_reset=True,
+                hash_changes=[],
+            )
+
+        new_start = bisect.bisect_right(self.serials, previous.serial)
+        first_serial = self.serials[0] if self.serials else self.serial + 1
+        dropped_end = bisect.bisect_left(previous.serials, first_serial)
+
+        # Deltas listed in both files
+        current_overlap = self._sorted_deltas[:new_start]
+
+        hash_changes = []
+        for delta in current_overlap if check_all_hashes else current_overlap[-1:]:
+            before = previous.get_delta(delta.serial)
+            if before is not None and before.hash != delta.hash:
+                hash_changes.append((before, delta))
+
+        return NotificationDiff(
+            new_deltas=self._sorted_deltas[new_start:],
+            dropped_deltas=previous._sorted_deltas[:dropped_end],
+            session_reset=False,
+            hash_changes=hash_changes,
+        )
+
     def to_xml(self) -> ET.Element:
         attribs = {
             NS_ET + "serial": str(self.serial),
@@ -233,6 +461,43 @@ class NotificationDocument:
         return ET.tostring(self.to_xml(), default_namespace=NS_RRDP).decode("utf-8")
 
 
+class HashingWriter:
+    """Pass writes through to a stream while computing their SHA-256."""
+
+    def __init__(self, stream: BinaryIO) -> None:
+        self.stream = stream
+        self.sha256 = hashlib.sha256()
+
+    def write(self, data: bytes) -> int:
+        self.sha256.update(data)
+        return self.stream.write(data)
+
+
+def write_document(
+    stream: BinaryIO,
+    document_type: str,
+    serial: int,
+    session_id: str,
+    content: Iterable[RrdpElement],
+) -> str:
+    """
+    Write a snapshot or delta document one element at a time.
+
+    `content` can be any iterable (e.g. the output of `iter_snapshot_or_delta`)
+    and the content of elements is base64 encoded in chunks. Returns the
+    SHA-256 of the written document, as used in a notification file.
+    """
+    writer = HashingWriter(stream)
+    attribs = {"serial": str(serial), "session_id": session_id, "version": "1"}
+
+    with etree.xmlfile(writer, encoding="utf-8") as xf:
+        with xf.element(NS_ET + document_type, attribs, nsmap={None: NS_RRDP}):
+            for elem in content:
+                elem.write_xml(xf)
+
+    return writer.sha256.hexdigest()
+
+
 def parse_notification_file(notificiation_file: TextIO) -> NotificationDocument:
     huge_parser = etree.XMLParser(encoding="utf-8", recover=False, huge_tree=True)
     doc = etree.fromstring(notificiation_file, parser=huge_parser)
@@ -249,7 +514,7 @@ def parse_notification_file(notificiation_file: TextIO) -> NotificationDocument:
 
     deltas = [
         DeltaElement(
-            serial=delta.attrib["serial"],
+            serial=int(delta.attrib["serial"]),
             hash=delta.attrib["hash"],
             uri=delta.attrib["uri"],
         )
@@ -265,8 +530,13 @@ def parse_notification_file(notificiation_file: TextIO) -> NotificationDocument:
 
 
 def parse_snapshot_or_delta(
-    snapshot_or_delta: TextIO,
+    snapshot_or_delta: Union[str, os.PathLike, TextIO, BinaryIO],
+    workers: Optional[int] = None,
 ) -> DeltaDocument | SnapshotDocument:
+    if isinstance(snapshot_or_delta, (str, os.PathLike)):
+        with open_rrdp_file(snapshot_or_delta) as f:
+            return parse_snapshot_or_delta(f, workers=workers)
+
     huge_parser = etree.XMLParser(encoding="utf-8", recover=False, huge_tree=True)
     doc = etree.parse(snapshot_or_delta, parser=huge_parser)
     validate(doc)
@@ -281,33 +551,370 @@ def parse_snapshot_or_delta(
     serial = root.attrib["serial"]
     session_id = root.attrib["session_id"]
 
+    content = parse_publish_withdraw(root)
+    if workers:
+        content = decode_in_parallel(content, workers)
+
     if root.tag == "{http://www.ripe.net/rpki/rrdp}snapshot":
         return SnapshotDocument(
             serial=int(serial),
             session_id=session_id,
-            content=list(parse_publish_withdraw(root)),
+            content=list(content),
         )
     elif root.tag == "{http://www.ripe.net/rpki/rrdp}delta":
         return DeltaDocument(
             serial=int(serial),
             session_id=session_id,
-            content=list(parse_publish_withdraw(root)),
+            content=list(content),
         )
 
 
 def parse_publish_withdraw(root: etree.Element) -> Generator[RrdpElement, None, None]:
     for elem in root.getchildren():
-        elem_uri = elem.attrib["uri"]
-        elem_hash = elem.get("hash", None)
+        yield parse_rrdp_element(elem)
+
+
+def parse_rrdp_element(elem: etree.Element) -> RrdpElement:
+    elem_uri = elem.attrib["uri"]
+    elem_hash = elem.get("hash", None)
+
+    if elem.tag == "{http://www.ripe.net/rpki/rrdp}withdraw":
+        if not elem_hash:
+            LOG.error("withdraw uri=%s without hash provided.", elem_uri)
+        return WithdrawElement(elem_uri, elem_hash)
+    elif elem.tag == "{http://www.ripe.net/rpki/rrdp}publish":
+        # If the hash is present it is for replacing an element: can not compare it to content.
+        return PublishElement(elem_uri, elem_hash, content_b64=elem.text)
+
+    raise ValidationException(
+        f"unexpected element {elem.tag} on line {elem.sourceline}"
+    )
+
+
+def _read_chunks(
+    snapshot_or_delta: Union[str, os.PathLike, TextIO, BinaryIO]
+) -> Iterator[Union[str, bytes]]:
+    """Read a (compressed) path or (text or binary) stream in chunks."""
+    if isinstance(snapshot_or_delta, (str, os.PathLike)):
+        with open_rrdp_file(snapshot_or_delta) as f:
+            yield from _read_chunks(f)
+        return
+
+    while chunk := snapshot_or_delta.read(READ_CHUNK_SIZE):
+        yield chunk
+
+
+def iter_snapshot_or_delta(
+    snapshot_or_delta: Union[str, os.PathLike, TextIO, BinaryIO],
+    strict_full_validation: bool = False,
+    workers: Optional[int] = None,
+    uri_filter: Optional[Callable[[str], bool]] = None,
+) -> Generator[DocumentHeader | RrdpElement, None, None]:
+    """
+    Incrementally parse and validate a snapshot or delta document.
+
+    Yields the `DocumentHeader` first, followed by the publish and withdraw
+    elements in document order. Elements are removed from the (partial) tree
+    once they are consumed, so memory usage does not depend on document size.
+
+    The document is checked by `StreamingValidator` while it is parsed: a
+    `ValidationException` can be raised after elements have been yielded.
+    With `strict_full_validation` the complete document is parsed and validated
+    against the RelaxNG schema before anything is yielded.
+
+    With `workers` the content of publish elements is decoded and hashed by a
+    pool of threads (see `decode_in_parallel`).
 
-        elem_content = base64.b64decode(elem.text) if elem.text else b""
+    Only the elements with a `uri` that matches `uri_filter` (e.g. a
+    `UriFilter`) are yielded. The filter is applied to the attribute: the
+    content of other elements is not copied, decoded, hashed or checked (as
+    base64), so skipping an object costs little more than scanning it.
+    """
+    if strict_full_validation:
+        doc = parse_snapshot_or_delta(snapshot_or_delta, workers=workers)
+        yield DocumentHeader(
+            document_type=(
+                "snapshot" if isinstance(doc, SnapshotDocument) else "delta"
+            ),
+            serial=doc.serial,
+            session_id=doc.session_id,
+        )
+        if uri_filter is None:
+            yield from doc.content
+        else:
+            yield from (elem for elem in doc.content if uri_filter(elem.uri))
+        return
+
+    elements = _stream_snapshot_or_delta(snapshot_or_delta, uri_filter)
+    if workers:
+        yield next(elements)
+        yield from decode_in_parallel(elements, workers)
+    else:
+        yield from elements
+
+
+def _stream_snapshot_or_delta(
+    snapshot_or_delta: Union[str, os.PathLike, TextIO, BinaryIO],
+    uri_filter: Optional[Callable[[str], bool]] = None,
+) -> Generator[DocumentHeader | RrdpElement, None, None]:
+    parser = etree.XMLPullParser(events=("start", "end"), huge_tree=True)
+    validator = StreamingValidator()
+    root = None
+    depth = 0
+    bytes_read = 0
+
+    def process_events() -> Generator[DocumentHeader | RrdpElement, None, None]:
+        nonlocal root, depth
+        for event, elem in parser.read_events():
+            if event == "start":
+                depth += 1
+                validator.start(elem, depth, bytes_read)
+                if depth == 1:
+                    root = elem
+                    yield parse_document_header(elem)
+                continue
+
+            # The content of objects that are skipped is not checked
+            accepted = (
+                depth != 2 or uri_filter is None or uri_filter(elem.get("uri", ""))
+            )
+            validator.end(elem, depth, bytes_read, check_content=accepted)
+            depth -= 1
+            if depth == 1:
+                if accepted:
+                    yield parse_rrdp_element(elem)
+                # Drop the consumed element and any siblings before it.
+                elem.clear(keep_tail=True)
+                while elem.getprevious() is not None:
+                    del root[0]
+
+    for chunk in _read_chunks(snapshot_or_delta):
+        # Text streams count the bytes of the encoded document
+        bytes_read += len(chunk.encode("utf-8") if isinstance(chunk, str) else chunk)
+        parser.feed(chunk)
+        yield from process_events()
+
+    parser.close()
+    yield from process_events()
+
+
+def _decode_batch(batch: List[RrdpElement]) -> List[RrdpElement]:
+    for elem in batch:
+        if isinstance(elem, PublishElement):
+            # Computing the digest decodes the content as well
+            _ = elem.digest
+    return batch
+
+
+def decode_in_parallel(
+    elements: Iterable[RrdpElement],
+    workers: int,
+    batch_size: int = DECODE_BATCH_SIZE,
+) -> Generator[RrdpElement, None, None]:
+    """
+    Decode and hash the content of publish elements in a pool of threads.
+
+    hashlib releases the GIL while hashing large buffers, so the digests are
+    computed in parallel. Elements are yielded in their original order and at
+    most two batches per worker are in flight.
+    """
+    elements = iter(elements)
+    pending = collections.deque()
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        while batch := list(itertools.islice(elements, batch_size)):
+            pending.append(executor.submit(_decode_batch, batch))
+            if len(pending) >= 2 * workers:
+                yield from pending.popleft().result()
+
+        while pending:
+            yield from pending.popleft().result()
 
-        if elem.tag == "{http://www.ripe.net/rpki/rrdp}withdraw":
-            if not elem_hash:
-                LOG.error("withdraw uri=%s without hash provided.", elem_uri)
-            yield WithdrawElement(elem_uri, elem_hash)
+
+class StreamingValidator:
+    """
+    Enforce the snapshot and delta rules of `SCHEMA` on parser events.
+
+    Only the element that is being processed (and its predecessor) need to be
+    present in the tree. Violations raise a `ValidationException` that carries
+    the source line and the number of bytes fed to the parser when the
+    violation was detected.
+    """
+
+    ROOT_ATTRIBUTES = frozenset(["version", "session_id", "serial"])
+
+    def __init__(self) -> None:
+        self.document_type: Optional[str] = None
+        self.children = 0
+
+    def start(self, elem: etree.Element, depth: int, bytes_read: int) -> None:
+        if depth == 1:
+            match elem.tag:
+                case "{http://www.ripe.net/rpki/rrdp}snapshot":
+                    self.document_type = "snapshot"
+                case "{http://www.ripe.net/rpki/rrdp}delta":
+                    self.document_type = "delta"
+                case "{http://www.ripe.net/rpki/rrdp}notification":
+                    # Valid RRDP, but not a document that is streamed.
+                    return
+                case _:
+                    self.fail(elem, bytes_read, f"unexpected root element {elem.tag}")
+            self.check_attributes(elem, bytes_read, self.ROOT_ATTRIBUTES, frozenset())
+            return
+
+        if depth > 2:
+            self.fail(elem, bytes_read, f"unexpected element {elem.tag}")
+
+        # The text preceding this element is complete once it starts
+        previous = elem.getprevious()
+        self.check_whitespace(
+            elem,
+            bytes_read,
+            previous.tail if previous is not None else elem.getparent().text,
+        )
+        self.children += 1
+
+        match (self.document_type, elem.tag):
+            case ("snapshot", "{http://www.ripe.net/rpki/rrdp}publish"):
+                self.check_attributes(elem, bytes_read, frozenset(["uri"]), frozenset())
+            case ("delta", "{http://www.ripe.net/rpki/rrdp}publish"):
+                self.check_attributes(
+                    elem, bytes_read, frozenset(["uri"]), frozenset(["hash"])
+                )
+            case ("delta", "{http://www.ripe.net/rpki/rrdp}withdraw"):
+                self.check_attributes(
+                    elem, bytes_read, frozenset(["uri", "hash"]), frozenset()
+                )
+            case _:
+                self.fail(
+                    elem,
+                    bytes_read,
+                    f"unexpected element {elem.tag} in <{self.document_type}>",
+                )
+
+    def end(
+        self,
+        elem: etree.Element,
+        depth: int,
+        bytes_read: int,
+        check_content: bool = True,
+    ) -> None:
+        if depth == 1:
+            last = elem[-1] if len(elem) else None
+            self.check_whitespace(
+                elem, bytes_read, last.tail if last is not None else elem.text
+            )
+            if self.document_type == "delta" and self.children == 0:
+                self.fail(
+                    elem, bytes_read, "<delta> without publish or withdraw elements"
+                )
         elif elem.tag == "{http://www.ripe.net/rpki/rrdp}publish":
-            pe = PublishElement(elem_uri, elem_hash, elem_content)
-            # If the hash is present it is for replacing an element: can not compare it to content.
+            if check_content and elem.text and not is_base64(elem.text):
+                self.fail(elem, bytes_read, "content of <publish> is not valid base64")
+        else:
+            self.check_whitespace(elem, bytes_read, elem.text)
+
+    def check_attributes(
+        self,
+        elem: etree.Element,
+        bytes_read: int,
+        required: frozenset[str],
+        optional: frozenset[str],
+    ) -> None:
+        attributes = frozenset(elem.attrib.keys())
+        if missing := required - attributes:
+            self.fail(
+                elem, bytes_read, f"missing attribute(s) {', '.join(sorted(missing))}"
+            )
+        if unexpected := attributes - required - optional:
+            self.fail(
+                elem,
+                bytes_read,
+                f"unexpected attribute(s) {', '.join(sorted(unexpected))}",
+            )
+
+        for name, value in elem.attrib.items():
+            match name:
+                case "version":
+                    valid = is_positive_integer(value) and int(value) == 1
+                case "serial":
+                    valid = is_positive_integer(value)
+                case "session_id":
+                    valid = UUID_RE.fullmatch(value) is not None
+                case "hash":
+                    valid = HASH_RE.fullmatch(value) is not None
+                case _:
+                    valid = True
+
+            if not valid:
+                self.fail(elem, bytes_read, f"invalid value for {name}: {value!r}")
+
+    def check_whitespace(
+        self, elem: etree.Element, bytes_read: int, text: Optional[str]
+    ) -> None:
+        if text and not text.isspace():
+            self.fail(elem, bytes_read, f"unexpected text near {elem.tag}")
+
+    def fail(self, elem: etree.Element, bytes_read: int, message: str):
+        raise ValidationException(
+            f"{message} (line {elem.sourceline}, after {bytes_read} bytes read)",
+            bytes_read=bytes_read,
+            line=elem.sourceline,
+        )
+
+
+UUID_RE = re.compile(r"[\-0-9a-fA-F]+")
+HASH_RE = re.compile(r"[0-9a-fA-F]+")
+POSITIVE_INTEGER_RE = re.compile(r"\+?[0-9]+")
+# Base64 characters and whitespace, followed by at most two padding characters
+BASE64_RE = re.compile(r"[A-Za-z0-9+/ \t\n\r]*+(?:=[ \t\n\r]*+){0,2}")
+XML_WHITESPACE = " \t\n\r"
+# The character before the padding (by the number of padding characters):
+# the bits that are not part of the content are zero.
+BASE64_LAST_BEFORE_PADDING = {1: frozenset("AEIMQUYcgkosw048"), 2: frozenset("AQgw")}
+
+
+def is_positive_integer(value: str) -> bool:
+    value = value.strip()
+    return POSITIVE_INTEGER_RE.fullmatch(value) is not None and int(value) > 0
+
 
-            yield pe
+def is_base64(value: str) -> bool:
+    """
+    Check the lexical space of xsd:base64Binary (ignoring whitespace).
+
+    The content is scanned once by the regular expression, and not copied:
+    the length and padding are checked separately.
+    """
+    if BASE64_RE.fullmatch(value) is None:
+        return False
+    if (len(value) - sum(value.count(c) for c in XML_WHITESPACE)) % 4:
+        return False
+
+    padding = 0
+    i = len(value) - 1
+    while i >= 0 and value[i] in "=" + XML_WHITESPACE:
+        padding += value[i] == "="
+        i -= 1
+    return padding == 0 or value[i] in BASE64_LAST_BEFORE_PADDING[padding]
+
+
+def parse_document_header(root: etree.Element) -> DocumentHeader:
+    match root.tag:
+        case "{http://www.ripe.net/rpki/rrdp}snapshot":
+            document_type = "snapshot"
+        case "{http://www.ripe.net/rpki/rrdp}delta":
+            document_type = "delta"
+        case _:
+            raise UnexpectedDocumentException(
+                "document does not have <snapshot> or <delta> root tags"
+            )
+
+    try:
+        return DocumentHeader(
+            document_type=document_type,
+            serial=int(root.attrib["serial"]),
+            session_id=root.attrib["session_id"],
+        )
+    except (KeyError, ValueError) as e:
+        raise ValidationException(f"invalid <{document_type}> attributes: {e}")
@@ -8,19 +8,31 @@ import multiprocessing
 import re
 from dataclasses import dataclass
 from pathlib import Path
-from typing import Dict, FrozenSet, Generator, List, Optional, Union
+from typing import (
+    TYPE_CHECKING,
+    Dict,
+    FrozenSet,
+    Generator,
+    List,
+    Optional,
+    Union,
+)
 
 import asn1crypto
 import click
-from alive_progress import alive_bar
 
+from rrdp_tools.compression import find_rrdp_files
 from rrdp_tools.rpki import FileAndHash, parse_file_time, parse_manifest
 from rrdp_tools.rrdp import (
     PublishElement,
     UnexpectedDocumentException,
     ValidationException,
-    parse_snapshot_or_delta,
+    iter_snapshot_or_delta,
 )
+from rrdp_tools.uri_filter import UriFilter
+
+if TYPE_CHECKING:
+    from alive_progress import alive_bar
 
 LOG = logging.getLogger(__name__)
 
@@ -64,67 +76,99 @@ class PublishMatch:
     h_content: Union[str, None] = None
 
 
+def uri_filter_for(file_match: Union[re.Pattern, UriFilter]) -> UriFilter:
+    """A pattern is matched at the start of the URI (`re.match`)."""
+    if isinstance(file_match, UriFilter):
+        return file_match
+    return UriFilter([file_match], anchored=True)
+
+
 def process_file(
     xml_file: Path,
-    file_match: re.Pattern,
+    file_match: Union[re.Pattern, UriFilter],
     log_content: bool = False,
-    progress_bar: Optional[alive_bar] = None,
+    progress_bar: Optional["alive_bar"] = None,
+    strict_full_validation: bool = False,
 ) -> Generator[ManifestMatch | PublishMatch, None, None]:
     LOG.debug("processing %s", xml_file)
 
-    with xml_file.open("r") as f:
-        try:
-            doc = parse_snapshot_or_delta(f)
-            for elem in doc.content:
-                match elem:
-                    case PublishElement(uri=uri, content=content):
-                        if file_match.match(uri):
-                            if uri.endswith(".mft"):
-                                mft = parse_manifest(content)
-                                yield ManifestMatch(
-                                    serial=doc.serial,
-                                    session_id=doc.session_id,
-                                    **dataclasses.asdict(elem),
-                                    **dataclasses.asdict(mft),
-                                    authority_information_access=mft.authority_information_access,
-                                )
-                            else:
-                                time = parse_file_time(uri, content)
-                                yield PublishMatch(
-                                    serial=doc.serial,
-                                    session_id=doc.session_id,
-                                    modification_time=time,
-                                    **dataclasses.asdict(elem),
-                                )
-        except ValidationException:
-            LOG.error("%s is not a valid RRDP document", xml_file)
-        except UnexpectedDocumentException:
-            LOG.info("Skipping %s: not a snapshot or delta document", xml_file)
-        finally:
-            if progress_bar:
-                progress_bar()
+    try:
+        # Only matching elements are parsed, decoded and hashed
+        elements = iter_snapshot_or_delta(
+            xml_file,
+            strict_full_validation=strict_full_validation,
+            uri_filter=uri_filter_for(file_match),
+        )
+        doc = next(elements)
+        for elem in elements:
+            match elem:
+                case PublishElement(uri=uri):
+                    if uri.endswith(".mft"):
+                        mft = parse_manifest(elem.content)
+                        yield ManifestMatch(
+                            serial=doc.serial,
+                            session_id=doc.session_id,
+                            uri=uri,
+                            content=elem.content,
+                            previous_hash=elem.previous_hash,
+                            h_content=elem.h_content,
+                            **dataclasses.asdict(mft),
+                            authority_information_access=mft.authority_information_access,
+                        )
+                    else:
+                        time = parse_file_time(uri, elem.content)
+                        yield PublishMatch(
+                            serial=doc.serial,
+                            session_id=doc.session_id,
+                            uri=uri,
+                            previous_hash=elem.previous_hash,
+                            content=elem.content,
+                            modification_time=time,
+                            h_content=elem.h_content,
+                        )
+    except ValidationException:
+        LOG.error("%s is not a valid RRDP document", xml_file)
+    except UnexpectedDocumentException:
+        LOG.info("Skipping %s: not a snapshot or delta document", xml_file)
+    finally:
+        if progress_bar:
+            progress_bar()
 
 
 def process_file_to_list(
-    xml_file: Path, file_match: re.Pattern, log_content: bool = False
+    xml_file: Path,
+    file_match: Union[re.Pattern, UriFilter],
+    log_content: bool = False,
+    strict_full_validation: bool = False,
 ) -> List[ManifestMatch | PublishMatch]:
-    return list(process_file(xml_file, file_match, log_content))
+    return list(
+        process_file(
+            xml_file,
+            file_match,
+            log_content,
+            strict_full_validation=strict_full_validation,
+        )
+    )
 
 
 async def filter_rrdp_content(
     path: Path,
-    file_match: re.Pattern,
+    file_match: Union[re.Pattern, UriFilter],
     log_content: bool,
     print_manifest_diff: bool,
     store_content: Optional[Path] = None,
+    strict_full_validation: bool = False,
 ):
-    files = list(path.glob("**/*.xml"))
+    files = find_rrdp_files(path)
     LOG.info("found %d files", len(files))
 
     with multiprocessing.Pool() as pool:
         match_lists = pool.starmap(
             process_file_to_list,
-            [(xml_file, file_match, log_content) for xml_file in files],
+            [
+                (xml_file, file_match, log_content, strict_full_validation)
+                for xml_file in files
+            ],
         )
     matches = list(itertools.chain.from_iterable(match_lists))
 
@@ -172,6 +216,18 @@ async def filter_rrdp_content(
     type=click.Path(exists=True, file_okay=False, resolve_path=True, path_type=Path),
 )
 @click.option("--file-match", type=str, default=".*\\.mft")
+@click.option(
+    "--uri-prefix",
+    type=str,
+    multiple=True,
+    help="Only match objects with a URI that starts with this prefix",
+)
+@click.option(
+    "--extension",
+    type=str,
+    multiple=True,
+    help="Only match objects with this extension (e.g. mft)",
+)
 @click.option("--verbose", "-v", is_flag=True)
 @click.option("--log-content", "-l", is_flag=True)
 @click.option(
@@ -185,13 +241,21 @@ async def filter_rrdp_content(
     is_flag=True,
     help="Log the difference in FileAndHash set between the manifests",
 )
+@click.option(
+    "--strict-full-validation",
+    is_flag=True,
+    help="Validate complete documents against the RelaxNG schema before processing",
+)
 def filter_rrdp_content_command(
     path: Path,
     file_match: str,
+    uri_prefix: List[str],
+    extension: List[str],
     verbose: bool,
     log_content: bool,
     manifest_diff: bool,
     store_content: Optional[Path],
+    strict_full_validation: bool,
 ):
     """Scan a set of RRDP documents and print out matching files."""
     logging.basicConfig()
@@ -203,10 +267,11 @@ def filter_rrdp_content_command(
     asyncio.run(
         filter_rrdp_content(
             path,
-            re.compile(file_match),
+            UriFilter([file_match], uri_prefix, extension, anchored=True),
             log_content,
             manifest_diff,
             store_content=store_content,
+            strict_full_validation=strict_full_validation,
         )
     )
 
@@ -0,0 +1,221 @@
+"""
+Concurrency limits, rate limits and retries for downloads.
+"""
+import asyncio
+import collections
+import contextlib
+import heapq
+import itertools
+import logging
+import random
+import time
+import urllib.parse
+from dataclasses import dataclass
+from typing import (
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    DefaultDict,
+    List,
+    Optional,
+    Tuple,
+    TypeVar,
+)
+
+import aiohttp
+
+LOG = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Lower values are scheduled first: deltas are small and needed to catch up,
+# snapshots are large and only needed after a session reset.
+DELTA_PRIORITY = 0
+SNAPSHOT_PRIORITY = 1
+
+# HTTP status codes that are retried: rate limited or server errors
+RETRY_STATUSES = frozenset([429, 500, 502, 503, 504])
+# HTTP status codes for a document that does not exist
+MISSING_STATUSES = frozenset([404, 410])
+
+
+class HttpStatusError(ValueError):
+    """A request failed with an unexpected HTTP status."""
+
+    def __init__(self, status: int, uri: str) -> None:
+        super().__init__(f"Got status {status} for {uri}")
+        self.status = status
+        self.uri = uri
+
+
+def is_retryable(e: BaseException) -> bool:
+    """Whether a request that failed with `e` may succeed when it is retried."""
+    if isinstance(e, HttpStatusError):
+        return e.status in RETRY_STATUSES
+    # Includes timeouts (aiohttp.ServerTimeoutError) and connection errors
+    return isinstance(e, (asyncio.TimeoutError, aiohttp.ClientError))
+
+
+@dataclass
+class RetryPolicy:
+    """Retry with exponential backoff and full jitter."""
+
+    attempts: int = 5
+    base_delay: float = 0.5
+    max_delay: float = 30.0
+
+    def delay(self, attempt: int) -> float:
+        """The time to wait after attempt `attempt` (starting at 0) failed."""
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2**attempt))
+
+
+async def retry(
+    operation: Callable[[int], Awaitable[T]],
+    retry_policy: RetryPolicy,
+    rate_limiter: Optional["TokenBucket"] = None,
+    description: str = "request",
+) -> T:
+    """
+    Run `operation(attempt)`, retried for server errors and timeouts.
+
+    The last error is raised when all attempts failed.
+    """
+    for attempt in range(retry_policy.attempts):
+        if rate_limiter:
+            await rate_limiter.acquire()
+        try:
+            return await operation(attempt)
+        except Exception as e:
+            if not is_retryable(e) or attempt + 1 >= retry_policy.attempts:
+                raise
+            delay = retry_policy.delay(attempt)
+            LOG.warning(
+                "%s: %s, retry %d/%d in %.2fs",
+                description,
+                e or type(e).__name__,
+                attempt + 1,
+                retry_policy.attempts - 1,
+                delay,
+            )
+            await asyncio.sleep(delay)
+
+    raise AssertionError("unreachable")
+
+
+async def gather_or_cancel(*aws: Awaitable[T]) -> List[T]:
+    """
+    Like `asyncio.gather`, but when one awaitable fails the others are
+    cancelled, and awaited, before the error is raised.
+
+    No download outlives the call: it does not write to a file (or an index)
+    that the caller may reuse or close after the error.
+    """
+    tasks = [asyncio.ensure_future(aw) for aw in aws]
+    try:
+        return list(await asyncio.gather(*tasks))
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
+
+
+class TokenBucket:
+    """Limit the rate of requests to `rate` per second, with bursts of `burst`."""
+
+    def __init__(self, rate: float, burst: Optional[float] = None) -> None:
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        self.rate = rate
+        self.burst = burst if burst is not None else max(1.0, rate)
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        # Waiters are served in order
+        self._lock = asyncio.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self) -> None:
+        async with self._lock:
+            self._refill()
+            while self._tokens < 1:
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+                self._refill()
+            self._tokens -= 1
+
+
+class PrioritySemaphore:
+    """A semaphore that wakes up the waiter with the lowest priority first."""
+
+    def __init__(self, value: int) -> None:
+        if value < 1:
+            raise ValueError("value must be at least 1")
+        self._value = value
+        self._waiters: List[Tuple[int, int, asyncio.Future]] = []
+        self._counter = itertools.count()
+
+    def locked(self) -> bool:
+        return self._value == 0
+
+    async def acquire(self, priority: int = 0) -> None:
+        if self._value > 0 and not self._waiters:
+            self._value -= 1
+            return
+
+        fut = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._counter), fut))
+        try:
+            await fut
+        except asyncio.CancelledError:
+            # The slot was handed over while this waiter was cancelled
+            if fut.done() and not fut.cancelled():
+                self.release()
+            raise
+
+    def release(self) -> None:
+        while self._waiters:
+            _, _, fut = heapq.heappop(self._waiters)
+            if not fut.done():
+                fut.set_result(None)
+                return
+        self._value += 1
+
+    @contextlib.asynccontextmanager
+    async def slot(self, priority: int = 0) -> AsyncIterator[None]:
+        await self.acquire(priority)
+        try:
+            yield
+        finally:
+            self.release()
+
+
+class DownloadLimiter:
+    """
+    A global download budget with an optional limit per host.
+
+    The per-host slot is acquired before the global one, so requests for a
+    busy host do not hold on to slots that other hosts could use.
+    """
+
+    def __init__(self, limit: int, limit_per_host: Optional[int] = None) -> None:
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self._global = PrioritySemaphore(limit)
+        self._per_host: DefaultDict[str, PrioritySemaphore] = collections.defaultdict(
+            lambda: PrioritySemaphore(limit_per_host or limit)
+        )
+
+    @contextlib.asynccontextmanager
+    async def slot(self, uri: str, priority: int = 0) -> AsyncIterator[None]:
+        if self.limit_per_host is None:
+            async with self._global.slot(priority):
+                yield
+            return
+
+        host = urllib.parse.urlparse(uri).netloc
+        async with self._per_host[host].slot(priority):
+            async with self._global.slot(priority):
+                yield
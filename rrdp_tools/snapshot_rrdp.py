@@ -1,18 +1,32 @@
 import asyncio
+import contextlib
 import email.utils
 import hashlib
 import logging
 import os
 import sys
 import time
-import urllib.parse
+from dataclasses import dataclass
 from pathlib import Path
-from typing import Optional
+from typing import AsyncContextManager, Optional
 
 import aiohttp
 import click
 
-from .rrdp import parse_notification_file
+from .download import (
+    discard_partial,
+    download_to_file,
+    resume_headers,
+    resumed_from,
+    with_host,
+)
+from .hash_index import HashIndex, hash_file
+from .metrics import DownloadMetrics, RequestMetrics
+from .object_store import ObjectStore
+from .planner import FULL, plan_downloads
+from .rrdp import NotificationDiff, NotificationDocument, parse_notification_file
+from .scheduling import SNAPSHOT_PRIORITY, DownloadLimiter, gather_or_cancel
+from .sync_state import SyncState
 
 logging.basicConfig()
 LOG = logging.getLogger(__name__)
@@ -20,7 +34,12 @@ LOG.setLevel(logging.INFO)
 
 
 def set_time_from_headers(res: aiohttp.ClientResponse, target_file: Path) -> None:
-    last_modified = res.headers.get("Last-Modified", None)
+    set_time_from_last_modified(res.headers.get("Last-Modified", None), target_file)
+
+
+def set_time_from_last_modified(
+    last_modified: Optional[str], target_file: Path
+) -> None:
     try:
         if last_modified:
             last_modified_date = email.utils.parsedate_to_datetime(last_modified)
@@ -32,76 +51,149 @@ def set_time_from_headers(res: aiohttp.ClientResponse, target_file: Path) -> Non
         LOG.warning("Failed to set mtime on %s: %s", target_file, e)
 
 
+def target_file_for(base_file_name: Path, sha256: str, hash_in_name: bool) -> Path:
+    """The file a document is stored in, optionally including the hash."""
+    if hash_in_name:
+        return (
+            base_file_name.parent
+            / f"{base_file_name.stem}-{sha256.lower()}{base_file_name.suffix}"
+        )
+    return base_file_name
+
+
 async def get_and_check(
-    sem: asyncio.Semaphore,
+    sem: AsyncContextManager,
     session: aiohttp.ClientSession,
     base_file_name: Path,
     uri: str,
     sha256: str,
     override_host: Optional[str],
     hash_in_name: bool = False,
+    hash_index: Optional[HashIndex] = None,
+    metrics: Optional[DownloadMetrics] = None,
 ) -> bool:
     """
     Get a file if needed and check the hash compared to the download.
 
-    If a file exists and the hash should be added to the name, do so.
+    If a file exists and the hash should be added to the name, do so. Otherwise
+    the hash of an existing file is looked up in `hash_index` (when given) and
+    only computed when the file changed. Requests are recorded in `metrics`.
     """
     expected_hash = sha256.lower()
 
-    target_file = base_file_name
+    target_file = target_file_for(base_file_name, expected_hash, hash_in_name)
     if hash_in_name:
-        target_file = (
-            base_file_name.parent
-            / f"{base_file_name.stem}-{expected_hash}{base_file_name.suffix}"
-        )
         if target_file.exists():
             LOG.debug("Already have %s as %s", uri, target_file)
             return False
     else:
-        if target_file.exists():
-            with target_file.open("rb") as f:
-                cur_hash = hashlib.sha256(f.read()).hexdigest()
-                if cur_hash == expected_hash:
-                    LOG.debug("Already have %s as %s", uri, target_file)
-                    return False
-                else:
-                    LOG.info(
-                        "Hash for %s does not match, downloading %s", target_file, uri
-                    )
+        cur_hash = (
+            hash_index.sha256(target_file)
+            if hash_index
+            else (hash_file(target_file) if target_file.exists() else None)
+        )
+        if cur_hash == expected_hash:
+            LOG.debug("Already have %s as %s", uri, target_file)
+            return False
+        elif cur_hash is not None:
+            LOG.info("Hash for %s does not match, downloading %s", target_file, uri)
 
     async with sem:
-        if override_host:
-            # override the URI
-            tokens = list(urllib.parse.urlparse(uri))
-            override_tokens = urllib.parse.urlparse(override_host)
-            # [scheme, host, ...]
-            tokens[0] = override_tokens[0]
-            tokens[1] = override_tokens[1]
+        uri = with_host(uri, override_host)
+        LOG.debug("Getting %s h=%s target_file=%s", uri, expected_hash, target_file)
 
-            uri = urllib.parse.urlunparse(tokens)
+        request = metrics.start(uri) if metrics else RequestMetrics(uri)
+        try:
+            async with session.get(uri, headers=resume_headers(target_file)) as res:
+                request.response_received(res.status)
+                if res.status not in (200, 206):
+                    if res.status == 416:
+                        # The partial download does not match the document
+                        discard_partial(target_file)
+                    reason = await res.read()
+                    LOG.error("HTTP %d for %s: %s", res.status, uri, reason)
+                    raise ValueError(f"HTTP {res.status} for {uri}")
+
+                # Streamed to a `.part` file (resumed on the next attempt if the
+                # transfer fails), renamed into place if the hash matches
+                await download_to_file(res, target_file, expected_hash, resume=True)
+                request.body_received(target_file.stat().st_size - resumed_from(res))
+        except (ValueError, aiohttp.ClientError) as e:
+            request.error = str(e)
+            raise
+
+        LOG.debug(
+            "%s ttfb=%.3fs transfer=%.3fs %db",
+            uri,
+            request.ttfb,
+            request.transfer_time,
+            request.bytes,
+        )
 
-        LOG.debug("Getting %s h=%s target_file=%s", uri, expected_hash, target_file)
+    set_time_from_headers(res, target_file)
+    if hash_index:
+        hash_index.update(target_file, expected_hash)
+    return True
 
-        t0 = time.time()
-        res = await session.get(uri)
-        if res.status != 200:
-            reason = await res.read()
-            LOG.error("HTTP %d for %s: %s", res.status, uri, reason)
-            raise ValueError(f"HTTP {res.status} for {uri}")
-        content = await res.read()
-        LOG.debug("%s %.2f %db", uri, time.time() - t0, len(content))
 
-        digest = hashlib.sha256(content).hexdigest()
+@dataclass
+class NotificationFetch:
+    """A notification file and the validators for conditional requests."""
 
-        if digest != expected_hash:
+    notification: NotificationDocument
+    content: bytes
+    sha256: str
+    etag: Optional[str]
+    last_modified: Optional[str]
+
+
+async def fetch_notification(
+    session: aiohttp.ClientSession,
+    notification_url: str,
+    previous: Optional[NotificationFetch] = None,
+    metrics: Optional[DownloadMetrics] = None,
+) -> Optional[NotificationFetch]:
+    """
+    Get and parse a notification file.
+
+    When the previous version is given, a conditional request is made and the
+    file is only parsed when it changed. Returns None when it did not change.
+    """
+    headers = {}
+    if previous and previous.etag:
+        headers["If-None-Match"] = previous.etag
+    if previous and previous.last_modified:
+        headers["If-Modified-Since"] = previous.last_modified
+
+    LOG.debug("GET %s", notification_url)
+    request = (
+        metrics.start(notification_url) if metrics else RequestMetrics(notification_url)
+    )
+    async with session.get(notification_url, headers=headers) as res:
+        request.response_received(res.status)
+        if res.status == 304:
+            LOG.debug("%s: not modified", notification_url)
+            return None
+        if res.status != 200:
             raise ValueError(
-                f"Hash mismatch for {uri}. Expected {expected_hash} actual {digest}"
+                f"HTTP {res.status} from RRDP server, reason: {await res.text()}"
             )
 
-    with target_file.open("wb") as f:
-        f.write(content)
-    set_time_from_headers(res, target_file)
-    return True
+        content = await res.read()
+        request.body_received(len(content))
+
+    sha256 = hashlib.sha256(content).hexdigest()
+    if previous and previous.sha256 == sha256:
+        LOG.debug("%s: content did not change", notification_url)
+        return None
+
+    return NotificationFetch(
+        notification=parse_notification_file(content),
+        content=content,
+        sha256=sha256,
+        etag=res.headers.get("ETag", None),
+        last_modified=res.headers.get("Last-Modified", None),
+    )
 
 
 async def snapshot_rrdp(
@@ -113,76 +205,349 @@ async def snapshot_rrdp(
     threads: int = 4,
     limit_deltas: Optional[int] = None,
     include_hash: bool = False,
+    incremental: bool = False,
+    object_store: Optional[ObjectStore] = None,
+    write_metrics: bool = False,
+    dry_run: bool = False,
 ):
-    """Snapshot RRDP content."""
-    sem = asyncio.Semaphore(threads)
+    """
+    Snapshot RRDP content.
+
+    The session, serial and hashes of the downloaded files are stored in a
+    state file in the output directory. In incremental mode, only the deltas
+    after the serial in the state file (or the snapshot, when that is smaller)
+    are downloaded (or the snapshot and deltas after a session reset), and
+    nothing is written when the serial did not change. With `dry_run` the
+    download plan is printed instead.
+    """
+    limiter = DownloadLimiter(threads)
+    metrics = DownloadMetrics({"notification_url": notification_url})
 
     async with aiohttp.ClientSession() as session:
-        LOG.debug("GET %s", notification_url)
-        res = await session.get(notification_url)
-        if res.status != 200:
-            click.echo(f"HTTP {res.status} from RRDP server, aborting")
-            click.echo(f"reason: {await res.text()}")
+        try:
+            fetch = await fetch_notification(session, notification_url, metrics=metrics)
+        except ValueError as e:
+            click.echo(f"{e}, aborting")
             return
 
-        notification = parse_notification_file(await res.text())
-
-        LOG.info(
-            "%s serial=%s session_id=%s",
+        await sync_notification(
+            limiter,
+            session,
             notification_url,
-            notification.serial,
-            notification.session_id,
+            fetch,
+            output_path,
+            override_host=override_host,
+            skip_snapshot=skip_snapshot,
+            include_session=include_session,
+            limit_deltas=limit_deltas,
+            include_hash=include_hash,
+            incremental=incremental,
+            object_store=object_store,
+            metrics=metrics,
+            write_metrics=write_metrics,
+            dry_run=dry_run,
         )
 
-        if not notification.session_id:
-            print("No session_id in notification file!")
-            sys.exit(1)
 
-        if include_session:
-            output_path = output_path / notification.session_id
-            output_path.mkdir(parents=True, exist_ok=True)
+async def watch_rrdp(
+    notification_url: str,
+    output_path: Path,
+    interval: float,
+    override_host: Optional[str] = None,
+    skip_snapshot: bool = False,
+    include_session: bool = False,
+    threads: int = 4,
+    limit_deltas: Optional[int] = None,
+    include_hash: bool = False,
+    polls: Optional[int] = None,
+    object_store: Optional[ObjectStore] = None,
+    write_metrics: bool = False,
+):
+    """
+    Poll the notification file every `interval` seconds and sync changes.
 
-        # Document is valid,
-        with (output_path / "notification.xml").open("wb") as f:
-            f.write(await res.read())
-        set_time_from_headers(res, output_path / "notification.xml")
+    One HTTP session is kept for all polls, the notification file is requested
+    conditionally and only processed when it changed. Changes are synced
+    incrementally. A sync that fails is retried on the next poll. Stops after
+    `polls` polls when given.
+    """
+    limiter = DownloadLimiter(threads)
+    previous: Optional[NotificationFetch] = None
+    serial_observed_at: Optional[float] = None
+    poll = 0
 
-        queue = []
+    async with aiohttp.ClientSession() as session:
+        while polls is None or poll < polls:
+            poll += 1
+            t0 = time.time()
+            metrics = DownloadMetrics({"notification_url": notification_url})
+            try:
+                fetch = await fetch_notification(
+                    session, notification_url, previous, metrics=metrics
+                )
+            except (ValueError, aiohttp.ClientError, asyncio.TimeoutError) as e:
+                LOG.error("Failed to get %s: %s", notification_url, e)
+                fetch = None
+
+            if fetch:
+                notification = fetch.notification
+                if previous is not None:
+                    diff = notification.diff(previous.notification)
+                    log_notification_diff(diff)
+                if (
+                    previous is None
+                    or diff.session_reset
+                    or diff.new_deltas
+                    # e.g. a server that does not list deltas
+                    or previous.notification.serial != notification.serial
+                ):
+                    log_serial_advance(previous, fetch, t0, serial_observed_at)
+                    serial_observed_at = t0
+
+                try:
+                    await sync_notification(
+                        limiter,
+                        session,
+                        notification_url,
+                        fetch,
+                        output_path,
+                        override_host=override_host,
+                        skip_snapshot=skip_snapshot,
+                        include_session=include_session,
+                        limit_deltas=limit_deltas,
+                        include_hash=include_hash,
+                        incremental=True,
+                        object_store=object_store,
+                        metrics=metrics,
+                        write_metrics=write_metrics,
+                    )
+                    previous = fetch
+                except (ValueError, aiohttp.ClientError, asyncio.TimeoutError) as e:
+                    # `previous` is kept: the next poll syncs this notification
+                    LOG.error("Failed to sync serial %d: %s", notification.serial, e)
+
+            if polls is None or poll < polls:
+                await asyncio.sleep(max(0.0, interval - (time.time() - t0)))
+
+
+def log_notification_diff(diff: NotificationDiff) -> None:
+    """Log the changes in the deltas listed in the notification file."""
+    if diff.session_reset:
+        LOG.warning("Session reset: %d deltas listed", len(diff.new_deltas))
+        return
+    for before, after in diff.hash_changes:
+        LOG.warning(
+            "Hash of delta %d changed: %s -> %s", after.serial, before.hash, after.hash
+        )
+    if diff.dropped_deltas:
+        LOG.debug("%d deltas are no longer listed", len(diff.dropped_deltas))
+    if diff.new_deltas:
+        LOG.debug(
+            "New deltas %d-%d", diff.new_deltas[0].serial, diff.new_deltas[-1].serial
+        )
+
+
+def log_serial_advance(
+    previous: Optional[NotificationFetch],
+    fetch: NotificationFetch,
+    observed_at: float,
+    previous_observed_at: Optional[float],
+) -> None:
+    """Log how long after publication (and the previous serial) a serial was seen."""
+    latency = "unknown"
+    if fetch.last_modified:
+        try:
+            published = email.utils.parsedate_to_datetime(fetch.last_modified)
+            latency = f"{observed_at - published.timestamp():.1f}s"
+        except (TypeError, ValueError):
+            pass
+
+    since_previous = (
+        f"{observed_at - previous_observed_at:.1f}s"
+        if previous_observed_at is not None
+        else "N/A"
+    )
+    LOG.info(
+        "serial %s -> %d (session %s): observed %s after Last-Modified, "
+        "%s after the previous serial",
+        previous.notification.serial if previous else "N/A",
+        fetch.notification.serial,
+        fetch.notification.session_id,
+        latency,
+        since_previous,
+    )
+
+
+async def sync_notification(
+    limiter: DownloadLimiter,
+    session: aiohttp.ClientSession,
+    notification_url: str,
+    fetch: NotificationFetch,
+    output_path: Path,
+    override_host: Optional[str] = None,
+    skip_snapshot: bool = False,
+    include_session: bool = False,
+    limit_deltas: Optional[int] = None,
+    include_hash: bool = False,
+    incremental: bool = False,
+    object_store: Optional[ObjectStore] = None,
+    metrics: Optional[DownloadMetrics] = None,
+    write_metrics: bool = False,
+    dry_run: bool = False,
+):
+    """
+    Download the files listed in a notification file.
 
-        if not skip_snapshot:
-            file_name = f"snapshot-{notification.serial}.xml"
-            queue.append(
+    In incremental mode the deltas or the snapshot are downloaded, depending
+    on which is cheaper (see `plan_downloads`). With `dry_run` the plan is
+    printed and nothing is downloaded or written.
+
+    With an `object_store`, downloaded documents are moved into the store. With
+    `write_metrics` the download metrics are written next to notification.xml.
+    """
+    notification = fetch.notification
+    if metrics is None:
+        metrics = DownloadMetrics({"notification_url": notification_url})
+
+    LOG.info(
+        "%s serial=%s session_id=%s",
+        notification_url,
+        notification.serial,
+        notification.session_id,
+    )
+
+    if not notification.session_id:
+        print("No session_id in notification file!")
+        sys.exit(1)
+
+    if include_session:
+        output_path = output_path / notification.session_id
+        output_path.mkdir(parents=True, exist_ok=True)
+
+    state = SyncState.load(output_path) if incremental else None
+    if (
+        state
+        and state.session_id == notification.session_id
+        and state.serial == notification.serial
+    ):
+        click.echo(f"Already at serial {state.serial}, nothing to update.")
+        return
+
+    plan = await plan_downloads(
+        limiter,
+        session,
+        notification,
+        state,
+        skip_snapshot=skip_snapshot,
+        limit_deltas=limit_deltas,
+        override_host=override_host,
+        metrics=metrics,
+    )
+    LOG.info("%s: %s", notification_url, plan.format().splitlines()[0])
+    if dry_run:
+        click.echo(plan.format())
+        return
+
+    # Document is valid,
+    with (output_path / "notification.xml").open("wb") as f:
+        f.write(fetch.content)
+    set_time_from_last_modified(fetch.last_modified, output_path / "notification.xml")
+
+    if plan.strategy == FULL:
+        # Files from a previous session (or a full run) are not tracked
+        state = SyncState(
+            notification.session_id,
+            notification.serial,
+            sizes=state.sizes if state else {},
+            snapshot_size=state.snapshot_size if state else None,
+        )
+    assert state is not None
+
+    downloads = plan.downloads
+    to_fetch = downloads
+    if object_store:
+        # Documents that are in the object store are not downloaded again
+        to_fetch = [
+            download
+            for download in downloads
+            if not object_store.has_document(
+                notification.session_id, download.file_name, download.sha256
+            )
+        ]
+
+    # With the hash in the file name, existing files are not hashed. Files
+    # that are moved into the object store are not kept.
+    with contextlib.ExitStack() as stack:
+        hash_index = (
+            None
+            if include_hash or object_store
+            else stack.enter_context(HashIndex(output_path))
+        )
+        status_per_file = await gather_or_cancel(
+            *(
                 get_and_check(
-                    sem,
+                    limiter.slot(download.uri, download.priority),
                     session,
-                    output_path / file_name,
-                    notification.snapshot.uri,
-                    notification.snapshot.hash,
+                    output_path / download.file_name,
+                    download.uri,
+                    download.sha256,
                     override_host=override_host,
                     hash_in_name=include_hash,
+                    hash_index=hash_index,
+                    metrics=metrics,
                 )
+                for download in to_fetch
             )
+        )
 
-        for idx, delta in enumerate(notification.deltas):
-            if limit_deltas is not None and idx >= limit_deltas:
-                break
-            file_name = f"{delta.serial}.xml"
-            queue.append(
-                get_and_check(
-                    sem,
-                    session,
-                    output_path / file_name,
-                    delta.uri,
-                    delta.hash,
-                    override_host=override_host,
-                    hash_in_name=include_hash,
-                )
+    for download in to_fetch:
+        target_file = target_file_for(
+            output_path / download.file_name, download.sha256, include_hash
+        )
+        state.sizes[download.sha256] = target_file.stat().st_size
+        if download.priority == SNAPSHOT_PRIORITY:
+            state.snapshot_size = state.sizes[download.sha256]
+        if object_store:
+            await move_to_object_store(
+                object_store, target_file, download.file_name, download.sha256
             )
 
-        status_per_file = await asyncio.gather(*queue)
-        click.echo(
-            f"Update completed. {len(queue)} files are present. Downloaded {sum(status_per_file)} files."
+    state.serial = notification.serial
+    for download in downloads:
+        target_file = target_file_for(
+            output_path / download.file_name, download.sha256, include_hash
         )
+        state.files[target_file.name] = download.sha256
+    # Only the sizes of documents that can still be downloaded are useful
+    current = {notification.snapshot.hash.lower()} | {
+        delta.hash.lower() for delta in notification.deltas
+    }
+    state.sizes = {
+        sha256: size for sha256, size in state.sizes.items() if sha256 in current
+    }
+    state.save(output_path)
+
+    metrics.finish()
+    metrics.log_summary()
+    if write_metrics:
+        metrics.write(output_path)
+
+    click.echo(
+        f"Update completed. {len(downloads)} files are present. Downloaded {sum(status_per_file)} files."
+    )
+
+
+async def move_to_object_store(
+    object_store: ObjectStore, target_file: Path, name: str, sha256: str
+) -> None:
+    """Add a downloaded document to the object store and remove the file."""
+    manifest = await asyncio.to_thread(
+        object_store.add_document, name, target_file, sha256
+    )
+    target_file.unlink()
+    LOG.debug(
+        "Stored %s (%d elements) in %s", name, len(manifest.elements), object_store.root
+    )
 
 
 @click.command("snapshot-rrdp")
@@ -202,6 +567,34 @@ async def snapshot_rrdp(
 @click.option(
     "--limit-deltas", help="Number of deltas to include", type=int, default=None
 )
+@click.option(
+    "--incremental",
+    help="Only download deltas since the previous run (uses the state file)",
+    is_flag=True,
+)
+@click.option(
+    "--watch",
+    help="Poll the notification file every INTERVAL seconds (implies --incremental)",
+    type=float,
+    default=None,
+    metavar="INTERVAL",
+)
+@click.option(
+    "--object-store",
+    help="Move downloaded documents into a deduplicated object store (requires the zstd extra)",
+    type=click.Path(file_okay=False, path_type=Path),
+    default=None,
+)
+@click.option(
+    "--metrics",
+    help="Write download metrics (metrics.json, metrics.prom) next to notification.xml",
+    is_flag=True,
+)
+@click.option(
+    "--dry-run",
+    help="Print the download plan (snapshot or deltas) without downloading",
+    is_flag=True,
+)
 def snapshot_rrdp_command(
     notification_url: str,
     output_dir: Path,
@@ -213,6 +606,11 @@ def snapshot_rrdp_command(
     limit_deltas: Optional[int] = None,
     create_target: bool = False,
     include_hash: bool = True,
+    incremental: bool = False,
+    watch: Optional[float] = None,
+    object_store: Optional[Path] = None,
+    metrics: bool = False,
+    dry_run: bool = False,
 ):
     """
     Snapshot RRDP content
@@ -255,6 +653,28 @@ def snapshot_rrdp_command(
             click.echo(ctx.get_help())
             ctx.exit(2)
 
+    store = ObjectStore(object_store) if object_store else None
+
+    if watch is not None:
+        if dry_run:
+            raise click.UsageError("--dry-run can not be combined with --watch")
+        asyncio.run(
+            watch_rrdp(
+                notification_url,
+                output_dir,
+                watch,
+                override_host=override_host,
+                skip_snapshot=skip_snapshot,
+                include_session=include_session,
+                threads=threads,
+                limit_deltas=limit_deltas,
+                include_hash=include_hash,
+                object_store=store,
+                write_metrics=metrics,
+            )
+        )
+        return
+
     asyncio.run(
         snapshot_rrdp(
             notification_url,
@@ -265,6 +685,10 @@ def snapshot_rrdp_command(
             threads=threads,
             limit_deltas=limit_deltas,
             include_hash=include_hash,
+            incremental=incremental,
+            object_store=store,
+            write_metrics=metrics,
+            dry_run=dry_run,
         )
     )
 
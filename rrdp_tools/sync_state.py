@@ -0,0 +1,47 @@
+"""
+State of a local copy of an RRDP repository, as kept by snapshot-rrdp.
+"""
+import dataclasses
+import json
+import logging
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, Optional
+
+from .files import write_atomic
+
+LOG = logging.getLogger(__name__)
+
+STATE_FILE_NAME = ".rrdp-state.json"
+
+
+@dataclass
+class SyncState:
+    """The session and serial that were synced and the hashes of the files."""
+
+    session_id: str
+    serial: int
+    # file name -> sha256
+    files: Dict[str, str] = field(default_factory=dict)
+    # sha256 -> size of the documents in the notification file, when known
+    sizes: Dict[str, int] = field(default_factory=dict)
+    # size of the last snapshot that was seen
+    snapshot_size: Optional[int] = None
+
+    @staticmethod
+    def load(output_path: Path) -> Optional["SyncState"]:
+        state_file = output_path / STATE_FILE_NAME
+        try:
+            with state_file.open("r") as f:
+                return SyncState(**json.load(f))
+        except FileNotFoundError:
+            return None
+        except (ValueError, TypeError) as e:
+            LOG.warning("Ignoring invalid state file %s: %s", state_file, e)
+            return None
+
+    def save(self, output_path: Path) -> None:
+        """Atomically replace the state file."""
+        write_atomic(
+            output_path / STATE_FILE_NAME, json.dumps(dataclasses.asdict(self))
+        )
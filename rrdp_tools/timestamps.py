@@ -0,0 +1,123 @@
+"""
+Set the modification time of written objects from their content.
+
+Parsing the objects (`parse_file_time`) is CPU bound, so it runs in a pool of
+processes on batches of objects. The modification times are set when a batch
+returns, in the order the objects were submitted: the files are written
+before their time is known.
+"""
+import collections
+import logging
+import multiprocessing
+import os
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Deque, List, Optional, Tuple
+
+from rrdp_tools.rpki import parse_file_time
+
+LOG = logging.getLogger(__name__)
+
+DEFAULT_PROCESSES = max(1, min(4, (os.cpu_count() or 1) - 1))
+# Objects per batch
+BATCH_SIZE = 256
+
+
+def parse_times(jobs: List[Tuple[str, bytes]]) -> List[float]:
+    """The modification time (timestamp) for every (file name, content)."""
+    return [
+        datetime.timestamp(parse_file_time(file_name, content))
+        for file_name, content in jobs
+    ]
+
+
+class TimestampStage:
+    """
+    Parse the time of objects in `processes` processes and call `apply` with
+    the path and timestamp of every object.
+
+    The pool is only started once a full batch was submitted: the objects
+    that remain when the stage is closed (all objects of a small document) are
+    parsed in this process. The producer blocks when more than two batches
+    per process are pending.
+    """
+
+    def __init__(
+        self,
+        apply: Callable[[Path, float], None],
+        processes: int = DEFAULT_PROCESSES,
+        batch_size: int = BATCH_SIZE,
+    ) -> None:
+        if processes < 1:
+            raise ValueError("processes must be at least 1")
+        self.apply = apply
+        self.processes = processes
+        self.batch_size = batch_size
+        self.objects = 0
+        self.batches = 0
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._batch: List[Tuple[Path, bytes]] = []
+        self._pending: Deque[Tuple[List[Path], Future]] = collections.deque()
+        self._started: Optional[float] = None
+
+    def submit(self, path: Path, content: bytes) -> None:
+        if self._started is None:
+            self._started = time.monotonic()
+        self._batch.append((path, content))
+        if len(self._batch) >= self.batch_size:
+            self._flush()
+        self._apply_done(2 * self.processes)
+
+    def _flush(self) -> None:
+        if self._executor is None:
+            # Not forked: the process has writer threads
+            self._executor = ProcessPoolExecutor(
+                self.processes, mp_context=multiprocessing.get_context("spawn")
+            )
+        paths = [path for path, _ in self._batch]
+        future = self._executor.submit(
+            parse_times, [(path.name, content) for path, content in self._batch]
+        )
+        self._pending.append((paths, future))
+        self._batch = []
+        self.batches += 1
+
+    def _apply_done(self, max_pending: int) -> None:
+        """Apply the finished batches (in order) and wait for the oldest ones."""
+        while self._pending and (
+            len(self._pending) > max_pending or self._pending[0][1].done()
+        ):
+            paths, future = self._pending.popleft()
+            self._apply_batch(paths, future.result())
+
+    def _apply_batch(self, paths: List[Path], timestamps: List[float]) -> None:
+        for path, timestamp in zip(paths, timestamps):
+            self.apply(path, timestamp)
+        self.objects += len(paths)
+
+    def close(self) -> None:
+        """Wait for all batches and parse the remaining objects."""
+        try:
+            self._apply_done(0)
+            # Less than a batch: not worth sending to (or starting) the pool
+            self._apply_batch(
+                [path for path, _ in self._batch],
+                parse_times([(path.name, content) for path, content in self._batch]),
+            )
+            self._batch = []
+        finally:
+            if self._executor is not None:
+                self._executor.shutdown(cancel_futures=True)
+                self._executor = None
+
+        if self._started is not None:
+            elapsed = time.monotonic() - self._started
+            LOG.info(
+                "Parsed the time of %d objects in %d batches in %.1fs (%.0f objects/s)",
+                self.objects,
+                self.batches,
+                elapsed,
+                self.objects / elapsed if elapsed else 0,
+            )
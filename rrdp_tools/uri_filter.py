@@ -0,0 +1,136 @@
+"""
+Select objects by URI.
+
+A `UriFilter` combines regular expressions (one alternation), literal
+prefixes (a trie of the path segments) and file extensions. The parser
+evaluates it on the `uri` attribute (see `iter_snapshot_or_delta`), so
+objects that do not match are never decoded or hashed.
+"""
+import re
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+
+# Escaped characters in a regular expression, and the ones that are special
+_ESCAPED = re.compile(r"\\([^A-Za-z0-9])")
+_SPECIAL = frozenset(".^$*+?{}[]\\|()")
+_DEFAULT_FLAGS = re.compile("").flags
+
+# Key of the prefixes that end in a node (with the segment they start with)
+_PARTIAL = None
+
+
+def literal_prefix(pattern: str, anchored: bool = False) -> Optional[str]:
+    """
+    The prefix that `pattern` matches if it is a literal prefix, else None.
+
+    A pattern is a prefix when it starts with `^` (or when it is `anchored`,
+    i.e. used with `re.match`) and has no special characters.
+    """
+    if pattern.startswith("^"):
+        pattern = pattern[1:]
+    elif not anchored:
+        return None
+    if _SPECIAL.intersection(_ESCAPED.sub("", pattern)):
+        return None
+    return _ESCAPED.sub(r"\1", pattern)
+
+
+class PrefixTrie:
+    """Literal prefixes of URIs, by path segment."""
+
+    def __init__(self, prefixes: Iterable[str] = ()) -> None:
+        self._root: Dict = {}
+        for prefix in prefixes:
+            self.add(prefix)
+
+    def add(self, prefix: str) -> None:
+        *segments, last = prefix.split("/")
+        node = self._root
+        for segment in segments:
+            node = node.setdefault(segment, {})
+        node[_PARTIAL] = node.get(_PARTIAL, ()) + (last,)
+
+    def __bool__(self) -> bool:
+        return bool(self._root)
+
+    def matches(self, uri: str) -> bool:
+        node = self._root
+        for segment in uri.split("/"):
+            partial = node.get(_PARTIAL, None)
+            if partial is not None and segment.startswith(partial):
+                return True
+            node = node.get(segment, None)
+            if node is None:
+                return False
+        return False
+
+
+class UriFilter:
+    """
+    Match URIs against regular expressions, prefixes and extensions.
+
+    A URI matches when it matches any of the regular expressions (with
+    `re.search`, or `re.match` when `anchored`), starts with any of the
+    prefixes and has any of the extensions. Kinds without values accept
+    every URI: an empty filter accepts everything.
+    """
+
+    def __init__(
+        self,
+        patterns: Iterable[Union[str, re.Pattern]] = (),
+        prefixes: Iterable[str] = (),
+        extensions: Iterable[str] = (),
+        anchored: bool = False,
+    ) -> None:
+        self.anchored = anchored
+        self.prefixes = PrefixTrie(prefixes)
+        self.extensions = frozenset(ext.lstrip(".") for ext in extensions)
+
+        # Patterns that are literal prefixes are matched with a trie
+        self.pattern_prefixes = PrefixTrie()
+        compiled: List[re.Pattern] = []
+        for pattern in map(re.compile, patterns):
+            prefix = (
+                literal_prefix(pattern.pattern, anchored)
+                if pattern.flags == _DEFAULT_FLAGS
+                else None
+            )
+            if prefix is not None:
+                self.pattern_prefixes.add(prefix)
+            else:
+                compiled.append(pattern)
+        self.patterns: Tuple[re.Pattern, ...] = self._combine(compiled)
+
+    @staticmethod
+    def _combine(patterns: List[re.Pattern]) -> Tuple[re.Pattern, ...]:
+        """One alternation of the patterns, when their flags allow it."""
+        if len(patterns) < 2 or len({p.flags for p in patterns}) != 1:
+            return tuple(patterns)
+        try:
+            return (
+                re.compile(
+                    "|".join(f"(?:{p.pattern})" for p in patterns), patterns[0].flags
+                ),
+            )
+        except re.error:
+            # e.g. inline flags that are only valid at the start
+            return tuple(patterns)
+
+    @property
+    def accepts_all(self) -> bool:
+        return not (
+            self.patterns or self.pattern_prefixes or self.prefixes or self.extensions
+        )
+
+    def __call__(self, uri: str) -> bool:
+        if self.extensions and uri.rpartition(".")[2] not in self.extensions:
+            return False
+        if self.prefixes and not self.prefixes.matches(uri):
+            return False
+        if self.pattern_prefixes and self.pattern_prefixes.matches(uri):
+            return True
+        if self.patterns:
+            if self.anchored:
+                return any(p.match(uri) for p in self.patterns)
+            return any(p.search(uri) for p in self.patterns)
+        # No patterns, or only prefixes that did not match
+        return not self.pattern_prefixes
@@ -0,0 +1,16 @@
+import os
+from pathlib import Path
+
+
+def user_cache_dir(*parts: str) -> Path:
+    """
+    Return (and create) a directory in the user cache directory.
+
+    Uses `$XDG_CACHE_HOME/rrdp-tools`, falling back to `~/.cache/rrdp-tools`.
+    """
+    base = os.environ.get("XDG_CACHE_HOME", None)
+    path = Path(base) if base else Path.home() / ".cache"
+    path = path.joinpath("rrdp-tools", *parts)
+
+    path.mkdir(parents=True, exist_ok=True)
+    return path
@@ -0,0 +1,176 @@
+"""
+Write and remove files with a pool of threads.
+
+Operations are sharded over the threads by path, each thread has a bounded
+queue: operations on the same path are applied in the order they were
+submitted, and the producer blocks when the writers fall behind.
+
+The modification times of the objects are either parsed by the writer
+threads, or by a `TimestampStage` (`time_processes`) and set after the file
+was written.
+"""
+import logging
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from types import TracebackType
+from typing import Callable, List, Optional, Set, Type
+
+from rrdp_tools.rpki import parse_file_time
+
+from .timestamps import TimestampStage
+
+LOG = logging.getLogger(__name__)
+
+DEFAULT_WRITERS = 8
+# Operations queued per thread
+QUEUE_SIZE = 256
+
+
+class FileWriter:
+    """
+    Write files on `workers` threads (synchronously when `workers` is 0).
+
+    Errors are raised by the next `write`/`unlink` or by `close`.
+    """
+
+    def __init__(
+        self,
+        workers: int = DEFAULT_WRITERS,
+        queue_size: int = QUEUE_SIZE,
+        time_processes: int = 0,
+    ):
+        self.workers = workers
+        self.files_written = 0
+        self.files_removed = 0
+        self.directories_created = 0
+        # Directories that exist: created once, not for every file
+        self._directories: Set[Path] = set()
+        self._error: Optional[BaseException] = None
+        self._lock = threading.Lock()
+        self._queues: List[queue.Queue] = [
+            queue.Queue(maxsize=queue_size) for _ in range(workers)
+        ]
+        self._threads = [
+            threading.Thread(
+                target=self._run, args=(q,), name=f"writer-{i}", daemon=True
+            )
+            for i, q in enumerate(self._queues)
+        ]
+        for thread in self._threads:
+            thread.start()
+        self._timestamps = (
+            TimestampStage(self.utime, time_processes) if time_processes else None
+        )
+        self._started = time.monotonic()
+
+    def _run(self, operations: queue.Queue) -> None:
+        while True:
+            operation = operations.get()
+            if operation is None:
+                return
+            if self._error is not None:
+                # Drain the queue so the producer does not block
+                continue
+            try:
+                operation()
+            except BaseException as e:
+                self._error = e
+
+    def _submit(self, path: Path, operation: Callable[[], None]) -> None:
+        if self._error is not None:
+            raise self._error
+        if not self.workers:
+            operation()
+            return
+        self._queues[hash(path) % self.workers].put(operation)
+
+    def _ensure_directory(self, directory: Path) -> None:
+        if directory not in self._directories:
+            directory.mkdir(parents=True, exist_ok=True)
+            with self._lock:
+                self._directories.add(directory)
+                self.directories_created += 1
+
+    def write(self, path: Path, content: bytes, parse_for_time: bool = False) -> None:
+        """
+        Write `content` to `path`.
+
+        With `parse_for_time` the modification time is set to the time in the
+        object (see `parse_file_time`).
+        """
+        parse_inline = parse_for_time and self._timestamps is None
+
+        def write() -> None:
+            self._ensure_directory(path.parent)
+            with open(path, "wb") as f:
+                # Accept empty publish tags/empty files
+                f.write(content)
+
+            # Update modification time
+            if parse_inline:
+                timestamp = datetime.timestamp(parse_file_time(path.name, content))
+                os.utime(path, (timestamp, timestamp))
+            with self._lock:
+                self.files_written += 1
+
+        self._submit(path, write)
+        if parse_for_time and self._timestamps is not None:
+            self._timestamps.submit(path, content)
+
+    def utime(self, path: Path, timestamp: float) -> None:
+        """Set the modification time of `path`, if it still exists."""
+
+        def utime() -> None:
+            try:
+                os.utime(path, (timestamp, timestamp))
+            except FileNotFoundError:
+                # Withdrawn before the time was parsed
+                pass
+
+        self._submit(path, utime)
+
+    def unlink(self, path: Path) -> None:
+        def unlink() -> None:
+            path.unlink(missing_ok=True)
+            with self._lock:
+                self.files_removed += 1
+
+        self._submit(path, unlink)
+
+    def close(self) -> None:
+        """Wait for the queued operations."""
+        try:
+            if self._timestamps is not None:
+                self._timestamps.close()
+                self._timestamps = None
+        finally:
+            for operations in self._queues:
+                operations.put(None)
+            for thread in self._threads:
+                thread.join()
+            self._queues, self._threads = [], []
+
+        LOG.info(
+            "Wrote %d files, removed %d files and created %d directories in %.1fs",
+            self.files_written,
+            self.files_removed,
+            self.directories_created,
+            time.monotonic() - self._started,
+        )
+        if self._error is not None:
+            raise self._error
+
+    def __enter__(self) -> "FileWriter":
+        return self
+
+    def __exit__(
+        self,
+        exc_type: Optional[Type[BaseException]],
+        exc: Optional[BaseException],
+        tb: Optional[TracebackType],
+    ) -> None:
+        self.close()
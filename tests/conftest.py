@@ -0,0 +1,14 @@
+import pytest_asyncio
+
+from rrdp_tools.local_server import SyntheticRepository, serve
+
+
+@pytest_asyncio.fixture
+async def rrdp_server():
+    """An RRDP server for a synthetic repository with five deltas."""
+    repository = SyntheticRepository()
+    for _ in range(5):
+        repository.add_delta()
+
+    async with serve(repository) as server:
+        yield server
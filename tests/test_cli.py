@@ -0,0 +1,70 @@
+import re
+import subprocess
+import sys
+
+import pytest
+from click.testing import CliRunner
+
+from rrdp_tools.cli import COMMANDS, cli
+
+# Modules that are slow to import and should only be loaded when used
+HEAVY_MODULES = ["aiohttp", "alive_progress", "asn1crypto", "asn1tools", "lxml"]
+
+# Import time budget for `rrdp_tools.cli` (it was ~600ms with eager imports)
+IMPORT_BUDGET_US = 200_000
+
+
+def run_python(code: str, *args: str) -> subprocess.CompletedProcess:
+    return subprocess.run(
+        [sys.executable, *args, "-c", code],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+
+
+def test_help_does_not_import_commands() -> None:
+    res = run_python(
+        "import sys\n"
+        "from click.testing import CliRunner\n"
+        "from rrdp_tools.cli import cli\n"
+        "assert CliRunner().invoke(cli, ['--help']).exit_code == 0\n"
+        "print(','.join(sorted(sys.modules)))\n"
+    )
+    loaded = set(res.stdout.strip().split(","))
+
+    for module in HEAVY_MODULES:
+        assert module not in loaded
+
+
+def test_import_time() -> None:
+    res = run_python("import rrdp_tools.cli", "-X", "importtime")
+
+    cumulative = re.search(
+        r"\|\s*(\d+)\s*\|\s*rrdp_tools\.cli$", res.stderr, re.MULTILINE
+    )
+    assert cumulative is not None
+    assert int(cumulative.group(1)) < IMPORT_BUDGET_US
+
+
+def test_schemas_are_not_compiled_on_import() -> None:
+    res = run_python(
+        "import sys\n"
+        "import rrdp_tools.rpki, rrdp_tools.rrdp\n"
+        "print('asn1tools' in sys.modules, "
+        "rrdp_tools.rrdp.get_schema.cache_info().currsize, "
+        "rrdp_tools.rpki.get_rfc_9286_asn1.cache_info().currsize)\n"
+    )
+    assert res.stdout.strip() == "False 0 0"
+
+
+@pytest.mark.parametrize("name", COMMANDS.keys())
+def test_lazy_command(name: str) -> None:
+    command = cli.get_command(None, name)
+
+    assert command.name == name
+    # The static help text is shown in --help
+    assert command.get_short_help_str(limit=200) == COMMANDS[name][1]
+
+    res = CliRunner().invoke(cli, [name, "--help"])
+    assert res.exit_code == 0
@@ -0,0 +1,76 @@
+import bz2
+import gzip
+import io
+import lzma
+import pathlib
+import re
+import shutil
+
+import pytest
+
+from rrdp_tools.compression import find_rrdp_files, open_rrdp_file
+from rrdp_tools.reconstruct import reconstruct_repo
+from rrdp_tools.rrdp import iter_snapshot_or_delta, parse_snapshot_or_delta
+from rrdp_tools.rrdp_content_filter import process_file
+
+SAMPLE_SNAPSHOT = pathlib.Path(__file__).parent / "data/sample-snapshot.xml"
+
+
+def zstd_compress(data: bytes) -> bytes:
+    zstandard = pytest.importorskip("zstandard")
+    return zstandard.ZstdCompressor().compress(data)
+
+
+COMPRESSORS = {
+    ".gz": gzip.compress,
+    ".bz2": bz2.compress,
+    ".xz": lzma.compress,
+    ".zst": zstd_compress,
+}
+
+
+@pytest.mark.parametrize("suffix", COMPRESSORS.keys())
+def test_compressed_input(suffix: str, tmp_path: pathlib.Path) -> None:
+    content = SAMPLE_SNAPSHOT.read_bytes()
+    compressed = tmp_path / f"snapshot.xml{suffix}"
+    compressed.write_bytes(COMPRESSORS[suffix](content))
+
+    with open_rrdp_file(compressed) as f:
+        assert f.read() == content
+
+    expected = list(iter_snapshot_or_delta(SAMPLE_SNAPSHOT))
+    assert list(iter_snapshot_or_delta(compressed)) == expected
+    assert parse_snapshot_or_delta(compressed) == parse_snapshot_or_delta(
+        SAMPLE_SNAPSHOT
+    )
+
+    reconstruct_repo(compressed, tmp_path / "out", [])
+    assert len(list((tmp_path / "out").rglob("*.roa"))) > 25
+
+
+def test_uncompressed_input(tmp_path: pathlib.Path) -> None:
+    with open_rrdp_file(SAMPLE_SNAPSHOT) as f:
+        # Read in chunks through a buffer, not mapped
+        assert isinstance(f, io.BufferedReader)
+        assert f.read() == SAMPLE_SNAPSHOT.read_bytes()
+
+    empty = tmp_path / "empty.xml"
+    empty.touch()
+    with open_rrdp_file(empty) as f:
+        assert f.read() == b""
+
+
+def test_find_rrdp_files(tmp_path: pathlib.Path) -> None:
+    source = pathlib.Path(__file__).parent / "data/rrdp-content/26291.xml"
+    shutil.copy(source, tmp_path / "26291.xml")
+    with gzip.open(tmp_path / "26293.xml.gz", "wb") as f:
+        f.write(source.with_name("26293.xml").read_bytes())
+    (tmp_path / "unrelated.txt").touch()
+
+    files = find_rrdp_files(tmp_path)
+    assert [file.name for file in files] == ["26291.xml", "26293.xml.gz"]
+
+    matches = [
+        match for file in files for match in process_file(file, re.compile(".*"))
+    ]
+    assert {match.serial for match in matches} == {26291, 26293}
@@ -0,0 +1,187 @@
+import asyncio
+import hashlib
+import pathlib
+import urllib.parse
+
+import aiohttp
+import pytest
+import pytest_asyncio
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+import rrdp_tools.hash_index
+from rrdp_tools.download import download_to_file, part_file_for
+from rrdp_tools.hash_index import HashIndex
+from rrdp_tools.local_server import ServerConfig, SyntheticRepository, serve
+from rrdp_tools.reconstruct import http_get_delta_or_snapshot
+from rrdp_tools.snapshot_rrdp import get_and_check
+
+CONTENT = (
+    pathlib.Path(__file__).parent.joinpath("data/sample-snapshot.xml").read_bytes()
+)
+CONTENT_HASH = hashlib.sha256(CONTENT).hexdigest()
+
+
+async def serve_content(request: web.Request) -> web.Response:
+    return web.Response(body=CONTENT)
+
+
+@pytest_asyncio.fixture
+async def server():
+    app = web.Application()
+    app.router.add_get("/snapshot.xml", serve_content)
+
+    async with TestServer(app) as server:
+        yield server
+
+
+@pytest.mark.asyncio
+async def test_download_to_file(server: TestServer, tmp_path: pathlib.Path) -> None:
+    target = tmp_path / "snapshot.xml"
+
+    async with aiohttp.ClientSession() as session:
+        async with session.get(server.make_url("/snapshot.xml")) as res:
+            digest = await download_to_file(res, target, CONTENT_HASH, chunk_size=1024)
+
+    assert digest == CONTENT_HASH
+    assert target.read_bytes() == CONTENT
+    assert list(tmp_path.iterdir()) == [target]
+
+
+@pytest.mark.asyncio
+async def test_download_to_file_hash_mismatch(
+    server: TestServer, tmp_path: pathlib.Path
+) -> None:
+    target = tmp_path / "snapshot.xml"
+
+    async with aiohttp.ClientSession() as session:
+        async with session.get(server.make_url("/snapshot.xml")) as res:
+            with pytest.raises(ValueError):
+                await download_to_file(res, target, "00" * 32)
+
+    # Neither the target nor the temporary file are present
+    assert list(tmp_path.iterdir()) == []
+
+
+@pytest.mark.asyncio
+async def test_get_and_check(server: TestServer, tmp_path: pathlib.Path) -> None:
+    target = tmp_path / "snapshot.xml"
+    uri = str(server.make_url("/snapshot.xml"))
+
+    async with aiohttp.ClientSession() as session:
+        sem = asyncio.Semaphore(1)
+        assert await get_and_check(sem, session, target, uri, CONTENT_HASH, None)
+        assert target.read_bytes() == CONTENT
+
+        # The file is present with the right hash
+        assert not await get_and_check(sem, session, target, uri, CONTENT_HASH, None)
+
+
+@pytest.mark.asyncio
+async def test_get_and_check_hash_index(
+    server: TestServer, tmp_path: pathlib.Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    target = tmp_path / "snapshot.xml"
+    uri = str(server.make_url("/snapshot.xml"))
+
+    def fail_hash_file(path: pathlib.Path) -> str:
+        raise AssertionError(f"{path} was hashed")
+
+    async with aiohttp.ClientSession() as session:
+        sem = asyncio.Semaphore(1)
+        with HashIndex(tmp_path) as index:
+            assert await get_and_check(
+                sem, session, target, uri, CONTENT_HASH, None, hash_index=index
+            )
+            # The hash of the download is recorded, the file is not read again
+            monkeypatch.setattr(rrdp_tools.hash_index, "hash_file", fail_hash_file)
+            assert not await get_and_check(
+                sem, session, target, uri, CONTENT_HASH, None, hash_index=index
+            )
+
+
+@pytest.fixture
+def large_repository() -> SyntheticRepository:
+    repository = SyntheticRepository(objects_per_delta=10, object_size=100_000)
+    repository.add_delta()
+    return repository
+
+
+@pytest.mark.asyncio
+async def test_get_and_check_resume(
+    large_repository: SyntheticRepository, tmp_path: pathlib.Path
+) -> None:
+    target = tmp_path / "snapshot.xml"
+    notification = large_repository.notification
+    content = large_repository.get_document(
+        f"/{notification.session_id}/{notification.serial}/snapshot.xml"
+    )
+    sha256 = notification.snapshot.hash
+
+    config = ServerConfig(truncate_after=len(content) // 3 + 1)
+    async with serve(large_repository, config) as server:
+        uri = large_repository.notification.snapshot.uri
+        async with aiohttp.ClientSession() as session:
+            sem = asyncio.Semaphore(1)
+            for _ in range(2):
+                with pytest.raises(aiohttp.ClientError):
+                    await get_and_check(sem, session, target, uri, sha256, None)
+                assert part_file_for(target).exists()
+
+            assert await get_and_check(sem, session, target, uri, sha256, None)
+
+        # Every byte is sent once
+        assert server.bytes_sent == len(content)
+
+    assert target.read_bytes() == content
+    assert list(tmp_path.iterdir()) == [target]
+
+
+@pytest.mark.asyncio
+async def test_get_and_check_resume_changed(
+    large_repository: SyntheticRepository, tmp_path: pathlib.Path
+) -> None:
+    target = tmp_path / "snapshot.xml"
+    # A partial download of another version of the document
+    part_file_for(target).write_bytes(b"<snapshot")
+    target.with_name("snapshot.xml.part.etag").write_text('"other"')
+
+    async with serve(large_repository) as server:
+        snapshot = large_repository.notification.snapshot
+        async with aiohttp.ClientSession() as session:
+            assert await get_and_check(
+                asyncio.Semaphore(1), session, target, snapshot.uri, snapshot.hash, None
+            )
+
+        # If-Range did not match: the complete document is sent
+        assert server.bytes_sent == target.stat().st_size
+    assert list(tmp_path.iterdir()) == [target]
+
+
+@pytest.mark.asyncio
+async def test_http_get_delta_or_snapshot(
+    large_repository: SyntheticRepository, tmp_path: pathlib.Path
+) -> None:
+    stale = tmp_path / ("00" * 32 + ".xml")
+    stale.write_bytes(b"")
+
+    config = ServerConfig(truncate_after=500_000)
+    async with serve(large_repository, config) as server:
+        with pytest.raises(aiohttp.ClientError):
+            await http_get_delta_or_snapshot(server.url, tmp_path)
+
+        server.config.truncate_after = None
+        snapshot = await http_get_delta_or_snapshot(server.url, tmp_path)
+        notification = large_repository.notification
+        assert snapshot.name == notification.snapshot.hash + ".xml"
+        # The snapshot is resumed, not downloaded again
+        notification_size = len(str(notification).encode("utf-8"))
+        assert server.bytes_sent == snapshot.stat().st_size + 2 * notification_size
+
+        # A cached snapshot is not downloaded again
+        assert await http_get_delta_or_snapshot(server.url, tmp_path) == snapshot
+        assert (
+            server.requests[urllib.parse.urlparse(notification.snapshot.uri).path] == 2
+        )
+
+    assert list(tmp_path.iterdir()) == [snapshot]
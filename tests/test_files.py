@@ -0,0 +1,19 @@
+import pathlib
+
+import pytest
+
+from rrdp_tools.files import write_atomic
+
+
+def test_write_atomic(tmp_path: pathlib.Path) -> None:
+    path = tmp_path / "file"
+    write_atomic(path, "text")
+    assert path.read_text() == "text"
+    write_atomic(path, b"bytes")
+    assert path.read_bytes() == b"bytes"
+
+    # The temporary file is removed when writing fails
+    with pytest.raises(TypeError):
+        write_atomic(path, None)
+    assert [p.name for p in tmp_path.iterdir()] == ["file"]
+    assert path.read_bytes() == b"bytes"
@@ -0,0 +1,99 @@
+import hashlib
+import os
+import pathlib
+
+import pytest
+
+import rrdp_tools.hash_index
+from rrdp_tools.hash_index import INDEX_DIR_NAME, HashIndex
+
+
+def write_old_file(path: pathlib.Path, content: bytes, mtime: int = 1_000_000) -> str:
+    """Write a file with an mtime outside of the racy window."""
+    path.write_bytes(content)
+    os.utime(path, (mtime, mtime))
+    return hashlib.sha256(content).hexdigest()
+
+
+@pytest.fixture
+def hash_calls(monkeypatch: pytest.MonkeyPatch):
+    calls = []
+    hash_file = rrdp_tools.hash_index.hash_file
+
+    def counting_hash_file(path: pathlib.Path) -> str:
+        calls.append(path)
+        return hash_file(path)
+
+    monkeypatch.setattr(rrdp_tools.hash_index, "hash_file", counting_hash_file)
+    return calls
+
+
+def test_hash_index(tmp_path: pathlib.Path, hash_calls) -> None:
+    target = tmp_path / "snapshot.xml"
+    digest = write_old_file(target, b"snapshot")
+
+    with HashIndex(tmp_path) as index:
+        assert index.sha256(tmp_path / "missing.xml") is None
+        assert index.sha256(target) == digest
+        assert index.sha256(target) == digest
+    assert hash_calls == [target]
+
+    # Persisted across instances
+    with HashIndex(tmp_path) as index:
+        assert index.sha256(target) == digest
+    assert len(hash_calls) == 1
+
+    # Changing the mtime or size invalidates the entry
+    new_digest = write_old_file(target, b"snapshot!")
+    with HashIndex(tmp_path) as index:
+        assert index.sha256(target) == new_digest
+    assert len(hash_calls) == 2
+
+
+def test_hash_index_racy_file(tmp_path: pathlib.Path, hash_calls) -> None:
+    """A file that was just modified is hashed every time."""
+    target = tmp_path / "1.xml"
+    target.write_bytes(b"delta")
+
+    with HashIndex(tmp_path) as index:
+        index.sha256(target)
+        index.sha256(target)
+    assert len(hash_calls) == 2
+
+
+def test_hash_index_update_and_discard(tmp_path: pathlib.Path, hash_calls) -> None:
+    target = tmp_path / "1.xml"
+    digest = write_old_file(target, b"delta")
+
+    with HashIndex(tmp_path) as index:
+        index.update(target, digest)
+        assert index.sha256(target) == digest
+        assert not hash_calls
+
+        index.discard(target)
+        assert index.sha256(target) == digest
+        assert hash_calls == [target]
+
+
+def test_hash_index_readonly(tmp_path: pathlib.Path, hash_calls) -> None:
+    target = tmp_path / "1.xml"
+    digest = write_old_file(target, b"delta")
+
+    # Not created when it does not exist, not created when unused
+    assert HashIndex.open_existing(tmp_path) is None
+    HashIndex(tmp_path).close()
+    assert not (tmp_path / INDEX_DIR_NAME).exists()
+
+    with HashIndex(tmp_path) as index:
+        index.update(target, "00" * 32)
+
+    with HashIndex.open_existing(tmp_path) as index:
+        assert index.sha256(target) == "00" * 32
+        # Modified files are hashed, but the result is not stored
+        digest = write_old_file(target, b"delta!")
+        assert index.sha256(target) == digest
+        index.update(target, digest)
+
+    with HashIndex(tmp_path) as index:
+        assert index.sha256(target) == digest
+    assert len(hash_calls) == 2
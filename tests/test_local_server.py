@@ -0,0 +1,108 @@
+import pathlib
+import time
+
+import aiohttp
+import pytest
+
+from rrdp_tools.benchmark import format_results, run_benchmark
+from rrdp_tools.local_server import (
+    DirectoryRepository,
+    ServerConfig,
+    SyntheticRepository,
+    serve,
+)
+from rrdp_tools.rrdp import parse_notification_file
+from rrdp_tools.snapshot_rrdp import snapshot_rrdp
+
+
+def synthetic_repository(deltas: int = 3, **kwargs) -> SyntheticRepository:
+    repository = SyntheticRepository(**kwargs)
+    for _ in range(deltas):
+        repository.add_delta()
+    return repository
+
+
+@pytest.mark.asyncio
+async def test_etag() -> None:
+    async with serve(synthetic_repository()) as server:
+        async with aiohttp.ClientSession() as session:
+            async with session.get(server.url) as res:
+                etag = res.headers["ETag"]
+            async with session.get(server.url, headers={"If-None-Match": etag}) as res:
+                assert res.status == 304
+
+
+@pytest.mark.asyncio
+async def test_latency_and_bandwidth() -> None:
+    repository = synthetic_repository(deltas=1, objects_per_delta=4, object_size=25_000)
+    config = ServerConfig(latency=0.05, bandwidth=500_000)
+
+    async with serve(repository, config) as server:
+        async with aiohttp.ClientSession() as session:
+            async with session.get(server.url) as res:
+                notification = parse_notification_file(await res.read())
+
+            t0 = time.monotonic()
+            async with session.get(notification.deltas[0].uri) as res:
+                body = await res.read()
+            elapsed = time.monotonic() - t0
+
+    # latency + 100KB at 500KB/s
+    assert len(body) > 100_000
+    assert elapsed >= 0.05 + len(body) / 500_000 * 0.9
+    assert server.bytes_sent >= len(body)
+
+
+@pytest.mark.asyncio
+async def test_error_injection() -> None:
+    config = ServerConfig(error_rate=1.0, error_status=503)
+    async with serve(synthetic_repository(), config) as server:
+        async with aiohttp.ClientSession() as session:
+            # The notification file is not affected
+            async with session.get(server.url) as res:
+                notification = parse_notification_file(await res.read())
+            async with session.get(notification.snapshot.uri) as res:
+                assert res.status == 503
+
+
+@pytest.mark.asyncio
+async def test_directory_repository(rrdp_server, tmp_path: pathlib.Path) -> None:
+    await snapshot_rrdp(rrdp_server.url, tmp_path)
+    (tmp_path / "1.xml").unlink()
+
+    # Serve the downloaded files, the missing delta is not listed
+    mirror_path = tmp_path / "mirror"
+    mirror_path.mkdir()
+    async with serve(DirectoryRepository(tmp_path)) as server:
+        await snapshot_rrdp(server.url, mirror_path)
+
+    assert sorted(p.name for p in mirror_path.glob("*.xml")) == [
+        "2.xml",
+        "3.xml",
+        "4.xml",
+        "5.xml",
+        "notification.xml",
+        "snapshot-5.xml",
+    ]
+    for name in ("snapshot-5.xml", "5.xml"):
+        assert (mirror_path / name).read_bytes() == (tmp_path / name).read_bytes()
+
+
+@pytest.mark.asyncio
+async def test_run_benchmark() -> None:
+    results = await run_benchmark(
+        synthetic_repository(deltas=10),
+        ["snapshot-rrdp", "loop-over-deltas", "reconstruct-repo"],
+        [1, 4],
+    )
+
+    assert [(r.command, r.threads) for r in results] == [
+        ("snapshot-rrdp", 1),
+        ("snapshot-rrdp", 4),
+        ("loop-over-deltas", 1),
+        ("loop-over-deltas", 4),
+        ("reconstruct-repo", 1),
+    ]
+    assert [r.files for r in results] == [11, 11, 10, 10, 1]
+    assert all(r.error is None and r.bytes > 0 for r in results)
+    assert format_results(results).startswith("command")
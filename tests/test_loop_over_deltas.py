@@ -0,0 +1,202 @@
+import asyncio
+import pathlib
+import time
+from typing import Set
+
+import aiohttp
+import pytest
+
+from rrdp_tools.local_server import ServerConfig, SyntheticRepository, serve
+from rrdp_tools.loop_over_deltas import (
+    DeltaRangeProber,
+    attempt_delta_download,
+    read_retry_file,
+)
+from rrdp_tools.object_store import ObjectStore
+from rrdp_tools.scheduling import HttpStatusError, RetryPolicy, TokenBucket
+
+
+class FakeProber(DeltaRangeProber):
+    def __init__(self, existing: Set[int]) -> None:
+        super().__init__(None, "{}")
+        self.existing = existing
+
+    async def exists(self, serial: int) -> bool:
+        self.sizes[serial] = 1 if serial in self.existing else None
+        return serial in self.existing
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "first,last",
+    [(0, 99_999), (0, 10), (99_990, 99_999), (1_234, 56_789), (40_000, 49_999)],
+)
+async def test_find_range(first: int, last: int) -> None:
+    prober = FakeProber(set(range(first, last + 1)))
+    assert await prober.find_range(0, 100_000) == (first, last)
+    assert len(prober.sizes) < 100
+
+
+@pytest.mark.asyncio
+async def test_find_range_single() -> None:
+    # Finding a small range needs more probes, but not a request per serial
+    prober = FakeProber({400})
+    assert await prober.find_range(0, 1000) == (400, 400)
+    assert len(prober.sizes) < 1000
+
+
+@pytest.mark.asyncio
+async def test_find_range_missing() -> None:
+    prober = FakeProber(set())
+    assert await prober.find_range(0, 100) is None
+    assert await prober.find_range(10, 10) is None
+
+
+@pytest.mark.asyncio
+async def test_find_range_server_errors() -> None:
+    repository = SyntheticRepository()
+    for _ in range(40):
+        repository.add_delta()
+
+    async with serve(repository, ServerConfig(error_rate=0.3, seed=1)) as server:
+        template = repository.delta_url_template()
+        async with aiohttp.ClientSession() as session:
+            # Server errors are retried, not taken for missing deltas
+            prober = DeltaRangeProber(
+                session,
+                template,
+                retry_policy=RetryPolicy(attempts=10, base_delay=0.001),
+            )
+            assert await prober.find_range(1, 1000) == (1, 40)
+
+            # and fail the discovery when they persist
+            server.config.error_rate = 1.0
+            prober = DeltaRangeProber(
+                session, template, retry_policy=RetryPolicy(attempts=2, base_delay=0)
+            )
+            with pytest.raises(HttpStatusError):
+                await prober.find_range(1, 1000)
+
+
+@pytest.mark.asyncio
+async def test_attempt_delta_download_discover(tmp_path: pathlib.Path) -> None:
+    repository = SyntheticRepository()
+    for _ in range(20):
+        repository.add_delta()
+
+    async with serve(repository) as server:
+        template = repository.delta_url_template()
+        metrics = await attempt_delta_download(
+            template, tmp_path, 0, 200, discover=True, workers=4
+        )
+
+        assert sorted(int(p.stem) for p in tmp_path.glob("*.xml")) == list(range(1, 21))
+        # Probes plus one GET per delta
+        assert len(metrics.requests) < 20 + 40
+        bytes_sent = server.bytes_sent
+
+        # Files with the right size are not downloaded again
+        (tmp_path / "7.xml").write_bytes(b"truncated")
+        await attempt_delta_download(
+            template, tmp_path, 0, 200, discover=True, workers=4
+        )
+        assert server.bytes_sent - bytes_sent == len(
+            repository.get_document(f"/{repository.session_id}/7/delta.xml")
+        )
+        assert (tmp_path / "7.xml").stat().st_size > len(b"truncated")
+
+
+@pytest.mark.asyncio
+async def test_attempt_delta_download_retries(tmp_path: pathlib.Path) -> None:
+    repository = SyntheticRepository()
+    for _ in range(20):
+        repository.add_delta()
+
+    async with serve(repository, ServerConfig(error_rate=0.3, seed=1)) as server:
+        metrics = await attempt_delta_download(
+            repository.delta_url_template(),
+            tmp_path,
+            1,
+            21,
+            workers=4,
+            retry_policy=RetryPolicy(attempts=10, base_delay=0.001),
+        )
+
+    assert sorted(int(p.stem) for p in tmp_path.glob("*.xml")) == list(range(1, 21))
+    # One request per delta, the others are retries
+    assert metrics.summary()["retries"] == len(metrics.requests) - 20 > 0
+    assert sum(server.requests.values()) == len(metrics.requests)
+
+
+@pytest.mark.asyncio
+async def test_attempt_delta_download_retry_file(tmp_path: pathlib.Path) -> None:
+    repository = SyntheticRepository()
+    for _ in range(5):
+        repository.add_delta()
+    retry_file = tmp_path / "retry"
+    output = tmp_path / "output"
+    output.mkdir()
+
+    async with serve(repository, ServerConfig(error_rate=1.0)) as server:
+        template = repository.delta_url_template()
+        await attempt_delta_download(
+            template,
+            output,
+            1,
+            11,
+            retry_policy=RetryPolicy(attempts=2, base_delay=0.001),
+            retry_file=retry_file,
+        )
+        # Serials that do not exist are not failures
+        assert read_retry_file(retry_file) == [1, 2, 3, 4, 5]
+        assert not list(output.glob("*.xml"))
+
+        # A rerun downloads the failed serials as well as the range
+        server.config.error_rate = 0.0
+        server.requests.clear()
+        await attempt_delta_download(template, output, 1, 2, retry_file=retry_file)
+        assert sum(server.requests.values()) == 5
+        assert len(list(output.glob("*.xml"))) == 5
+        assert not retry_file.exists()
+
+        # The failed serials do not replace the range
+        retry_file.write_text("99\n")
+        server.requests.clear()
+        await attempt_delta_download(template, output, 6, 7, retry_file=retry_file)
+        assert set(server.requests) == {
+            f"/{repository.session_id}/{serial}/delta.xml" for serial in (6, 99)
+        }
+
+
+@pytest.mark.asyncio
+async def test_attempt_delta_download_object_store(tmp_path: pathlib.Path) -> None:
+    pytest.importorskip("zstandard")
+    repository = SyntheticRepository()
+    for _ in range(5):
+        repository.add_delta()
+    store = ObjectStore(tmp_path / "store")
+    output = tmp_path / "output"
+    output.mkdir()
+
+    async with serve(repository) as server:
+        template = repository.delta_url_template()
+        await attempt_delta_download(template, output, 1, 6, object_store=store)
+        assert sum(server.requests.values()) == 5
+        assert not list(output.glob("*.xml"))
+
+        # Documents in the store are not requested again
+        server.requests.clear()
+        await attempt_delta_download(template, output, 1, 7, object_store=store)
+        assert list(server.requests) == [f"/{repository.session_id}/6/delta.xml"]
+        assert store.document_names(repository.session_id) == {
+            f"{serial}.xml" for serial in range(1, 6)
+        }
+
+
+@pytest.mark.asyncio
+async def test_token_bucket() -> None:
+    bucket = TokenBucket(rate=100, burst=1)
+    t0 = time.monotonic()
+    await asyncio.gather(*(bucket.acquire() for _ in range(11)))
+    # The first token is available immediately
+    assert time.monotonic() - t0 >= 0.09
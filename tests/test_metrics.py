@@ -0,0 +1,67 @@
+import json
+import pathlib
+
+import pytest
+
+from rrdp_tools.metrics import (
+    METRICS_JSON_NAME,
+    METRICS_PROMETHEUS_NAME,
+    DownloadMetrics,
+    histogram,
+    quantile,
+)
+from rrdp_tools.snapshot_rrdp import snapshot_rrdp
+
+
+def test_histogram_and_quantile() -> None:
+    values = [0.005, 0.2, 0.2, 3.0, 100.0]
+    counts = histogram(values, buckets=(0.01, 0.25, 5.0))
+    assert counts == {"0.01": 1, "0.25": 3, "5.0": 4, "+Inf": 5}
+
+    assert quantile([], 0.5) is None
+    assert quantile(values, 0.5) == 0.2
+    assert quantile(values, 0.9) == 100.0
+
+
+def test_download_metrics() -> None:
+    metrics = DownloadMetrics({"notification_url": 'http://example.org/"n".xml'})
+
+    request = metrics.start("http://example.org/1.xml")
+    request.response_received(200)
+    request.body_received(1000)
+    failed = metrics.start("http://example.org/2.xml")
+    failed.response_received(404)
+    metrics.start("http://example.org/3.xml").error = "connection reset"
+    # Every attempt is a request
+    for attempt in range(3):
+        metrics.start("http://example.org/4.xml").retries = attempt
+    metrics.finish()
+
+    summary = metrics.summary()
+    assert summary["requests"] == 6
+    assert summary["bytes"] == 1000
+    assert summary["status"] == {"200": 1, "404": 1, "error": 4}
+    assert summary["retries"] == 2
+    assert summary["ttfb"]["histogram"]["+Inf"] == 2
+    assert summary["transfer_time"]["histogram"]["+Inf"] == 1
+
+    prometheus = metrics.to_prometheus()
+    labels = 'notification_url="http://example.org/\\"n\\".xml"'
+    assert f'rrdp_download_requests{{{labels},status="404"}} 1' in prometheus
+    assert f"rrdp_download_bytes{{{labels}}} 1000" in prometheus
+    assert f"rrdp_download_retries{{{labels}}} 2" in prometheus
+    assert f'rrdp_download_ttfb_seconds_bucket{{{labels},le="+Inf"}} 2' in prometheus
+    assert f"rrdp_download_ttfb_seconds_count{{{labels}}} 2" in prometheus
+
+
+@pytest.mark.asyncio
+async def test_snapshot_rrdp_metrics(rrdp_server, tmp_path: pathlib.Path) -> None:
+    await snapshot_rrdp(rrdp_server.url, tmp_path, write_metrics=True)
+
+    summary = json.loads((tmp_path / METRICS_JSON_NAME).read_text())
+    assert summary["notification_url"] == rrdp_server.url
+    # notification, snapshot and 5 deltas
+    assert summary["requests"] == 7
+    assert summary["status"] == {"200": 7}
+    assert summary["bytes"] == sum(p.stat().st_size for p in tmp_path.glob("*.xml"))
+    assert (tmp_path / METRICS_PROMETHEUS_NAME).read_text().startswith("# HELP")
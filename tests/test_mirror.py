@@ -0,0 +1,93 @@
+import asyncio
+import pathlib
+
+import pytest
+
+from rrdp_tools.mirror import mirror, output_path_for, read_notification_urls
+from rrdp_tools.scheduling import DownloadLimiter, PrioritySemaphore
+from rrdp_tools.sync_state import SyncState
+
+
+def test_read_notification_urls(tmp_path: pathlib.Path) -> None:
+    url_file = tmp_path / "urls.txt"
+    url_file.write_text(
+        "# RIRs\n"
+        "https://rrdp.ripe.net/notification.xml\n"
+        "\n"
+        "https://rrdp.arin.net/notification.xml  # ARIN\n"
+        "https://rrdp.ripe.net/notification.xml\n"
+    )
+    assert read_notification_urls(url_file) == [
+        "https://rrdp.ripe.net/notification.xml",
+        "https://rrdp.arin.net/notification.xml",
+    ]
+
+
+def test_output_path_for(tmp_path: pathlib.Path) -> None:
+    assert (
+        output_path_for(tmp_path, "https://rrdp.ripe.net/notification.xml")
+        == tmp_path / "rrdp.ripe.net"
+    )
+    assert (
+        output_path_for(tmp_path, "https://ca.example.org:8443/rrdp/notification.xml")
+        == tmp_path / "ca.example.org_8443" / "rrdp"
+    )
+    assert (
+        output_path_for(tmp_path, "https://ca.example.org/../notification.xml")
+        == tmp_path / "ca.example.org"
+    )
+
+
+@pytest.mark.asyncio
+async def test_priority_semaphore_order() -> None:
+    sem = PrioritySemaphore(1)
+    order = []
+
+    async def task(name: str, priority: int) -> None:
+        async with sem.slot(priority):
+            order.append(name)
+            await asyncio.sleep(0)
+
+    await sem.acquire()
+    tasks = [
+        asyncio.create_task(task("snapshot", 1)),
+        asyncio.create_task(task("delta-1", 0)),
+        asyncio.create_task(task("delta-2", 0)),
+    ]
+    await asyncio.sleep(0)
+    sem.release()
+    await asyncio.gather(*tasks)
+
+    assert order == ["delta-1", "delta-2", "snapshot"]
+
+
+@pytest.mark.asyncio
+async def test_download_limiter_per_host() -> None:
+    limiter = DownloadLimiter(4, limit_per_host=1)
+    active = {"a": 0, "b": 0}
+    max_active = {"a": 0, "b": 0}
+
+    async def download(host: str) -> None:
+        async with limiter.slot(f"https://{host}.example.org/file.xml"):
+            active[host] += 1
+            max_active[host] = max(max_active[host], active[host])
+            await asyncio.sleep(0.01)
+            active[host] -= 1
+
+    await asyncio.gather(*(download(host) for host in "abababab"))
+    assert max_active == {"a": 1, "b": 1}
+
+
+@pytest.mark.asyncio
+async def test_mirror(rrdp_server, tmp_path: pathlib.Path) -> None:
+    broken_url = rrdp_server.url.replace("notification.xml", "missing/notification.xml")
+
+    errors = await mirror([rrdp_server.url, broken_url], tmp_path, threads=2)
+
+    # A failing repository does not stop the others
+    assert errors[rrdp_server.url] is None
+    assert isinstance(errors[broken_url], ValueError)
+
+    state = SyncState.load(output_path_for(tmp_path, rrdp_server.url))
+    assert state.serial == 5
+    assert len(state.files) == 6
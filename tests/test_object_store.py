@@ -0,0 +1,101 @@
+import io
+import pathlib
+
+import pytest
+
+from rrdp_tools.object_store import ObjectStore
+from rrdp_tools.rrdp import (
+    DeltaDocument,
+    PublishElement,
+    SnapshotDocument,
+    WithdrawElement,
+    iter_snapshot_or_delta,
+)
+from rrdp_tools.snapshot_rrdp import snapshot_rrdp
+
+# The object store requires zstandard
+pytest.importorskip("zstandard")
+
+SESSION_ID = "9df4b597-af9e-4dca-bdda-719cce2c4e28"
+SAMPLE_SNAPSHOT = pathlib.Path(__file__).parent / "data/sample-snapshot.xml"
+
+
+def write_snapshot(path: pathlib.Path, serial: int, objects) -> str:
+    with path.open("wb") as f:
+        return SnapshotDocument(
+            serial,
+            SESSION_ID,
+            [PublishElement(uri, None, content) for uri, content in objects],
+        ).write_to(f)
+
+
+def test_object_store_deduplicates(tmp_path: pathlib.Path) -> None:
+    store = ObjectStore(tmp_path / "store")
+    objects = [(f"rsync://example.org/repo/{i}.roa", b"roa %d" % i) for i in range(5)]
+
+    sha256_1 = write_snapshot(tmp_path / "snapshot-1.xml", 1, objects)
+    sha256_2 = write_snapshot(
+        tmp_path / "snapshot-2.xml", 2, [*objects, ("rsync://example.org/x", b"x")]
+    )
+
+    store.add_document("snapshot-1.xml", tmp_path / "snapshot-1.xml")
+    manifest = store.add_document("snapshot-2.xml", tmp_path / "snapshot-2.xml")
+
+    assert store.statistics.objects_written == 6
+    assert store.statistics.objects_deduplicated == 5
+    assert manifest.canonical
+    assert store.has_document(SESSION_ID, "snapshot-2.xml", sha256_2)
+    assert not store.has_document(SESSION_ID, "snapshot-2.xml", sha256_1)
+
+    # Documents written by `write_document` are restored byte-for-byte
+    output = io.BytesIO()
+    stored = store.get_manifest(SESSION_ID, "snapshot-2.xml", sha256_2)
+    assert store.write_document(stored, output) == sha256_2
+    assert output.getvalue() == (tmp_path / "snapshot-2.xml").read_bytes()
+
+
+def test_object_store_restores_canonically(tmp_path: pathlib.Path) -> None:
+    store = ObjectStore(tmp_path)
+    manifest = store.add_document("snapshot.xml", SAMPLE_SNAPSHOT)
+    assert not manifest.canonical
+
+    output = tmp_path / "restored.xml"
+    with output.open("wb") as f:
+        assert store.write_document(manifest, f) == manifest.canonical_sha256
+
+    original = list(iter_snapshot_or_delta(SAMPLE_SNAPSHOT))
+    restored = list(iter_snapshot_or_delta(output))
+    assert original == restored
+
+
+def test_object_store_withdraw(tmp_path: pathlib.Path) -> None:
+    store = ObjectStore(tmp_path)
+    elements = [
+        WithdrawElement("rsync://example.org/repo/1.roa", "ab" * 32),
+        PublishElement("rsync://example.org/repo/2.roa", "cd" * 32, b"roa 2"),
+    ]
+
+    with (tmp_path / "2.xml").open("wb") as f:
+        DeltaDocument(2, SESSION_ID, elements).write_to(f)
+
+    manifest = store.add_document("2.xml", tmp_path / "2.xml")
+    assert list(store.iter_elements(manifest)) == elements
+
+
+@pytest.mark.asyncio
+async def test_snapshot_rrdp_object_store(rrdp_server, tmp_path: pathlib.Path) -> None:
+    output_path = tmp_path / "output"
+    output_path.mkdir()
+    store = ObjectStore(tmp_path / "store")
+
+    await snapshot_rrdp(rrdp_server.url, output_path, object_store=store)
+
+    # Documents are moved into the store
+    assert sorted(p.name for p in output_path.glob("*.xml")) == ["notification.xml"]
+    assert store.statistics.objects_written == 5
+    assert store.statistics.objects_deduplicated == 5
+
+    # ... and not downloaded again
+    rrdp_server.requests.clear()
+    await snapshot_rrdp(rrdp_server.url, output_path, object_store=store)
+    assert list(rrdp_server.requests) == ["/notification.xml"]
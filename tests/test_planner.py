@@ -0,0 +1,108 @@
+import pathlib
+
+import pytest
+
+from rrdp_tools.planner import DELTAS, FULL, REQUEST_COST, SNAPSHOT, plan_downloads
+from rrdp_tools.rrdp import DeltaElement, NotificationDocument, SnapshotElement
+from rrdp_tools.scheduling import DownloadLimiter
+from rrdp_tools.snapshot_rrdp import snapshot_rrdp
+from rrdp_tools.sync_state import SyncState
+
+SESSION_ID = "9df4b597-af9e-4dca-bdda-719cce2c4e28"
+
+
+def notification(serial: int) -> NotificationDocument:
+    return NotificationDocument(
+        SnapshotElement("ab" * 32, f"https://example.org/{serial}/snapshot.xml"),
+        [
+            DeltaElement(s, f"{s:064x}", f"https://example.org/{s}/delta.xml")
+            for s in range(serial, 0, -1)
+        ],
+        serial,
+        SESSION_ID,
+    )
+
+
+async def plan(state, **kwargs):
+    # All sizes are known or estimated: no requests are made
+    return await plan_downloads(
+        DownloadLimiter(1), None, notification(10), state, **kwargs
+    )
+
+
+@pytest.mark.asyncio
+async def test_plan_without_state() -> None:
+    result = await plan(None, limit_deltas=3)
+    assert result.strategy == FULL
+    assert [d.file_name for d in result.downloads] == [
+        "snapshot-10.xml",
+        "10.xml",
+        "9.xml",
+        "8.xml",
+    ]
+
+    result = await plan(SyncState("other-session", 8), skip_snapshot=True)
+    assert result.strategy == FULL
+    assert len(result.downloads) == 10
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "delta_size,snapshot_size,strategy",
+    [(100, 1_000_000, DELTAS), (1_000_000, 100, SNAPSHOT)],
+)
+async def test_plan_cheapest(delta_size: int, snapshot_size: int, strategy) -> None:
+    sizes = {f"{s:064x}": delta_size for s in range(1, 11)}
+    state = SyncState(SESSION_ID, 7, sizes=sizes, snapshot_size=snapshot_size)
+
+    result = await plan(state)
+    assert result.strategy == strategy
+    if strategy == DELTAS:
+        assert [d.file_name for d in result.downloads] == ["8.xml", "9.xml", "10.xml"]
+        assert result.cost == 3 * (delta_size + REQUEST_COST)
+    else:
+        # The size of the previous snapshot is an estimate
+        assert result.estimated
+        assert "~" in result.format()
+
+
+@pytest.mark.asyncio
+async def test_plan_estimates_deltas() -> None:
+    # The new deltas are estimated from the mean of the known deltas
+    sizes = {f"{s:064x}": 1000 for s in range(1, 8)}
+    state = SyncState(SESSION_ID, 7, sizes=sizes, snapshot_size=100_000)
+
+    result = await plan(state)
+    assert result.strategy == DELTAS
+    assert result.size == 3000
+    assert all(d.estimated for d in result.downloads)
+
+    # Unless the snapshot is skipped
+    result = await plan(SyncState(SESSION_ID, 7), skip_snapshot=True)
+    assert result.strategy == DELTAS
+    assert result.size is None
+
+
+@pytest.mark.asyncio
+async def test_snapshot_rrdp_plan(rrdp_server, tmp_path: pathlib.Path, capsys) -> None:
+    repository = rrdp_server.repository
+    await snapshot_rrdp(rrdp_server.url, tmp_path, incremental=True)
+    for _ in range(10):
+        repository.add_delta()
+
+    # The dry run prints the plan, without downloading or writing anything
+    files = sorted(tmp_path.iterdir())
+    rrdp_server.requests.clear()
+    capsys.readouterr()
+    await snapshot_rrdp(rrdp_server.url, tmp_path, incremental=True, dry_run=True)
+    assert list(rrdp_server.requests) == ["/notification.xml"]
+    assert sorted(tmp_path.iterdir()) == files
+    assert capsys.readouterr().out.startswith("Plan: snapshot (from serial 5")
+
+    # Ten requests for tiny deltas cost more than the snapshot
+    await snapshot_rrdp(rrdp_server.url, tmp_path, incremental=True)
+    assert (tmp_path / "snapshot-15.xml").exists()
+    assert not (tmp_path / "6.xml").exists()
+    state = SyncState.load(tmp_path)
+    assert state.serial == 15
+    assert state.snapshot_size == (tmp_path / "snapshot-15.xml").stat().st_size
@@ -1,9 +1,80 @@
+import hashlib
 import logging
 import pathlib
+from typing import List
 
 import pytest
 
-from rrdp_tools.reconstruct import reconstruct_repo
+import rrdp_tools.reconstruct
+from rrdp_tools.reconstruct import (
+    plan_chain,
+    reconstruct_repo,
+    reconstruct_serial,
+    scan_documents,
+)
+from rrdp_tools.repository_index import (
+    INDEX_DIR_NAME,
+    RepositoryIndex,
+    verify_index,
+)
+from rrdp_tools.rrdp import (
+    DeltaDocument,
+    PublishElement,
+    RrdpElement,
+    SnapshotDocument,
+    WithdrawElement,
+)
+
+SESSION_ID = "9df4b597-af9e-4dca-bdda-719cce2c4e28"
+
+
+def sha256(content: bytes) -> str:
+    return hashlib.sha256(content).hexdigest()
+
+
+def uri(name: str) -> str:
+    return f"rsync://rpki.example.org/repo/{name}"
+
+
+def write_delta(
+    path: pathlib.Path, serial: int, elements: List[RrdpElement], session_id=SESSION_ID
+) -> None:
+    with (path / f"{serial}.xml").open("wb") as f:
+        DeltaDocument(serial, session_id, elements).write_to(f)
+
+
+@pytest.fixture
+def archive(tmp_path: pathlib.Path) -> pathlib.Path:
+    """A snapshot at serial 1 followed by deltas 2-4."""
+    path = tmp_path / "archive"
+    path.mkdir()
+    with (path / "snapshot-1.xml").open("wb") as f:
+        SnapshotDocument(
+            1,
+            SESSION_ID,
+            [
+                PublishElement(uri("a.roa"), None, b"a1"),
+                PublishElement(uri("b.roa"), None, b"b1"),
+            ],
+        ).write_to(f)
+    write_delta(
+        path,
+        2,
+        [
+            PublishElement(uri("a.roa"), sha256(b"a1"), b"a2"),
+            PublishElement(uri("tmp.roa"), None, b"tmp"),
+        ],
+    )
+    write_delta(path, 3, [WithdrawElement(uri("tmp.roa"), sha256(b"tmp"))])
+    write_delta(
+        path,
+        4,
+        [
+            WithdrawElement(uri("b.roa"), sha256(b"b1")),
+            PublishElement(uri("c.roa"), None, b"c4"),
+        ],
+    )
+    return path
 
 
 def test_reconstruct(tmp_path: pathlib.Path, caplog: pytest.LogCaptureFixture) -> None:
@@ -32,6 +103,172 @@ def test_reconstruct_filter(
     # reconstruct the snapshot
     reconstruct_repo(snapshot_path.open("r"), tmp_path, [".*\\.cer"])
 
-    # there are no certificates -> no files in the directory
-    files = list(tmp_path.rglob("*"))
+    # there are no certificates -> no files in the directory (only the index)
+    files = [p for p in tmp_path.iterdir() if p.name != INDEX_DIR_NAME]
     assert len(files) == 0
+
+
+def test_reconstruct_serial(archive: pathlib.Path, tmp_path: pathlib.Path) -> None:
+    output = tmp_path / "output"
+    output.mkdir()
+
+    written = []
+    write_object = rrdp_tools.reconstruct.write_object
+
+    def record_write(file_path, *args, **kwargs) -> None:
+        written.append(file_path.name)
+        write_object(file_path, *args, **kwargs)
+
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        monkeypatch.setattr(rrdp_tools.reconstruct, "write_object", record_write)
+        reconstruct_serial(archive, 4, output, [])
+
+    repo = output / "repo"
+    assert {p.name: p.read_bytes() for p in repo.iterdir()} == {
+        "a.roa": b"a2",
+        "c.roa": b"c4",
+    }
+    # Only the net result is written
+    assert sorted(written) == ["a.roa", "c.roa"]
+
+    state = reconstruct_serial(archive, 2, output, [], verify_only=True)
+    assert {u: e.content for u, e in state.items()} == {
+        uri("a.roa"): b"a2",
+        uri("b.roa"): b"b1",
+        uri("tmp.roa"): b"tmp",
+    }
+
+
+def test_reconstruct_serial_hash_mismatch(
+    archive: pathlib.Path, caplog: pytest.LogCaptureFixture
+) -> None:
+    write_delta(archive, 5, [WithdrawElement(uri("a.roa"), sha256(b"a1"))])
+
+    state = reconstruct_serial(archive, 5, archive, [], verify_only=True)
+    assert uri("a.roa") not in state
+    assert "Hash mismatch for rsync://rpki.example.org/repo/a.roa" in caplog.text
+
+
+def test_plan_chain(archive: pathlib.Path) -> None:
+    documents = scan_documents(archive)
+    assert [d.path.name for d in plan_chain(documents, 3)] == [
+        "snapshot-1.xml",
+        "2.xml",
+        "3.xml",
+    ]
+
+    with pytest.raises(ValueError, match="No snapshot"):
+        plan_chain(documents, 0)
+    with pytest.raises(ValueError, match="delta 5 after snapshot-1.xml is missing"):
+        plan_chain(documents, 5)
+
+    # A delta from another session does not continue the chain
+    other_session = "0f8ec2e6-5e2a-4b0c-9c4a-7f4f3e0b8f5d"
+    write_delta(
+        archive, 5, [PublishElement(uri("d.roa"), None, b"d")], session_id=other_session
+    )
+    with pytest.raises(ValueError, match=f"is in session {other_session}"):
+        plan_chain(scan_documents(archive), 5)
+
+    (archive / "3.xml").unlink()
+    with pytest.raises(ValueError, match="delta 3 after snapshot-1.xml is missing"):
+        plan_chain(scan_documents(archive), 4)
+
+
+def test_reconstruct_index(
+    archive: pathlib.Path, tmp_path: pathlib.Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    output = tmp_path / "output"
+    output.mkdir()
+
+    reconstruct_repo(archive / "snapshot-1.xml", output, [])
+    # The hashes in the deltas are checked against the index
+    monkeypatch.setattr(rrdp_tools.reconstruct, "hash_file", None)
+    for serial in (2, 3, 4):
+        reconstruct_repo(archive / f"{serial}.xml", output, [])
+
+    with RepositoryIndex(output) as index:
+        assert (index.session_id, index.serial) == (SESSION_ID, 4)
+        assert dict(index.items()) == {
+            uri("a.roa"): (sha256(b"a2"), 2),
+            uri("c.roa"): (sha256(b"c4"), 2),
+        }
+
+    report = verify_index(output)
+    assert report.consistent
+    assert report.objects == 2
+
+    (output / "repo/a.roa").write_bytes(b"changed")
+    (output / "repo/c.roa").unlink()
+    (output / "repo/untracked.roa").write_bytes(b"")
+    report = verify_index(output)
+    assert not report.consistent
+    assert report.changed == [uri("a.roa")]
+    assert report.missing == [uri("c.roa")]
+    assert report.untracked == [output / "repo/untracked.roa"]
+
+
+def test_verify_index_hashes(archive: pathlib.Path, tmp_path: pathlib.Path) -> None:
+    output = tmp_path / "output"
+    output.mkdir()
+    reconstruct_serial(archive, 4, output, [])
+    # Same size, other content
+    (output / "repo/a.roa").write_bytes(b"xx")
+
+    assert verify_index(output).consistent
+    assert verify_index(output, check_hashes=True).changed == [uri("a.roa")]
+
+
+def test_reconstruct_serial_removes_stale(
+    archive: pathlib.Path, tmp_path: pathlib.Path
+) -> None:
+    output = tmp_path / "output"
+    output.mkdir()
+
+    reconstruct_serial(archive, 2, output, [])
+    # Withdrawn in delta 3 and 4: removed from the tree and the index
+    reconstruct_serial(archive, 4, output, [])
+
+    assert {p.name for p in (output / "repo").iterdir()} == {"a.roa", "c.roa"}
+    with RepositoryIndex(output) as index:
+        assert set(dict(index.items())) == {uri("a.roa"), uri("c.roa")}
+    report = verify_index(output)
+    assert report.consistent
+    assert report.objects == 2
+
+
+def test_reconstruct_snapshot_replaces_index(
+    archive: pathlib.Path, tmp_path: pathlib.Path, caplog: pytest.LogCaptureFixture
+) -> None:
+    output = tmp_path / "output"
+    output.mkdir()
+    reconstruct_serial(archive, 4, output, [])
+
+    snapshot = tmp_path / "snapshot-5.xml"
+    with snapshot.open("wb") as f:
+        SnapshotDocument(
+            5,
+            SESSION_ID,
+            [
+                PublishElement(uri("a.roa"), None, b"a2"),
+                PublishElement(uri("d.roa"), None, b"d5"),
+            ],
+        ).write_to(f)
+
+    # Verify mode reports the objects that are not in the snapshot
+    reconstruct_repo(snapshot, output, [], verify_only=True)
+    assert f"{uri('c.roa')} is in the index, but not present" in caplog.text
+    assert (output / "repo/c.roa").exists()
+
+    reconstruct_repo(snapshot, output, [])
+    assert {p.name for p in (output / "repo").iterdir()} == {"a.roa", "d.roa"}
+    report = verify_index(output)
+    assert report.consistent
+    assert (report.session_id, report.serial, report.objects) == (SESSION_ID, 5, 2)
+
+    # A delta from another session does not continue the serial of the tree
+    other_session = "0f8ec2e6-5e2a-4b0c-9c4a-7f4f3e0b8f5d"
+    write_delta(tmp_path, 6, [PublishElement(uri("e.roa"), None, b"e")], other_session)
+    reconstruct_repo(tmp_path / "6.xml", output, [])
+    with RepositoryIndex(output) as index:
+        assert (index.session_id, index.serial) == (None, None)
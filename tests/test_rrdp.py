@@ -1,10 +1,36 @@
+import base64
+import dataclasses
+import hashlib
+import io
 import logging
 import pathlib
+import time
+from typing import Callable
 from xml.etree import ElementTree as ET
 
 import pytest
+import rnc2rng
+from lxml import etree
 
-from rrdp_tools.rrdp import NS_RRDP, parse_notification_file, parse_snapshot_or_delta
+import rrdp_tools.rrdp
+from rrdp_tools.rrdp import (
+    NS_RRDP,
+    SCHEMA_RNC,
+    SCHEMA_RNG,
+    DeltaElement,
+    DocumentHeader,
+    NotificationDiff,
+    NotificationDocument,
+    PublishElement,
+    SnapshotDocument,
+    UnexpectedDocumentException,
+    WithdrawElement,
+    decode_in_parallel,
+    iter_snapshot_or_delta,
+    parse_notification_file,
+    parse_snapshot_or_delta,
+)
+from rrdp_tools.uri_filter import UriFilter
 
 
 def test_parse_and_serialise_delta(
@@ -47,3 +73,231 @@ def test_parse_and_serialise_notification(
         assert ET.tostring(doc.to_xml(), default_namespace=NS_RRDP).decode(
             "utf-8"
         ) == str(doc)
+
+
+@pytest.mark.parametrize(
+    "document", ["data/sample-snapshot.xml", "data/rrdp-content/26293.xml"]
+)
+def test_iter_snapshot_or_delta(document: str) -> None:
+    path = pathlib.Path(__file__).parent / document
+
+    doc = parse_snapshot_or_delta(path)
+    with path.open("rb") as f:
+        header, *elements = iter_snapshot_or_delta(f)
+
+    assert header == DocumentHeader(
+        document_type=doc.to_xml().tag.split("}")[1],
+        serial=doc.serial,
+        session_id=doc.session_id,
+    )
+    assert elements == doc.content
+
+
+@pytest.mark.parametrize("strict_full_validation", [False, True])
+def test_iter_snapshot_or_delta_uri_filter(
+    strict_full_validation: bool, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    path = pathlib.Path(__file__).parent / "data/sample-snapshot.xml"
+    doc = parse_snapshot_or_delta(path)
+
+    parsed = []
+    parse_rrdp_element = rrdp_tools.rrdp.parse_rrdp_element
+
+    def record(elem):
+        parsed.append(elem.get("uri"))
+        return parse_rrdp_element(elem)
+
+    monkeypatch.setattr(rrdp_tools.rrdp, "parse_rrdp_element", record)
+
+    header, *elements = iter_snapshot_or_delta(
+        path,
+        strict_full_validation=strict_full_validation,
+        uri_filter=UriFilter(extensions=["mft"]),
+    )
+    assert header.serial == doc.serial
+    assert elements == [e for e in doc.content if e.uri.endswith(".mft")]
+    assert len(elements) == 1
+    if not strict_full_validation:
+        # Other elements are not parsed
+        assert parsed == [elements[0].uri]
+
+
+def test_iter_snapshot_or_delta_uri_filter_scan_time() -> None:
+    """Skipping every object costs little more than scanning the XML."""
+    output = io.BytesIO()
+    SnapshotDocument(
+        1,
+        "9df4b597-af9e-4dca-bdda-719cce2c4e28",
+        [
+            PublishElement(f"rsync://example.org/repo/{i}.cer", None, bytes(100_000))
+            for i in range(100)
+        ],
+    ).write_to(output)
+    document = output.getvalue()
+
+    def scan() -> None:
+        for _, elem in etree.iterparse(io.BytesIO(document), huge_tree=True):
+            elem.clear()
+
+    def filtered() -> None:
+        uri_filter = UriFilter(prefixes=["rsync://example.net/"])
+        assert (
+            len(
+                list(
+                    iter_snapshot_or_delta(io.BytesIO(document), uri_filter=uri_filter)
+                )
+            )
+            == 1
+        )
+
+    def best_of_three(f: Callable[[], None]) -> float:
+        timings = []
+        for _ in range(3):
+            start = time.perf_counter()
+            f()
+            timings.append(time.perf_counter() - start)
+        return min(timings)
+
+    assert best_of_three(filtered) < 2 * best_of_three(scan) + 0.01
+
+
+def test_iter_snapshot_or_delta_notification() -> None:
+    notification_path = (
+        pathlib.Path(__file__).parent / "data/rrdp-content/notification.xml"
+    )
+
+    with pytest.raises(UnexpectedDocumentException):
+        next(iter_snapshot_or_delta(notification_path))
+
+
+def test_publish_element_lazy_content() -> None:
+    content = (pathlib.Path(__file__).parent / "data/ripe-ncc-ta.cer").read_bytes()
+    encoded = base64.encodebytes(content).decode("ascii")
+
+    lazy = PublishElement("rsync://example.org/ta.cer", None, content_b64=encoded)
+    eager = PublishElement("rsync://example.org/ta.cer", None, content)
+
+    assert lazy.content == content
+    assert lazy.digest == hashlib.sha256(content).digest()
+    assert lazy.h_content == hashlib.sha256(content).hexdigest()
+    assert lazy == eager
+    assert hash(lazy) == hash(eager)
+
+    assert PublishElement("rsync://example.org/empty", None).content == b""
+
+
+def test_element_as_dict() -> None:
+    publish = PublishElement("rsync://example.org/a.cer", "ab", b"ABC")
+    withdraw = WithdrawElement("rsync://example.org/b.cer", "cd")
+
+    assert publish.as_dict() == {
+        "uri": "rsync://example.org/a.cer",
+        "previous_hash": "ab",
+        "content": b"ABC",
+        "h_content": hashlib.sha256(b"ABC").hexdigest(),
+    }
+    assert withdraw.as_dict() == dataclasses.asdict(withdraw)
+
+
+@pytest.mark.parametrize("batch_size", [1, 7, 256])
+def test_decode_in_parallel(batch_size: int) -> None:
+    snapshot_path = pathlib.Path(__file__).parent / "data/sample-snapshot.xml"
+
+    elements = list(parse_snapshot_or_delta(snapshot_path).content)
+    decoded = list(decode_in_parallel(iter(elements), 4, batch_size=batch_size))
+
+    # Order is preserved and the digests have been computed by the workers
+    assert [elem.uri for elem in decoded] == [elem.uri for elem in elements]
+    assert all(elem._digest is not None for elem in decoded)
+
+    assert parse_snapshot_or_delta(snapshot_path, workers=4).content == elements
+    with snapshot_path.open("rb") as f:
+        assert list(iter_snapshot_or_delta(f, workers=4))[1:] == elements
+
+
+@pytest.mark.parametrize(
+    "document", ["data/sample-snapshot.xml", "data/rrdp-content/26293.xml"]
+)
+def test_write_to(document: str, monkeypatch: pytest.MonkeyPatch) -> None:
+    # Force content to be encoded in multiple chunks
+    monkeypatch.setattr(rrdp_tools.rrdp, "ENCODE_CHUNK_SIZE", 3 * 16)
+    doc = parse_snapshot_or_delta(pathlib.Path(__file__).parent / document)
+
+    output = io.BytesIO()
+    digest = doc.write_to(output)
+
+    assert digest == hashlib.sha256(output.getvalue()).hexdigest()
+
+    output.seek(0)
+    assert parse_snapshot_or_delta(output) == doc
+
+
+def notification_sample() -> NotificationDocument:
+    notification_path = (
+        pathlib.Path(__file__).parent / "data/rrdp-content/notification.xml"
+    )
+    with notification_path.open("r") as f:
+        return parse_notification_file(f.read())
+
+
+def test_notification_index() -> None:
+    doc = notification_sample()
+
+    assert list(doc.serials) == sorted(delta.serial for delta in doc.deltas)
+    assert doc.serials[-1] == doc.serial
+    assert doc.has_delta(doc.serial)
+    assert not doc.has_delta(doc.serial + 1)
+    assert doc.get_delta(doc.serial).uri.endswith(f"/{doc.serial}/delta.xml")
+
+    assert [delta.serial for delta in doc.deltas_since(doc.serial - 3)] == [
+        doc.serial - 2,
+        doc.serial - 1,
+        doc.serial,
+    ]
+    assert doc.deltas_since(doc.serial) == []
+
+
+def test_notification_diff() -> None:
+    current = notification_sample()
+    by_serial = sorted(current.deltas, key=lambda delta: delta.serial)
+
+    # The previous notification lists one delta more at the start, and lacks
+    # the two most recent deltas.
+    dropped = DeltaElement(serial=by_serial[0].serial - 1, hash="00", uri="x")
+    changed = dataclasses.replace(by_serial[5], hash="ff")
+    previous = NotificationDocument(
+        snapshot=current.snapshot,
+        deltas=[dropped, *by_serial[:5], changed, *by_serial[6:-2]],
+        serial=current.serial - 2,
+        session_id=current.session_id,
+    )
+
+    diff = current.diff(previous)
+    assert not diff.session_reset
+    assert diff.new_deltas == by_serial[-2:]
+    assert diff.dropped_deltas == [dropped]
+    # Only the most recent common delta is checked by default
+    assert diff.hash_changes == []
+    assert current.diff(previous, check_all_hashes=True).hash_changes == [
+        (changed, by_serial[5])
+    ]
+
+    latest = dataclasses.replace(by_serial[-3], hash="ff")
+    previous.deltas[-1] = latest
+    previous = dataclasses.replace(previous)
+    assert current.diff(previous).hash_changes == [(latest, by_serial[-3])]
+
+    assert current.diff(current) == NotificationDiff(
+        new_deltas=[], dropped_deltas=[], session_reset=False, hash_changes=[]
+    )
+
+    reset = dataclasses.replace(previous, session_id="00000000")
+    diff = current.diff(reset)
+    assert diff.session_reset
+    assert diff.new_deltas == by_serial
+
+
+def test_precompiled_schema() -> None:
+    compiled = rnc2rng.dumps(rnc2rng.loads(SCHEMA_RNC))
+
+    assert SCHEMA_RNG.read_text().strip() == compiled.strip()
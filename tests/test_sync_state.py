@@ -0,0 +1,67 @@
+import pathlib
+
+import pytest
+
+import rrdp_tools.planner
+from rrdp_tools.snapshot_rrdp import snapshot_rrdp
+from rrdp_tools.sync_state import STATE_FILE_NAME, SyncState
+
+
+@pytest.mark.asyncio
+async def test_incremental_snapshot_rrdp(
+    rrdp_server, tmp_path: pathlib.Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    repository = rrdp_server.repository
+    # The documents are tiny: only compare their size
+    monkeypatch.setattr(rrdp_tools.planner, "REQUEST_COST", 0)
+
+    await snapshot_rrdp(rrdp_server.url, tmp_path, incremental=True)
+
+    state = SyncState.load(tmp_path)
+    assert state.session_id == repository.session_id
+    assert state.serial == 5
+    assert set(state.files) == {
+        "snapshot-5.xml",
+        *(f"{serial}.xml" for serial in range(1, 6)),
+    }
+    assert sum(rrdp_server.requests.values()) == 7
+
+    # Nothing changed: the output directory is not touched
+    mtimes = {p.name: p.stat().st_mtime_ns for p in tmp_path.iterdir()}
+    rrdp_server.requests.clear()
+    await snapshot_rrdp(rrdp_server.url, tmp_path, incremental=True)
+    assert {p.name: p.stat().st_mtime_ns for p in tmp_path.iterdir()} == mtimes
+    assert list(rrdp_server.requests) == ["/notification.xml"]
+
+    # Only the new deltas are downloaded
+    repository.add_delta()
+    repository.add_delta()
+    rrdp_server.requests.clear()
+    await snapshot_rrdp(rrdp_server.url, tmp_path, incremental=True)
+    assert set(rrdp_server.requests) == {
+        "/notification.xml",
+        f"/{repository.session_id}/6/delta.xml",
+        f"/{repository.session_id}/7/delta.xml",
+    }
+    assert SyncState.load(tmp_path).serial == 7
+
+    # After a session reset, the snapshot is downloaded again
+    repository.reset_session()
+    repository.add_delta()
+    rrdp_server.requests.clear()
+    await snapshot_rrdp(rrdp_server.url, tmp_path, incremental=True)
+    assert f"/{repository.session_id}/1/snapshot.xml" in rrdp_server.requests
+
+    state = SyncState.load(tmp_path)
+    assert state.session_id == repository.session_id
+    assert set(state.files) == {"snapshot-1.xml", "1.xml"}
+
+
+def test_invalid_state_file(tmp_path: pathlib.Path) -> None:
+    assert SyncState.load(tmp_path) is None
+
+    (tmp_path / STATE_FILE_NAME).write_text("{")
+    assert SyncState.load(tmp_path) is None
+
+    SyncState("session", 1, {"1.xml": "00"}).save(tmp_path)
+    assert SyncState.load(tmp_path) == SyncState("session", 1, {"1.xml": "00"})
@@ -0,0 +1,84 @@
+import re
+from typing import Optional
+
+import pytest
+
+from rrdp_tools.uri_filter import PrefixTrie, UriFilter, literal_prefix
+
+CA = "rsync://rpki.example.org/repo/ca"
+
+
+@pytest.mark.parametrize(
+    "pattern,anchored,prefix",
+    [
+        (r"^rsync://rpki\.example\.org/repo/", False, "rsync://rpki.example.org/repo/"),
+        ("rsync://rpki.example.org/", False, None),
+        (r"rsync://rpki\.example\.org/", True, "rsync://rpki.example.org/"),
+        (r"^rsync://rpki\.example\.org/.*\.mft", False, None),
+        (r"^rsync://rpki\.example\.org/\d", False, None),
+    ],
+)
+def test_literal_prefix(pattern: str, anchored: bool, prefix: Optional[str]) -> None:
+    assert literal_prefix(pattern, anchored) == prefix
+
+
+def test_prefix_trie() -> None:
+    trie = PrefixTrie([f"{CA}/", f"{CA}-2/", "rsync://other.example.org/re"])
+
+    assert trie.matches(f"{CA}/a.roa")
+    assert trie.matches(f"{CA}-2/sub/a.roa")
+    assert trie.matches("rsync://other.example.org/repo/a.roa")
+    assert not trie.matches(CA)
+    assert not trie.matches(f"{CA}-3/a.roa")
+    assert not trie.matches("rsync://rpki.example.org/a.roa")
+    assert not PrefixTrie().matches(CA)
+
+
+URIS = [
+    f"{CA}/a.roa",
+    f"{CA}/a.mft",
+    f"{CA}/sub/b.cer",
+    f"{CA}-2/c.mft",
+    "rsync://other.example.org/repo/d.roa",
+    "rsync://other.example.org/repo/d.ROA",
+]
+
+
+@pytest.mark.parametrize(
+    "patterns",
+    [
+        [],
+        [r"\.mft$"],
+        [r"\.mft$", r"^rsync://other\.example\.org/"],
+        [r"^rsync://rpki\.example\.org/repo/ca/", "sub"],
+        [re.compile(r"\.roa$", re.IGNORECASE), r"\.cer$"],
+        ["(?i)ROA$", r"\.cer$"],
+    ],
+)
+@pytest.mark.parametrize("anchored", [False, True])
+def test_uri_filter_patterns(patterns, anchored: bool) -> None:
+    """Same result as matching the patterns one by one."""
+    uri_filter = UriFilter(patterns, anchored=anchored)
+    compiled = [re.compile(p) for p in patterns]
+
+    for uri in URIS:
+        if not compiled:
+            expected = True
+        elif anchored:
+            expected = any(p.match(uri) for p in compiled)
+        else:
+            expected = any(p.search(uri) for p in compiled)
+        assert uri_filter(uri) == expected, uri
+
+    assert uri_filter.accepts_all == (not patterns)
+
+
+def test_uri_filter_kinds() -> None:
+    uri_filter = UriFilter(prefixes=[f"{CA}/"], extensions=[".mft", "cer"])
+    assert [uri for uri in URIS if uri_filter(uri)] == [
+        f"{CA}/a.mft",
+        f"{CA}/sub/b.cer",
+    ]
+
+    uri_filter = UriFilter(["sub"], prefixes=[f"{CA}/"])
+    assert [uri for uri in URIS if uri_filter(uri)] == [f"{CA}/sub/b.cer"]
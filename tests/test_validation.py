@@ -0,0 +1,117 @@
+import io
+import pathlib
+
+import pytest
+from lxml import etree
+
+import rrdp_tools.rrdp
+from rrdp_tools.rrdp import ValidationException, iter_snapshot_or_delta, validate
+
+NS = 'xmlns="http://www.ripe.net/rpki/rrdp"'
+SESSION = 'session_id="f62e1519-f2e4-4d57-80bc-56c3699ba88e"'
+DELTA = f'<delta {NS} version="1" {SESSION} serial="3">{{}}</delta>'
+SNAPSHOT = f'<snapshot {NS} version="1" {SESSION} serial="3">{{}}</snapshot>'
+
+CORPUS = {
+    "delta": DELTA.format(
+        '<publish uri="rsync://a/b.cer">QUJD</publish>'
+        '<withdraw uri="rsync://a/c.cer" hash="ab"/>'
+    ),
+    "whitespace": DELTA.format(
+        '\n  <publish uri="a" hash="AB">\n QUJD\n RA==  </publish>\n'
+        ' <withdraw uri="b" hash="ab">  </withdraw>\n'
+    ),
+    "comment": DELTA.format('<!-- c --><withdraw uri="a" hash="ab"/>'),
+    "empty-snapshot": SNAPSHOT.format(""),
+    "empty-publish": SNAPSHOT.format('<publish uri="a"></publish>'),
+    "version-plus": f'<delta {NS} version="+1" {SESSION} serial="3"><publish uri="a"/></delta>',
+    "version-2": f'<delta {NS} version="2" {SESSION} serial="3"><publish uri="a"/></delta>',
+    "serial-0": f'<delta {NS} version="1" {SESSION} serial="0"><publish uri="a"/></delta>',
+    "session-id": f'<delta {NS} version="1" session_id="xyz" serial="3"><publish uri="a"/></delta>',
+    "missing-session-id": f'<delta {NS} version="1" serial="3"><publish uri="a"/></delta>',
+    "extra-attribute": f'<delta {NS} version="1" {SESSION} serial="3" x="y"><publish uri="a"/></delta>',
+    "no-namespace": f'<delta version="1" {SESSION} serial="3"><publish uri="a"/></delta>',
+    "empty-delta": DELTA.format(""),
+    "base64-length": DELTA.format('<publish uri="a">QUJ</publish>'),
+    "base64-alphabet": DELTA.format('<publish uri="a">QU*D</publish>'),
+    "base64-padding": DELTA.format('<publish uri="a">QQ==QUJD</publish>'),
+    "base64-non-canonical": DELTA.format('<publish uri="a">QR==</publish>'),
+    "base64-whitespace": DELTA.format(
+        '<publish uri="a">\tQU\r\nJD RA\n=\n= </publish>'
+    ),
+    "base64-only-padding": DELTA.format('<publish uri="a">==</publish>'),
+    "base64-whitespace-length": DELTA.format('<publish uri="a">QU JD\nR</publish>'),
+    "withdraw-without-hash": DELTA.format('<withdraw uri="a"/>'),
+    "withdraw-content": DELTA.format('<withdraw uri="a" hash="ab">QUJD</withdraw>'),
+    "hash-pattern": DELTA.format('<withdraw uri="a" hash="xyz"/>'),
+    "snapshot-withdraw": SNAPSHOT.format('<withdraw uri="a" hash="ab"/>'),
+    "snapshot-publish-hash": SNAPSHOT.format(
+        '<publish uri="a" hash="ab">QUJD</publish>'
+    ),
+    "nested-element": DELTA.format('<publish uri="a"><publish uri="b"/></publish>'),
+    "foreign-element": DELTA.format('<x:publish xmlns:x="urn:x" uri="a"/>'),
+    "text-in-root": DELTA.format('x<withdraw uri="a" hash="ab"/>'),
+    "trailing-text": DELTA.format('<withdraw uri="a" hash="ab"/>x'),
+}
+
+
+def full_validation(document: bytes) -> bool:
+    try:
+        validate(etree.fromstring(document))
+        return True
+    except ValidationException:
+        return False
+
+
+def streaming_validation(document: bytes) -> bool:
+    try:
+        list(iter_snapshot_or_delta(io.BytesIO(document)))
+        return True
+    except ValidationException:
+        return False
+
+
+@pytest.mark.parametrize("chunk_size", [7, 64 * 1024])
+@pytest.mark.parametrize("name", CORPUS.keys())
+def test_differential_validation(
+    name: str, chunk_size: int, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setattr(rrdp_tools.rrdp, "READ_CHUNK_SIZE", chunk_size)
+    document = CORPUS[name].encode("utf-8")
+
+    assert streaming_validation(document) == full_validation(document)
+
+
+@pytest.mark.parametrize(
+    "document",
+    [
+        "data/sample-snapshot.xml",
+        *(f"data/rrdp-content/{serial}.xml" for serial in range(26290, 26299)),
+    ],
+)
+def test_differential_validation_sample_files(document: str) -> None:
+    content = (pathlib.Path(__file__).parent / document).read_bytes()
+
+    assert full_validation(content)
+    assert streaming_validation(content)
+
+
+def test_validation_exception_location() -> None:
+    document = DELTA.format('\n<withdraw uri="a"/>').encode("utf-8")
+
+    with pytest.raises(ValidationException) as e:
+        list(iter_snapshot_or_delta(io.BytesIO(document)))
+
+    assert e.value.line == 2
+    assert e.value.bytes_read == len(document)
+
+
+def test_validation_exception_location_text() -> None:
+    """Text streams report the number of (UTF-8) bytes, not characters."""
+    document = DELTA.format('\n<withdraw uri="rsync://a/\u00e9.cer"/>')
+
+    with pytest.raises(ValidationException) as e:
+        list(iter_snapshot_or_delta(io.StringIO(document)))
+
+    assert e.value.line == 2
+    assert e.value.bytes_read == len(document.encode("utf-8")) == len(document) + 1
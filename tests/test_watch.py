@@ -0,0 +1,100 @@
+import asyncio
+import pathlib
+
+import aiohttp
+import pytest
+
+from rrdp_tools.local_server import ServerConfig, SyntheticRepository, serve
+from rrdp_tools.snapshot_rrdp import fetch_notification, watch_rrdp
+from rrdp_tools.sync_state import SyncState
+
+
+@pytest.mark.asyncio
+async def test_fetch_notification_conditional(rrdp_server) -> None:
+    async with aiohttp.ClientSession() as session:
+        fetch = await fetch_notification(session, rrdp_server.url)
+        assert fetch.notification.serial == 5
+        assert fetch.etag
+
+        # ETag matches: the server responds with 304
+        assert await fetch_notification(session, rrdp_server.url, fetch) is None
+
+        # Server without validators: the body is compared by hash
+        fetch.etag = None
+        assert await fetch_notification(session, rrdp_server.url, fetch) is None
+
+        rrdp_server.repository.add_delta()
+        new_fetch = await fetch_notification(session, rrdp_server.url, fetch)
+        assert new_fetch.notification.serial == 6
+
+
+@pytest.mark.asyncio
+async def test_watch_rrdp(rrdp_server, tmp_path: pathlib.Path) -> None:
+    repository = rrdp_server.repository
+
+    async def add_delta_after_first_sync() -> None:
+        while SyncState.load(tmp_path) is None:
+            await asyncio.sleep(0.01)
+        repository.add_delta()
+
+    await asyncio.gather(
+        watch_rrdp(rrdp_server.url, tmp_path, interval=0.1, polls=4),
+        add_delta_after_first_sync(),
+    )
+
+    assert rrdp_server.requests["/notification.xml"] == 4
+    # The snapshot is only downloaded once, the new delta incrementally
+    assert sum(path.endswith("snapshot.xml") for path in rrdp_server.requests) == 1
+    assert rrdp_server.requests[f"/{repository.session_id}/6/delta.xml"] == 1
+
+    state = SyncState.load(tmp_path)
+    assert state.serial == 6
+    assert "6.xml" in state.files
+
+
+@pytest.mark.asyncio
+async def test_watch_rrdp_sync_error(rrdp_server, tmp_path: pathlib.Path) -> None:
+    rrdp_server.config.error_rate = 1.0
+
+    async def recover_after_first_error() -> None:
+        while set(rrdp_server.requests) <= {"/notification.xml"}:
+            await asyncio.sleep(0.01)
+        rrdp_server.config.error_rate = 0.0
+
+    # The failed sync does not stop watching, and is retried
+    await asyncio.gather(
+        watch_rrdp(rrdp_server.url, tmp_path, interval=0.1, polls=3),
+        recover_after_first_error(),
+    )
+
+    assert rrdp_server.requests["/notification.xml"] == 3
+    state = SyncState.load(tmp_path)
+    assert state.serial == 5
+
+
+@pytest.mark.asyncio
+async def test_watch_rrdp_failed_download_cancels_others(
+    tmp_path: pathlib.Path,
+) -> None:
+    repository = SyntheticRepository(object_size=200_000)
+    for _ in range(5):
+        repository.add_delta()
+    # Delta 2 fails (hash mismatch) long before the snapshot is transferred
+    path = f"/{repository.session_id}/2/delta.xml"
+    repository.documents[path] = repository.documents[path].replace(b"<", b" <", 1)
+
+    async with serve(repository, ServerConfig(bandwidth=1_000_000)) as server:
+        await watch_rrdp(server.url, tmp_path, interval=0.1, threads=8, polls=1)
+
+        # No download is left running after the failed sync
+        assert not [
+            task
+            for task in asyncio.all_tasks()
+            if task.get_coro().__qualname__ == "get_and_check"
+        ]
+        part_files = {path: path.stat().st_size for path in tmp_path.glob("*.part")}
+        assert part_files
+        await asyncio.sleep(0.3)
+        assert {path: path.stat().st_size for path in part_files} == part_files
+
+    assert SyncState.load(tmp_path) is None
@@ -0,0 +1,89 @@
+import pathlib
+
+import pytest
+
+import rrdp_tools.timestamps
+from rrdp_tools.timestamps import TimestampStage
+from rrdp_tools.writer import FileWriter
+
+
+@pytest.mark.parametrize("workers", [0, 1, 4])
+def test_file_writer(tmp_path: pathlib.Path, workers: int) -> None:
+    with FileWriter(workers, queue_size=2) as writer:
+        for i in range(64):
+            directory = tmp_path / f"dir-{i % 4}"
+            # Operations on a path are applied in order
+            writer.write(directory / f"{i}.cer", b"first")
+            writer.write(directory / f"{i}.cer", f"{i}".encode())
+            if i % 2:
+                writer.unlink(directory / f"{i}.cer")
+
+    assert {p.relative_to(tmp_path) for p in tmp_path.glob("*/*")} == {
+        pathlib.Path(f"dir-{i % 4}/{i}.cer") for i in range(0, 64, 2)
+    }
+    for i in range(0, 64, 2):
+        assert (tmp_path / f"dir-{i % 4}/{i}.cer").read_bytes() == f"{i}".encode()
+
+    assert writer.files_written == 128
+    assert writer.files_removed == 32
+    assert writer.directories_created == 4
+
+
+def test_file_writer_error(tmp_path: pathlib.Path) -> None:
+    (tmp_path / "file").write_bytes(b"")
+
+    writer = FileWriter(2)
+    # The parent is a file
+    writer.write(tmp_path / "file" / "a.cer", b"content")
+    with pytest.raises(OSError):
+        writer.close()
+
+
+SIGNED_OBJECTS = (
+    "FnzdKKjxPmamPX_NCy-vbob58nw.roa",
+    "NKcuY5DvQmG0vwsI6MT4nqcBcoI.gbr",
+    "ripe-ncc-ta.cer",
+    "ripe-ncc-ta.crl",
+    "ripe-ncc-ta.mft",
+)
+
+
+def test_file_writer_time_processes(tmp_path: pathlib.Path) -> None:
+    data = pathlib.Path(__file__).parent / "data"
+
+    mtimes = {}
+    for time_processes in (0, 2):
+        output = tmp_path / str(time_processes)
+        with FileWriter(2, time_processes=time_processes) as writer:
+            if writer._timestamps is not None:
+                # Several batches
+                writer._timestamps.batch_size = 2
+            for name in SIGNED_OBJECTS:
+                writer.write(output / name, (data / name).read_bytes(), True)
+            # Withdrawn before its time is set
+            writer.write(
+                output / "withdrawn.cer", (data / "ripe-ncc-ta.cer").read_bytes(), True
+            )
+            writer.unlink(output / "withdrawn.cer")
+
+        mtimes[time_processes] = {
+            p.name: p.stat().st_mtime_ns for p in output.iterdir()
+        }
+
+    assert set(mtimes[2]) == set(SIGNED_OBJECTS)
+    assert mtimes[2] == mtimes[0]
+
+
+def test_timestamp_stage_small(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Less than a batch is parsed without starting processes."""
+    monkeypatch.setattr(rrdp_tools.timestamps, "ProcessPoolExecutor", None)
+    data = pathlib.Path(__file__).parent / "data"
+    applied = []
+
+    stage = TimestampStage(lambda path, timestamp: applied.append(path), batch_size=8)
+    for name in SIGNED_OBJECTS:
+        stage.submit(data / name, (data / name).read_bytes())
+    stage.close()
+
+    assert stage.batches == 0
+    assert applied == [data / name for name in SIGNED_OBJECTS]